@@ -94,9 +94,7 @@ def generator_exp2():
             }
         )
 
-    json_data = json.dumps(data)
-
     with open('Exp2_Zoethout_auto.json', 'w') as outfile:
-        json.dump(json_data, outfile)
+        json.dump(data, outfile, indent = 2)
 
 generator_exp2()
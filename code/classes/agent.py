@@ -2,10 +2,15 @@ import math
 import numpy as np
 import my_parameters as P
 
+from skill import LazySkillStore, SkillArrays
+from history import History, KeyedHistory, RecordHistory
+
 
 class Agent:
-    def __init__(self, _id, mbti = None, initial_frustration = None, skillset = [], verbose = False):
+    def __init__(self, _id, mbti = None, initial_frustration = None, skillset = [], verbose = False,
+                 params = P.DEFAULT_PARAMETERS, retention = None):
         self._id = _id
+        self.params = params  # Parameters of the workplace this agent belongs to
         self.mbti = '' if mbti == None else mbti
 
         self.skillset = sorted(skillset, key=lambda s: s._id)  # Ensure skills are stored in order
@@ -13,17 +18,27 @@ class Agent:
 
         self.allocation_times = []
         self.performance_times = {}
+        self.action_history = []
+
+        # With a retention policy, histories are kept in arrays (see history.py)
+        if retention is not None:
+            self.frustration = History(self.frustration, retention)
+            self.allocation_times = History(retention = retention)
+            self.performance_times = KeyedHistory(retention)
+            self.action_history = RecordHistory(['task', 'action', 'start_time'], retention)
 
         # Agent Memory
         self.stm = []                    # Should be updated when task is allocated
         self.ltm = self.skillset.copy()  # Initially, all skills are part of the long-term memory
 
         self.current_action = []
-        self.action_history = []
 
         self.verbose = verbose        
         self.validate_internals()
 
+        # Index in the MBTI table (-1 if there is no MBTI), resolved once
+        self.mbti_ix = self.get_mbti_ix() if self.mbti != '' and self.validate_mbti() else -1
+
     #################################################################
     # ---------- INTERNAL VALIDATION ----------
     #################################################################
@@ -88,6 +103,8 @@ class Agent:
         Calculates the time it takes to performe the tasks that can be
         found in vector 'assignments'.
         '''
+        P = self.params
+
         self.performance_times[time] = sum(
             [
                 P.TASK_UNIT_DURATION / ((P.ALPHA_E * self.get_latest_expertise(skill_ids[ix]) / P.MAX_E) +
@@ -111,6 +128,8 @@ class Agent:
 
     def update_memory(self):
         ''' Learning and forgetting depending on skills being in stm or ltm'''
+        P = self.params
+
         # Learn
         for skill in self.stm:
             new_exp = skill.expertise[-1] + P.LAM_LEARN * ( (P.MAX_E - skill.expertise[-1]) / P.MAX_E)
@@ -128,6 +147,15 @@ class Agent:
     def insert_alloc_time(self, coord_time):
         self.allocation_times.append(coord_time)
 
+    def keep_frustration(self):
+        '''Used when the agent took no part in an interaction: its frustration
+           history still gets an entry, with the same value as before
+        '''
+        if self.frustration == []:
+            return
+
+        self.frustration.append(self.frustration[-1])
+
     def flush_prev_act(self, assignments, skill_ids):
         # Clear current_action, update action_history
         self.action_history.extend(self.current_action)
@@ -136,7 +164,8 @@ class Agent:
         # Clear short-term memory, restore these skills to long-term memory
         self.ltm = self.skillset.copy()
 
-        promote_to_stm = list(set([skill_ids[i] for i, a in enumerate(assignments) if a == self._id]))
+        # Sorted, so that deleting them from the end does not shift the ones still to delete
+        promote_to_stm = sorted(set([skill_ids[i] for i, a in enumerate(assignments) if a == self._id]))
         self.stm = [self.ltm[i] for i in promote_to_stm]
 
         for i in promote_to_stm[::-1]:
@@ -158,6 +187,8 @@ class Agent:
         exp = self.get_latest_expertise(skill_id)
         mot = self.get_latest_motivation(skill_id)
 
+        P = self.params
+
         # Should scale P.ALPHA_E, P.ALPHA_M locally
         # Normalise alphas
         factor = 1 / (P.ALPHA_E + P.ALPHA_M)
@@ -213,6 +244,131 @@ class Agent:
 
         return '--- AGENT ' + str(self._id) + ' ---\n' + stm_str + ltm_str + curr_act_str + act_hist_str
 
+class LazyAgent(Agent):
+    ''' Agent whose skills live in a LazySkillStore: learning and forgetting
+        are only computed for the skills that are looked at, so skills that
+        are not used cost nothing per cycle. Results are the same as Agent's
+        up to floating point rounding.
+    '''
+    def __init__(self, _id, mbti = None, initial_frustration = None, skillset = [], verbose = False,
+                 params = P.DEFAULT_PARAMETERS, retention = None):
+        super().__init__(_id, mbti = mbti, initial_frustration = initial_frustration,
+                         skillset = skillset, verbose = verbose, params = params, retention = retention)
+
+        self.memory = LazySkillStore(self.skillset, self.params)
+        self.skillset = self.memory.skills
+        self.ltm = self.memory.ltm
+
+    @property
+    def params(self):
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        self._params = params
+        if hasattr(self, 'memory'):
+            self.memory.params = params
+
+    def update_memory(self):
+        ''' Learning and forgetting depending on skills being in stm or ltm'''
+        self.memory.advance()
+
+    def flush_prev_act(self, assignments, skill_ids):
+        # Clear current_action, update action_history
+        self.action_history.extend(self.current_action)
+        self.current_action = []
+
+        # Skills used in this cycle are learnt, the rest forgotten
+        promote_to_stm = set([skill_ids[i] for i, a in enumerate(assignments) if a == self._id])
+        self.memory.set_learning(promote_to_stm)
+
+        self.stm = [self.skillset[i] for i in sorted(promote_to_stm)]
+
+    # ---------- GETTERS ----------
+    def get_latest_expertise(self, skill_id):
+        return self.memory.expertise(skill_id)
+
+    def get_latest_motivation(self, skill_id):
+        return self.memory.motivation(skill_id)
+
+class ArrayAgent(Agent):
+    ''' Agent whose skills are the columns of a SkillArrays: expertise and
+        motivation vectors and a boolean mask for the short-term memory.
+        A cycle only touches the skills of the actions assigned in it (and
+        the ones that leave the mask), so its cost does not grow with the
+        number of skills. Histories follow the retention policy. Results
+        are the same as Agent's up to floating point rounding.
+    '''
+    def __init__(self, _id, mbti = None, initial_frustration = None, skillset = [], verbose = False,
+                 params = P.DEFAULT_PARAMETERS, retention = None):
+        super().__init__(_id, mbti = mbti, initial_frustration = initial_frustration,
+                         skillset = skillset, verbose = verbose, params = params, retention = retention)
+
+        self.memory = SkillArrays(self.skillset, self.params, retention)
+        self.skillset = self.memory.skills
+        self.ltm = self.memory.ltm
+
+    @property
+    def params(self):
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        self._params = params
+        if hasattr(self, 'memory'):
+            self.memory.params = params
+
+    def update_memory(self):
+        ''' Learning and forgetting depending on skills being in stm or ltm'''
+        self.memory.advance()
+
+    def flush_prev_act(self, assignments, skill_ids):
+        # Clear current_action, update action_history
+        self.action_history.extend(self.current_action)
+        self.current_action = []
+
+        # Skills used in this cycle are learnt, the rest forgotten
+        promote_to_stm = np.unique(np.asarray(skill_ids, dtype=int)[np.asarray(assignments) == self._id]).tolist()
+        self.memory.set_learning(promote_to_stm)
+
+        self.stm = [self.skillset[i] for i in promote_to_stm]
+
+    # ---------- GETTERS ----------
+    def get_latest_expertise(self, skill_id):
+        return self.memory.expertise(skill_id)
+
+    def get_latest_motivation(self, skill_id):
+        return self.memory.motivation(skill_id)
+
+def performance_times(agents, skill_ids, assignments, time, params = P.DEFAULT_PARAMETERS):
+    ''' Agent.calculate_performance_time of all the agents (ArrayAgents) at
+        once: the time of every action is computed from the skills of the
+        agent it was assigned to, and summed by agent with np.bincount. The
+        cost grows with the actions, not with the skills of the agents.
+    '''
+    P = params
+
+    assignments = np.asarray(assignments, dtype=int)
+    skill_ids = np.asarray(skill_ids, dtype=int)
+
+    exp, mot = np.empty(len(skill_ids)), np.empty(len(skill_ids))
+    for a in np.unique(assignments).tolist():
+        mine = assignments == a
+        exp[mine], mot[mine] = agents[a].memory.values(skill_ids[mine])
+
+    frustration = np.array([agent.get_frustration() for agent in agents], dtype=float)[assignments]
+
+    # Same operations (and order) as in Agent.calculate_performance_time
+    times = P.TASK_UNIT_DURATION / ((P.ALPHA_E * exp / P.MAX_E) +
+                                    (P.ALPHA_M * mot / P.MAX_M) +
+                                    (P.ALPHA_F * frustration / P.MAX_H))
+    totals = np.bincount(assignments, weights=times, minlength=len(agents)).tolist()
+
+    for agent, total in zip(agents, totals):
+        agent.performance_times[time] = total
+
+    return totals
+
 # Returns tuple containing:
 # (assignments, allocation_times, skill_ids, action_ids)
 def choose_agent(wp, action):
@@ -223,20 +379,51 @@ def choose_agent(wp, action):
     i0, you0 = wp.agents[0].get_initial_i_you(wp, action.skill_id)
     i1, you1 = wp.agents[1].get_initial_i_you(wp, action.skill_id)
 
+    # Begin negotiation process (remembered, if the workplace has a memo)
+    negotiate = negotiate_raw if wp.negotiation_memo is None else wp.negotiation_memo.negotiate_raw
+    agent, allocation_time = negotiate(i0, you0, i1, you1, params = wp.params, rng = wp.rng)
+
+    return settle_allocation(wp, action, agent, allocation_time)
+
+def choose_agents(wp, actions):
+    ''' Batched version of choose_agent: all the pending actions of a cycle
+        are negotiated at once with negotiate_batch. The outcome is the same
+        as calling choose_agent for every action, in order.
+    '''
+    if len(actions) == 0:
+        return []
+
+    i0, you0 = zip(*[wp.agents[0].get_initial_i_you(wp, action.skill_id) for action in actions])
+    i1, you1 = zip(*[wp.agents[1].get_initial_i_you(wp, action.skill_id) for action in actions])
+
+    negotiate = negotiate_batch if wp.negotiation_memo is None else wp.negotiation_memo.negotiate_batch
+    agents, allocation_times = negotiate(i0, you0, i1, you1, params = wp.params, rng = wp.rng)
+
+    # Negotiation only depends on expertise and motivation, which do not change
+    # during a cycle. Frustration does, so it is applied action by action.
+    return [settle_allocation(wp, action, int(agent), int(allocation_time))
+            for action, agent, allocation_time in zip(actions, agents, allocation_times)]
+
+def settle_allocation(wp, action, agent, allocation_time):
+    ''' Applies the outcome of a negotiation (agent and number of steps) to
+        the workplace: allocation times, frustration and action progress
+    '''
+    if wp.instrumentation is not None:
+        wp.instrumentation.count_negotiation(allocation_time, wp.params.MAX_COORD_STEPS)
+
     # frustration should be updated before their interaction
     f0, f1 = wp.agents[0].get_frustration(), wp.agents[1].get_frustration()
 
-    # Begin negotiation process
-    agent, allocation_time = negotiate(i0, you0, i1, you1,
-                                       r_ij = get_relationship(wp.agents[0], wp.agents[1]),
-                                       f0 = f0, f1 = f1)
+    r_ij = wp.relationships.get(0, 1)
+
+    allocation_time = scale_allocation_time(allocation_time, r_ij = r_ij, f0 = f0, f1 = f1, params = wp.params)
 
     # Update each agent's internal tracking of allocation time
     wp.agents[0].insert_alloc_time(allocation_time)
     wp.agents[1].insert_alloc_time(allocation_time)
 
     # Calculate immediate frustration with information from latest interaction
-    f0, f1 = calculate_immediate_frustration(wp.agents[0], wp.agents[1])
+    f0, f1 = calculate_immediate_frustration(wp.agents[0], wp.agents[1], wp.params, r_ij)
     wp.agents[0].update_frustration(f0)
     wp.agents[1].update_frustration(f1)
 
@@ -245,17 +432,44 @@ def choose_agent(wp, action):
 
     return (agent, allocation_time, action.skill_id, action._id)
 
-def negotiate(i0, you0, i1, you1, inhibit = P.INHIBIT, excite = P.EXCITE, r_ij = -1, f0 = -1, f1 = -1):
-    # If parameters are not specified, they also hold no effect over the system
-    # if r_ij == -1 or f0 == -1 or f1 == -1:
-    #     r_ij = 0.5
-    #     f0 = P.MAX_H/2
-    #     f1 = P.MAX_H/2
+def negotiate(i0, you0, i1, you1, inhibit = None, excite = None, r_ij = -1, f0 = -1, f1 = -1,
+              params = P.DEFAULT_PARAMETERS, rng = None):
+    agent, allocation_time = negotiate_raw(i0, you0, i1, you1, inhibit, excite, params, rng)
+
+    return agent, scale_allocation_time(allocation_time, r_ij, f0, f1, params)
+
+def negotiate_raw(i0, you0, i1, you1, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS, rng = None):
+    ''' Runs the I/YOU dynamics until one agent says "I" and the other says
+        "YOU". Returns the agent that will perform the action and the number
+        of steps it took (not yet scaled by relationship or frustration).
+        inhibit and excite default to the ones in params. rng (a numpy
+        Generator) breaks ties when the negotiation does not end; numpy's
+        global random state is used if it is None.
+        Negotiations that come back to an earlier state (e.g. agents with the
+        same I and YOU, which never change) would go on until MAX_COORD_STEPS,
+        so they end there at once, with the same result.
+    '''
+    agent, allocation_time = negotiate_raw_steps(i0, you0, i1, you1, inhibit, excite, params)
 
-    MAX_DELTA = 0 if (r_ij == -1 or f0 == -1 or f1 == -1) else 0.5
+    if agent < 0:
+        agent = 0 if random_int(rng, 2) else 1
+
+    return agent, allocation_time
+
+def negotiate_raw_steps(i0, you0, i1, you1, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS):
+    ''' negotiate_raw without the random decision: negotiations that reach
+        MAX_COORD_STEPS get agent -1
+    '''
+    inhibit = params.INHIBIT if inhibit is None else inhibit
+    excite = params.EXCITE if excite is None else excite
 
     allocation_time = 0
 
+    # Brent's cycle detection: the state is compared with the one saved at
+    # the last power of two steps
+    saved_i0, saved_you0, saved_i1, saved_you1 = i0, you0, i1, you1
+    next_save = 1
+
     while (i0 > you0 and i1 > you1) or \
           (you0 > i0 and you1 > i1):
 
@@ -278,12 +492,13 @@ def negotiate(i0, you0, i1, you1, inhibit = P.INHIBIT, excite = P.EXCITE, r_ij =
 
         allocation_time += 1
 
-        if allocation_time >= P.MAX_COORD_STEPS:
-            if np.random.randint(0, 2):
-                i0, you0, i1, you1 = 1, 0, 0, 1
-            else:
-                i0, you0, i1, you1 = 0, 1, 1, 0
-            break
+        if allocation_time >= params.MAX_COORD_STEPS or \
+           (i0 == saved_i0 and you0 == saved_you0 and i1 == saved_i1 and you1 == saved_you1):
+            return -1, max(allocation_time, params.MAX_COORD_STEPS)
+
+        if allocation_time == next_save:
+            saved_i0, saved_you0, saved_i1, saved_you1 = i0, you0, i1, you1
+            next_save *= 2
 
     # The agent that will perform this action has been determined
     agent = 0 if i0 > you0 else 1
@@ -291,31 +506,180 @@ def negotiate(i0, you0, i1, you1, inhibit = P.INHIBIT, excite = P.EXCITE, r_ij =
     # DEBUG
     # print([agent, allocation_time])
 
-    # Adjust allocation_time with a factor based on r_ij, f0, f1
+    return agent, allocation_time
+
+# Below this number of lanes, a loop of negotiate_raw_steps is faster than
+# numpy (whose cost per step does not depend on the lanes): measured ~500
+BATCH_MIN_LANES = 512
+
+def negotiate_batch(i0, you0, i1, you1, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS, rng = None):
+    ''' Same dynamics as negotiate_raw, but for many negotiations at once.
+        i0, you0, i1, you1 (and optionally inhibit, excite) are arrays with
+        one entry per negotiation ("lane"). All lanes are iterated together
+        and each one stops as soon as its own negotiation is over, so the
+        results are identical to calling negotiate_raw lane by lane.
+        Returns two arrays: chosen agents and number of steps.
+        numpy only pays off with many lanes (the lockstep engine, with
+        hundreds of runs): with fewer than BATCH_MIN_LANES, as in the
+        cycles of a single workplace, lanes are negotiated one by one.
+    '''
+    agents, allocation_times = negotiate_batch_steps(i0, you0, i1, you1, inhibit, excite, params)
+
+    # Lanes that did not end are decided randomly, in lane order (as negotiate_raw would)
+    for lane in np.flatnonzero(agents < 0):
+        agents[lane] = 0 if random_int(rng, 2) else 1
+
+    return agents, allocation_times
+
+def negotiate_batch_steps(i0, you0, i1, you1, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS):
+    ''' negotiate_batch without the random decisions: lanes that reach
+        MAX_COORD_STEPS get agent -1
+    '''
+    inhibit = params.INHIBIT if inhibit is None else inhibit
+    excite = params.EXCITE if excite is None else excite
+
+    i0, you0, i1, you1 = [np.array(x, dtype=float, ndmin=1) for x in (i0, you0, i1, you1)]
+    n_lanes = len(i0)
+
+    inhibit = np.broadcast_to(np.asarray(inhibit, dtype=float), (n_lanes,))
+    excite = np.broadcast_to(np.asarray(excite, dtype=float), (n_lanes,))
+
+    if n_lanes < BATCH_MIN_LANES:
+        results = [negotiate_raw_steps(*lane, params = params)
+                   for lane in zip(i0.tolist(), you0.tolist(), i1.tolist(), you1.tolist(),
+                                   inhibit.tolist(), excite.tolist())]
+        return np.array([agent for agent, _ in results], dtype=int).reshape(n_lanes), \
+               np.array([steps for _, steps in results], dtype=int).reshape(n_lanes)
+
+    agents = np.zeros(n_lanes, dtype=int)
+    allocation_times = np.zeros(n_lanes, dtype=int)
+
+    # Lanes that are still negotiating, and their current state
+    lanes = np.flatnonzero(((i0 > you0) & (i1 > you1)) | ((you0 > i0) & (you1 > i1)))
+    agents[:] = np.where(i0 > you0, 0, 1)
+
+    _i0, _you0, _i1, _you1 = i0[lanes], you0[lanes], i1[lanes], you1[lanes]
+    _inhibit, _excite = inhibit[lanes], excite[lanes]
+
+    # Cycle detection, as in negotiate_raw
+    saved = [_i0, _you0, _i1, _you1]
+    next_save = 1
+
+    step = 0
+    while len(lanes) > 0:
+        diff_i = np.abs(_i0 - _i1)
+        diff_you = np.abs(_you0 - _you1)
+
+        # Same operations (and order) as in negotiate_raw
+        i_inhib = _inhibit * _i0 * _i1 * diff_i
+        you_inhib = _inhibit * _you0 * _you1 * diff_you
+
+        new_i0 = _i0 - i_inhib + _excite * _you1 * (1 - _i0) * diff_you
+        new_you0 = _you0 - you_inhib + _excite * (1 - _you0) * _i1 * diff_i
+        new_i1 = _i1 - i_inhib + _excite * _you0 * (1 - _i1) * diff_you
+        new_you1 = _you1 - you_inhib + _excite * (1 - _you1) * _i0 * diff_i
+
+        _i0, _you0, _i1, _you1 = new_i0, new_you0, new_i1, new_you1
+
+        step += 1
+
+        if step >= params.MAX_COORD_STEPS:
+            # Remaining lanes are left undecided
+            allocation_times[lanes] = step
+            agents[lanes] = -1
+            break
+
+        going_on = ((_i0 > _you0) & (_i1 > _you1)) | ((_you0 > _i0) & (_you1 > _i1))
+
+        # Lanes back to an earlier state never end: undecided, as if they reached MAX_COORD_STEPS
+        repeated = _i0 == saved[0]
+        if repeated.any():
+            repeated &= (_you0 == saved[1]) & (_i1 == saved[2]) & (_you1 == saved[3])
+            allocation_times[lanes[repeated]] = params.MAX_COORD_STEPS
+            agents[lanes[repeated]] = -1
+            going_on &= ~repeated
+
+        if not going_on.all():
+            done = ~going_on & ~repeated
+            allocation_times[lanes[done]] = step
+            agents[lanes[done]] = np.where(_i0[done] > _you0[done], 0, 1)
+
+            lanes = lanes[going_on]
+            _i0, _you0, _i1, _you1 = _i0[going_on], _you0[going_on], _i1[going_on], _you1[going_on]
+            _inhibit, _excite = _inhibit[going_on], _excite[going_on]
+            saved = [values[going_on] for values in saved]
+
+        if step == next_save:
+            saved = [_i0, _you0, _i1, _you1]
+            next_save *= 2
+
+    return agents, allocation_times
+
+class CountingRng:
+    ''' Random numbers of a workplace: from rng (a numpy Generator) or, if
+        it is None, from numpy's global state. draws counts the numbers drawn
+        so far (see steady_state.py).
+    '''
+    def __init__(self, rng = None):
+        self.rng = rng
+        self.draws = 0
+
+    def integers(self, low, high):
+        self.draws += 1
+        return self.rng.integers(low, high) if self.rng is not None else np.random.randint(low, high)
+
+def random_int(rng, n):
+    ''' Random integer in [0, n), from rng (a numpy Generator or a
+        CountingRng) or from numpy's global state
+    '''
+    return int(rng.integers(0, n)) if rng is not None else np.random.randint(0, n)
+
+def scale_allocation_time(allocation_time, r_ij = -1, f0 = -1, f1 = -1, params = P.DEFAULT_PARAMETERS):
+    ''' Adjusts allocation_time with a factor based on r_ij, f0, f1 '''
+    # If parameters are not specified, they also hold no effect over the system
+    # if r_ij == -1 or f0 == -1 or f1 == -1:
+    #     r_ij = 0.5
+    #     f0 = P.MAX_H/2
+    #     f1 = P.MAX_H/2
+
+    MAX_DELTA = 0 if (r_ij == -1 or f0 == -1 or f1 == -1) else 0.5
+
+    P = params
+
     allocation_time *= (1 + MAX_DELTA * ((-(r_ij - 0.5)/0.5 + (f0 - P.MAX_H/2)/(P.MAX_H/2) + (f1 - P.MAX_H/2)/(P.MAX_H/2)) / 3))
 
-    return agent, allocation_time
+    return allocation_time
 
-def get_relationship(agent0, agent1):
+def get_relationship(agent0, agent1, params = P.DEFAULT_PARAMETERS):
     ''' Returns the r_ij (relationship between agents as a number in (0,1))'''
-    r_ij = P.MBTI[agent0.get_mbti_ix()][agent1.get_mbti_ix()] \
-           if agent0.validate_mbti() and agent1.validate_mbti() \
+    r_ij = params.MBTI[agent0.mbti_ix][agent1.mbti_ix] \
+           if agent0.mbti_ix >= 0 and agent1.mbti_ix >= 0 \
            else -1
     return r_ij if r_ij != 0 else np.finfo(float).eps
 
-def calculate_immediate_frustration(agent0, agent1):
-    ''' Calculates I(T,r_ij) with the formula that can be found in the report'''
+def calculate_immediate_frustration(agent0, agent1, params = P.DEFAULT_PARAMETERS, r_ij = None):
+    ''' Calculates I(T,r_ij) with the formula that can be found in the report.
+        r_ij is computed from the agents' MBTI if not given.
+    '''
     immediate_frustrations = []
 
-    r_ij = get_relationship(agent0, agent1)
-    personality = (1 - r_ij) / r_ij
+    if r_ij is None:
+        r_ij = get_relationship(agent0, agent1, params)
 
     for agent in [agent0, agent1]:
-        HARD_LIMITER = 0.1
-        alloc_time = agent.allocation_times[-1] if agent.allocation_times[-1] < round(P.MAX_COORD_STEPS * HARD_LIMITER) else (round(P.MAX_COORD_STEPS * HARD_LIMITER) - 1)
-        coord_penalty = (alloc_time / (P.MAX_COORD_STEPS / 10)) / \
-                        (1 - (alloc_time / (P.MAX_COORD_STEPS / 10)))
-
-        immediate_frustrations.append(P.MAX_H * (1 - math.exp(-P.BETA * personality * coord_penalty)))
+        immediate_frustrations.append(immediate_frustration(r_ij, agent.allocation_times[-1], params))
 
     return immediate_frustrations[0], immediate_frustrations[1]
+
+def immediate_frustration(r_ij, alloc_time, params = P.DEFAULT_PARAMETERS):
+    ''' I(T,r_ij) for an agent whose latest allocation took alloc_time '''
+    P = params
+
+    personality = (1 - r_ij) / r_ij
+
+    HARD_LIMITER = 0.1
+    alloc_time = alloc_time if alloc_time < round(P.MAX_COORD_STEPS * HARD_LIMITER) else (round(P.MAX_COORD_STEPS * HARD_LIMITER) - 1)
+    coord_penalty = (alloc_time / (P.MAX_COORD_STEPS / 10)) / \
+                    (1 - (alloc_time / (P.MAX_COORD_STEPS / 10)))
+
+    return P.MAX_H * (1 - math.exp(-P.BETA * personality * coord_penalty))
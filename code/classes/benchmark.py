@@ -0,0 +1,332 @@
+######################################################################
+######################################################################
+# Benchmarks of the simulator.
+#
+#   python benchmark.py startup
+#
+# measures how long a fresh interpreter takes to import the simulator
+# (what every worker of a sweep or an ensemble pays), and fails if a
+# plotting library gets imported with it or if it takes too long.
+#
+#   python benchmark.py suite -o results.json [-b baseline.json]
+#
+# runs generated scenarios of increasing size (tasks, actions per task,
+# skills, agents, durations, low/high task variety) end to end, and
+# times the hot functions of the simulator one by one. Results (time,
+# cycles per second, peak memory) are saved as json, and compared with
+# a baseline from an earlier run if one is given.
+######################################################################
+######################################################################
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import numpy as np
+
+from argparse import ArgumentParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules used to run simulations, and libraries they must not import
+CORE_MODULES = ['workplace', 'agent', 'multi_agent', 'task', 'skill', 'timeline', 'history',
+                'sweep', 'ensemble']
+PLOTTING_LIBRARIES = ['matplotlib', 'plotly']
+
+# ---------- STARTUP ----------
+
+def import_time(modules, repeats = 5):
+    ''' Median time (seconds) a fresh interpreter takes to import modules,
+        not counting the start of the interpreter itself
+    '''
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd = HERE, check = True)
+        return time.perf_counter() - start
+
+    times = []
+    for _ in range(repeats):
+        empty = run('pass')
+        times.append(run('import ' + ', '.join(modules)) - empty)
+
+    return max(statistics.median(times), 0)
+
+def imported_libraries(modules, libraries = PLOTTING_LIBRARIES):
+    ''' Which of libraries are imported as a side effect of importing modules '''
+    code = 'import sys, json\n' + \
+           'import ' + ', '.join(modules) + '\n' + \
+           'print(json.dumps(sorted(set(m.split(".")[0] for m in sys.modules) & set(' + repr(libraries) + '))))'
+
+    output = subprocess.run([sys.executable, '-c', code], cwd = HERE, check = True,
+                            stdout = subprocess.PIPE).stdout
+
+    return json.loads(output.decode())
+
+def startup_benchmark(repeats = 5, max_overhead = 0.2):
+    ''' Import time of the simulator, compared with numpy's (which it needs
+        anyway). Returns the results and a list of problems: plotting
+        libraries imported by the simulator, or an import time more than
+        max_overhead seconds above numpy's.
+    '''
+    results = {'numpy': import_time(['numpy'], repeats),
+               'core': import_time(CORE_MODULES, repeats),
+               'plotting': import_time(['matplotlib.pyplot', 'plotly.graph_objs'], repeats)}
+
+    problems = []
+
+    leaked = imported_libraries(CORE_MODULES)
+    if len(leaked) > 0:
+        problems.append('Importing the simulator imports ' + ', '.join(leaked))
+
+    if results['core'] - results['numpy'] > max_overhead:
+        problems.append('Importing the simulator takes {:.3f} s more than numpy (limit: {:.3f} s)'
+                        .format(results['core'] - results['numpy'], max_overhead))
+
+    return results, problems
+
+# ---------- SCENARIOS ----------
+
+MBTI_TYPES = [a + b + c + d for a in 'EI' for b in 'SN' for c in 'TF' for d in 'JP']
+
+# Every scaling curve changes one of these, the rest keep their value
+BASE_SCENARIO = {'n_agents': 2, 'n_skills': 20, 'n_tasks': 5, 'n_actions': 4, 'duration': 5, 'variety': 'high'}
+
+SCALING = {
+    'n_tasks': [5, 10, 20, 40],
+    'n_actions': [2, 4, 8, 16],
+    'n_skills': [20, 100, 500, 2000],
+    'n_agents': [2, 4, 8, 16],
+    'duration': [5, 10, 20, 40],
+    'variety': ['low', 'high'],
+}
+
+def make_scenario(n_agents = 2, n_skills = 20, n_tasks = 5, n_actions = 4, duration = 5, variety = 'high', seed = 0):
+    ''' Contents of an input file. With high task variety, actions go
+        through all the skills (as in input_high_*); with low variety, all
+        the tasks use the same two skills (as in input_low_*).
+    '''
+    import my_parameters as P
+
+    rng = random.Random(seed)
+
+    agents = [{'mbti': rng.choice(MBTI_TYPES),
+               'initial_frustration': 10,
+               'skillset': [{'id': s, 'exp': rng.randint(10, 20), 'mot': rng.randint(10, 20)}
+                            for s in range(n_skills)]}
+              for _ in range(n_agents)]
+
+    def skill_id(t, j):
+        return (t * n_actions + j) % n_skills if variety == 'high' else j % min(2, n_skills)
+
+    tasks = [{'actions': [{'id': j, 'skill_id': skill_id(t, j), 'duration': duration} for j in range(n_actions)]}
+             for t in range(n_tasks)]
+
+    return {'parameters': P.DEFAULT_PARAMETERS.to_dict(), 'agents': agents, 'tasks': tasks}
+
+# ---------- END TO END ----------
+
+def run_scenario(data, repeats = 3, min_seconds = 0.2):
+    ''' Best time of process_tasks over at least repeats runs (and more,
+        up to min_seconds, for small scenarios), cycles, and peak memory
+        (measured in a separate run, as tracing memory slows it down)
+    '''
+    from workplace import Workplace
+
+    times = []
+    while len(times) < repeats or sum(times) < min_seconds:
+        wp = Workplace(data = data, seed = 0)
+        start = time.perf_counter()
+        wp.process_tasks(output_moods = False)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    wp = Workplace(data = data, seed = 0)
+    wp.process_tasks(output_moods = False)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = min(times)
+
+    return {'seconds': seconds, 'cycles': wp.time,
+            'cycles_per_second': wp.time / seconds if seconds > 0 else None,
+            'peak_bytes': peak_bytes}
+
+def scaling_curves(scaling = SCALING, repeats = 3, verbose = True):
+    ''' run_scenario for every value of every scaling variable '''
+    curves = {}
+
+    for name, values in scaling.items():
+        curves[name] = []
+        for value in values:
+            scenario = dict(BASE_SCENARIO, **{name: value})
+            result = dict(run_scenario(make_scenario(**scenario), repeats), value = value)
+            curves[name].append(result)
+
+            if verbose:
+                print('{:10s}{:>8s}{:10.4f} s{:8d} cycles{:12.1f} cycles/s{:10.1f} MB'.format(
+                      name, str(value), result['seconds'], result['cycles'],
+                      result['cycles_per_second'] or 0, result['peak_bytes'] / 2**20))
+
+    return curves
+
+# ---------- HOT FUNCTIONS ----------
+
+def time_calls(function, calls, repeats = 3):
+    ''' Best time per call of function() '''
+    best = None
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        seconds = (time.perf_counter() - start) / calls
+        best = seconds if best is None else min(best, seconds)
+
+    return best
+
+def hot_functions(calls = 1000, repeats = 3, verbose = True):
+    ''' Time per call of the functions the simulator spends its time in '''
+    from workplace import Workplace
+    from timeline import Timeline, Event
+    from agent import negotiate_raw, negotiate_batch, scale_allocation_time, immediate_frustration
+
+    rng = np.random.default_rng(0)
+    wp = Workplace(data = make_scenario(n_skills = 100), seed = 0)
+    agent = wp.agents[0]
+    params = wp.params
+
+    # Initial I/YOU of real agents, so that negotiations take realistic times
+    pairs = [agent.get_initial_i_you(wp, s) + wp.agents[1].get_initial_i_you(wp, s) for s in range(100)]
+    lanes = [np.array(x) for x in zip(*pairs)]
+    many_lanes = [np.tile(x, 10) for x in lanes]    # Enough for numpy (see agent.BATCH_MIN_LANES)
+
+    def negotiate_all():
+        for i0, you0, i1, you1 in pairs:
+            negotiate_raw(i0, you0, i1, you1, params = params, rng = rng)
+
+    def add_events():
+        timeline = Timeline()
+        for t in range(100):
+            timeline.add_event(Event(start_time = t, duration = 1, task_id = 0, action_id = t, agent_id = t % 2))
+
+    benchmarks = {
+        'negotiate_raw (100 negotiations)': (negotiate_all, calls // 100),
+        'negotiate_batch (100 lanes)': (lambda: negotiate_batch(*lanes, params = params, rng = rng), calls // 100),
+        'negotiate_batch (1000 lanes)': (lambda: negotiate_batch(*many_lanes, params = params, rng = rng), calls // 1000),
+        'Timeline.add_event (100 events)': (add_events, calls // 10),
+        'Agent.update_memory (100 skills)': (agent.update_memory, calls),
+        'Agent.get_initial_i_you': (lambda: agent.get_initial_i_you(wp, 7), calls * 10),
+        'scale_allocation_time': (lambda: scale_allocation_time(37, 0.5, 10, 12, params), calls * 10),
+        'immediate_frustration': (lambda: immediate_frustration(0.5, 37.5, params), calls * 10),
+    }
+
+    results = {}
+    for name, (function, n_calls) in benchmarks.items():
+        results[name] = {'seconds_per_call': time_calls(function, n_calls, repeats), 'calls': n_calls}
+
+        if verbose:
+            print('{:40s}{:12.2f} us'.format(name, results[name]['seconds_per_call'] * 1e6))
+
+    return results
+
+# ---------- SUITE ----------
+
+def run_suite(quick = False, repeats = 3, verbose = True):
+    ''' Whole suite: scaling curves and hot functions '''
+    scaling = {name: values[:2] for name, values in SCALING.items()} if quick else SCALING
+
+    return {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__,
+                 'platform': platform.platform(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                 'quick': quick, 'base_scenario': BASE_SCENARIO},
+        'scaling': scaling_curves(scaling, repeats, verbose),
+        'functions': hot_functions(repeats = repeats, verbose = verbose),
+    }
+
+def compare(results, baseline, tolerance = 0.25):
+    ''' Ratios new / baseline of the times in both results. Returns a list
+        of (name, ratio, regression) with regression = ratio > 1 + tolerance.
+    '''
+    comparison = []
+
+    for name, curve in results['scaling'].items():
+        old = {str(point['value']): point for point in baseline.get('scaling', {}).get(name, [])}
+        for point in curve:
+            if str(point['value']) in old and old[str(point['value'])]['seconds'] > 0:
+                ratio = point['seconds'] / old[str(point['value'])]['seconds']
+                comparison.append((name + '=' + str(point['value']), ratio, ratio > 1 + tolerance))
+
+    for name, result in results['functions'].items():
+        if name in baseline.get('functions', {}):
+            ratio = result['seconds_per_call'] / baseline['functions'][name]['seconds_per_call']
+            comparison.append((name, ratio, ratio > 1 + tolerance))
+
+    return comparison
+
+# ---------- COMMAND LINE ----------
+
+def parse_args():
+    parser = ArgumentParser(description='Benchmarks of the simulator')
+    commands = parser.add_subparsers(dest='command')
+
+    startup = commands.add_parser('startup', help='Import time of the simulator.')
+    startup.add_argument('-r', '--repeats', default=5, type=int,
+                         help='Number of fresh interpreters to time.')
+    startup.add_argument('-m', '--max-overhead', default=0.2, type=float,
+                         help='Maximum import time (s) on top of numpy\'s.')
+
+    suite = commands.add_parser('suite', help='Scaling curves and hot functions.')
+    suite.add_argument('-o', '--output', default=os.path.join(tempfile.gettempdir(), 'benchmark.json'), type=str,
+                       help='json file for the results (default: benchmark.json in the temporary directory).')
+    suite.add_argument('-b', '--baseline', default=None, type=str,
+                       help='Results of an earlier run to compare with.')
+    suite.add_argument('-t', '--tolerance', default=0.25, type=float,
+                       help='Slowdown over the baseline reported as a regression (0.25 = 25%%).')
+    suite.add_argument('-r', '--repeats', default=3, type=int,
+                       help='Runs of every benchmark (the best one counts).')
+    suite.add_argument('-q', '--quick', action='store_true',
+                       help='Only the two smallest scenarios of every curve.')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.command == 'startup':
+        results, problems = startup_benchmark(args.repeats, args.max_overhead)
+
+        for name, seconds in results.items():
+            print('{:10s}{:8.3f} s'.format(name, seconds))
+    elif args.command == 'suite':
+        results = run_suite(args.quick, args.repeats)
+
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 1)
+        print('Results saved in ' + args.output)
+
+        problems = []
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+
+            for name, ratio, regression in compare(results, baseline, args.tolerance):
+                print('{:40s}{:8.2f}x{}'.format(name, ratio, '  <-- slower' if regression else ''))
+                if regression:
+                    problems.append(name + ' is {:.2f} times slower than in the baseline'.format(ratio))
+    else:
+        print('Please choose a benchmark (startup, suite).')
+        exit(1)
+
+    for problem in problems:
+        print('FAIL: ' + problem)
+
+    exit(1 if len(problems) > 0 else 0)
+
+if __name__ == '__main__':
+    main()
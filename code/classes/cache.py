@@ -0,0 +1,217 @@
+######################################################################
+######################################################################
+# On-disk cache of results. A run is identified by a hash of what
+# determines its outcome: agents, tasks, effective parameters, seed
+# and the version of the simulator (batch and one-by-one negotiation
+# give the same results, so they share their entries). Its results
+# (performance and coordination times, frustration, allocation times,
+# skills, timeline, metrics of every task) are stored in a compressed .npz file named after
+# the hash, and restored into the Workplace the next time the same
+# run is asked for. The cache has a maximum size: the least recently
+# used results are deleted first.
+#
+# Usage: Workplace(file, seed = 1, cache = ResultCache('cache_dir'))
+######################################################################
+######################################################################
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from timeline import Event
+
+# Bump it whenever a change to the simulator changes its results
+SIMULATOR_VERSION = 1
+
+class ResultCache:
+    def __init__(self, directory, max_bytes = 256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok = True)
+
+    # ---------- KEYS ----------
+
+    def key(self, wp):
+        ''' Hash of the run that wp is about to do, or None if it cannot be
+            cached (histories with retention policies, lazy or array skills, a run
+            already started, tasks from a stream, per-cycle output, steady
+            state jumps, instrumentation, or a seed that cannot be identified)
+        '''
+        if wp.retention is not None or wp.lazy_skills or wp.array_skills or wp.time > 0 or len(wp.completed_tasks) > 0 or \
+           wp.task_source is not None or wp.output is not None or wp.steady_state is not None or \
+           wp.instrumentation is not None:
+            return None
+
+        seed = seed_key(wp.seed)
+        if seed is None and wp.seed is not None:
+            return None
+
+        run = {
+            'version': SIMULATOR_VERSION,
+            'seed': seed,
+            'parameters': wp.params.to_dict(),
+            'relationships': sorted([list(pair), r_ij] for pair, r_ij in wp.relationship_overrides.items()),
+            'agents': [{'mbti': agent.mbti,
+                        'frustration': list(agent.frustration),
+                        'skills': [[skill._id, list(skill.expertise), list(skill.motivation)]
+                                   for skill in agent.skillset]}
+                       for agent in wp.agents],
+            'tasks': [[task._id, task.action_rows()] for task in wp.tasks_todo],
+        }
+
+        return hashlib.sha256(json.dumps(run, sort_keys = True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # ---------- LOADING / STORING ----------
+
+    def load(self, wp, key):
+        ''' Restores the results of run key into wp. Returns the metrics of
+            its tasks (see Workplace.iter_tasks), or None if it is not in the
+            cache.
+        '''
+        path = self.path(key)
+
+        try:
+            with np.load(path) as arrays:
+                arrays = {name: arrays[name] for name in arrays.files}
+                task_metrics = json.loads(arrays['task_metrics'].item())
+                restore(wp, arrays)
+            os.utime(path)  # Most recently used
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return task_metrics
+
+    def store(self, wp, key, task_metrics = []):
+        ''' Stores the results of wp (a finished run) as run key, with the
+            metrics of its tasks
+        '''
+        # Written to a temporary file first, so that other processes using
+        # the same cache never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **snapshot(wp, task_metrics))
+        os.replace(tmp_path, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        ''' Deletes the least recently used results until the cache fits in max_bytes '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+                except FileNotFoundError:
+                    pass  # Deleted by another process
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.directory, name))
+
+def seed_key(seed):
+    ''' json-serialisable identity of a seed (None if it has none) '''
+    if isinstance(seed, (int, np.integer)):
+        return int(seed)
+    if isinstance(seed, np.random.SeedSequence):
+        return [str(seed.entropy), list(seed.spawn_key)]
+    return None
+
+def global_rng_state():
+    ''' State of numpy's global random generator (used by runs without seed) '''
+    state = np.random.get_state()
+    return state[1].copy(), state[2:]
+
+def same_rng_state(state0, state1):
+    return np.array_equal(state0[0], state1[0]) and state0[1] == state1[1]
+
+# ---------- RESULTS <-> ARRAYS ----------
+
+def snapshot(wp, task_metrics = []):
+    ''' Results of a finished run, as a dictionary of arrays '''
+    arrays = {
+        'time': np.array(wp.time),
+        'task_metrics': np.array(json.dumps(task_metrics)),
+        'Tperf_keys': np.array(list(wp.Tperf.keys()), dtype = np.int64),
+        'Tperf': np.array(list(wp.Tperf.values()), dtype = float),
+        'coordination_keys': np.array(list(wp.coordination_times.keys()), dtype = np.int64),
+        'coordination': np.array(list(wp.coordination_times.values()), dtype = float),
+        'completion': np.array([action.completion for task in wp.completed_tasks for action in task.actions],
+                               dtype = np.int64),
+        'events': np.array([[e.start_time, e.duration, e.task_id, e.action_id, e.agent_id]
+                            for e in wp.timeline], dtype = np.int64).reshape(-1, 5),
+    }
+
+    for k, agent in enumerate(wp.agents):
+        arrays['frustration_' + str(k)] = np.array(agent.frustration, dtype = float)
+        arrays['allocation_times_' + str(k)] = np.array(agent.allocation_times, dtype = float)
+        arrays['performance_keys_' + str(k)] = np.array(list(agent.performance_times.keys()), dtype = np.int64)
+        arrays['performance_times_' + str(k)] = np.array(list(agent.performance_times.values()), dtype = float)
+        arrays['expertise_' + str(k)] = np.array([skill.expertise for skill in agent.skillset], dtype = float)
+        arrays['motivation_' + str(k)] = np.array([skill.motivation for skill in agent.skillset], dtype = float)
+
+    return arrays
+
+def restore(wp, arrays):
+    ''' Puts the results in arrays (see snapshot) into wp, as if it had run
+        all its tasks. Initial values (from the input) are kept as they were.
+    '''
+    wp.time = int(arrays['time'])
+    wp.Tperf = dict(zip(arrays['Tperf_keys'].tolist(), arrays['Tperf'].tolist()))
+    wp.coordination_times = dict(zip(arrays['coordination_keys'].tolist(), arrays['coordination'].tolist()))
+
+    for k, agent in enumerate(wp.agents):
+        agent.frustration = agent.frustration[:1] + arrays['frustration_' + str(k)].tolist()[1:]
+        agent.allocation_times = arrays['allocation_times_' + str(k)].tolist()
+        agent.performance_times = dict(zip(arrays['performance_keys_' + str(k)].tolist(),
+                                           arrays['performance_times_' + str(k)].tolist()))
+
+        for skill, expertise, motivation in zip(agent.skillset, arrays['expertise_' + str(k)].tolist(),
+                                                arrays['motivation_' + str(k)].tolist()):
+            skill.expertise = skill.expertise[:1] + expertise[1:]
+            skill.motivation = skill.motivation[:1] + motivation[1:]
+
+        agent.action_history, agent.current_action = [], []
+
+    # Actions of every agent: the ones of the last cycle are still current
+    for start_time, duration, task_id, action_id, agent_id in arrays['events'].tolist():
+        wp.timeline.add_event(Event(start_time = start_time, duration = duration, task_id = task_id,
+                                    action_id = action_id, agent_id = agent_id))
+
+        action = {'task': task_id, 'action': action_id, 'start_time': start_time}
+        agent = wp.agents[agent_id]
+        if start_time == wp.time - 1:
+            agent.current_action.append(action)
+        else:
+            agent.action_history.append(action)
+
+    # All the tasks are done
+    completion = iter(arrays['completion'].tolist())
+    while len(wp.tasks_todo) > 0:
+        task = wp.tasks_todo.popleft()
+        for action in task.actions:
+            action.completion = next(completion)
+        wp.completed_tasks.append(task)
@@ -0,0 +1,167 @@
+######################################################################
+######################################################################
+# Checkpoints of a run: the whole state of a Workplace (tasks to do,
+# current task and progress of its actions, agents with their skill
+# histories, stm/ltm, frustration..., time, performance and
+# coordination times, timeline and random generator) is saved as a
+# compressed pickle, and loading it gives a workplace that continues
+# exactly as the original one would have. Runs whose tasks come from a
+# stream can only be saved if the stream can be opened again where it
+# was (a JSON lines file, task_stream.JsonlTasks, or a list), not from
+# a generator.
+#
+# Usage:
+#   wp = Workplace(file, seed = 1, checkpoints = Checkpoints('run.ckpt', every_cycles = 1000))
+#   wp.process_tasks()                  # if it crashes...
+#   wp = load('run.ckpt')
+#   wp.process_tasks()                  # ...it goes on from the last checkpoint
+#
+# Forks: several continuations of one warm-up, without running it again
+#   wp.process_tasks(until = 500)
+#   forks = [wp.fork(seed = k) for k in range(10)]
+######################################################################
+######################################################################
+
+import os
+import gzip
+import time
+import pickle
+import tempfile
+import numpy as np
+
+from agent import CountingRng
+from cache import SIMULATOR_VERSION
+
+class Checkpoints:
+    def __init__(self, path, every_cycles = None, every_seconds = None):
+        ''' Saves the workplace to path every every_cycles cycles and/or every
+            every_seconds seconds. path can contain {time} to keep all the
+            checkpoints ('run_{time}.ckpt').
+        '''
+        self.path = path
+        self.every_cycles = every_cycles
+        self.every_seconds = every_seconds
+
+        self.last_time = None       # Cycle of the last checkpoint
+        self.last_clock = None
+
+        self.saved = []
+
+    def start(self, wp):
+        check_task_source(wp.task_source)
+
+        self.last_time = wp.time
+        self.last_clock = time.monotonic()
+
+    def after_cycle(self, wp):
+        due = self.every_cycles is not None and wp.time - self.last_time >= self.every_cycles
+        due = due or self.every_seconds is not None and time.monotonic() - self.last_clock >= self.every_seconds
+
+        if due:
+            path = self.path.format(time = wp.time)
+            save(wp, path)
+            self.saved.append(path)
+
+            self.start(wp)
+
+    def __getstate__(self):
+        # The list of checkpoints already saved is not saved with them
+        state = self.__dict__.copy()
+        state['saved'] = []
+        return state
+
+# ---------- SAVING / LOADING ----------
+
+def check_task_source(task_source):
+    ''' Raises ValueError if a source of tasks (see Workplace.add_tasks)
+        cannot be saved in a checkpoint
+    '''
+    if task_source is None:
+        return
+
+    try:
+        pickle.dumps(task_source, protocol = pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError) as error:
+        raise ValueError('Runs with checkpoints need tasks that can be read again from where they were '
+                         '(a JSON lines file or a list), not from a ' + type(task_source.tasks).__name__ + \
+                         ' (' + str(error) + ')')
+
+def dumps(wp):
+    ''' State of wp as bytes (not compressed) '''
+    # Without seed, workplaces draw from numpy's global generator
+    global_rng = np.random.get_state() if wp.rng.rng is None else None
+
+    return pickle.dumps({'version': SIMULATOR_VERSION, 'workplace': wp, 'global_rng': global_rng},
+                        protocol = pickle.HIGHEST_PROTOCOL)
+
+def loads(data, restore_global_rng = True):
+    ''' Workplace from dumps(). The global random generator is put back as it
+        was (for workplaces without seed) unless restore_global_rng is False.
+    '''
+    state = pickle.loads(data)
+
+    if state['version'] != SIMULATOR_VERSION:
+        raise ValueError('Checkpoint of version ' + str(state['version']) + \
+                         ' (the simulator is version ' + str(SIMULATOR_VERSION) + ')')
+
+    if restore_global_rng and state['global_rng'] is not None:
+        np.random.set_state(state['global_rng'])
+
+    return state['workplace']
+
+def save(wp, path):
+    ''' Saves wp (between two cycles) to path '''
+    directory = os.path.dirname(os.path.abspath(path))
+
+    # Written to a temporary file first, so that a crash while saving does
+    # not destroy the previous checkpoint
+    fd, tmp_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(gzip.compress(dumps(wp), compresslevel = 6))
+    os.replace(tmp_path, path)
+
+def load(path, restore_global_rng = True, instrumentation = None):
+    ''' Workplace saved in path, ready to continue with process_tasks().
+        Instrumentation is not saved: a new one can be given (with
+        StreamSink(path, append = True) to go on writing the same file).
+    '''
+    with open(path, 'rb') as f:
+        wp = loads(gzip.decompress(f.read()), restore_global_rng)
+
+    wp.instrumentation = instrumentation
+    return wp
+
+# ---------- FORKS ----------
+
+def fork(wp, seed = None):
+    ''' Independent copy of wp. With seed, the copy gets its own random
+        generator; otherwise it continues wp's random numbers (numpy's
+        global ones if wp has no seed, so copies without seed are only
+        identical if run from the same global state).
+    '''
+    copy = loads(dumps(wp), restore_global_rng = False)
+
+    copy.checkpoints = None     # Do not overwrite the checkpoints (or output) of wp
+    copy.output = None
+    copy.instrumentation = None
+
+    if seed is not None:
+        copy.seed = seed
+        copy.rng = CountingRng(np.random.default_rng(seed))
+
+    return copy
+
+def forks(wp, seeds):
+    ''' One fork of wp per seed, all from the same state (computed once) '''
+    data = dumps(wp)
+
+    copies = []
+    for seed in seeds:
+        copy = loads(data, restore_global_rng = False)
+        copy.checkpoints = None
+        copy.output = None
+        copy.seed = seed
+        copy.rng = CountingRng(np.random.default_rng(seed))
+        copies.append(copy)
+
+    return copies
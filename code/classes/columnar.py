@@ -0,0 +1,250 @@
+######################################################################
+######################################################################
+# Small chunked columnar file format, used to store results of the
+# simulator (one row per run, per cycle...). It only depends on numpy.
+#
+# File layout:  MAGIC, then a sequence of records. Every record is
+#   [8 bytes: header length][json header][column data]
+# and the header tells the number of rows, and the dtype, shape and
+# position of every column in the data that follows. Records are
+# appended as results come in, so a file that was being written when
+# the program stopped is still readable up to its last full record.
+# A single column can be read (or memory mapped) without touching
+# the rest of the file. A record can also hold a few rows that repeat
+# (see ColumnWriter.repeat): they are stored once, and expanded when
+# the columns are read.
+######################################################################
+######################################################################
+
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = b'MSSSCOL1'
+ALIGNMENT = 64  # Column data starts at file offsets multiple of this
+
+class ColumnWriter:
+    def __init__(self, path, meta = None, chunk_rows = 1024, append = False):
+        ''' Opens path for writing. With append = True, an existing file is
+            continued (an incomplete last record is discarded). meta is a
+            json-serialisable dictionary stored in the file.
+        '''
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.columns = None     # Column names, fixed by the first record
+        self.pending = []       # Rows waiting to be written
+
+        if append and os.path.isfile(path) and os.path.getsize(path) > 0:
+            reader = ColumnReader(path)
+            self.columns = reader.columns if len(reader.columns) > 0 else None
+
+            self.f = open(path, 'r+b')
+            self.f.truncate(reader.end)
+            self.f.seek(reader.end)
+
+            if meta is not None and meta != reader.meta:
+                self.write_record({}, 0, meta)
+        else:
+            self.f = open(path, 'wb')
+            self.f.write(MAGIC)
+            self.write_record({}, 0, meta if meta is not None else {})
+
+    # ---------- WRITING ----------
+
+    def append_row(self, row):
+        ''' Adds a row (dictionary column -> value). Rows are written in
+            records of chunk_rows rows.
+        '''
+        self.pending.append(row)
+
+        if len(self.pending) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        ''' Writes the pending rows '''
+        if len(self.pending) > 0:
+            rows, self.pending = self.pending, []
+            self.write({name: [row[name] for row in rows] for name in rows[0]})
+
+        self.f.flush()
+
+    def write(self, columns):
+        ''' Writes a record with the given columns (dictionary name -> array).
+            All arrays must have the same length (number of rows).
+        '''
+        columns, n_rows = self.check(columns)
+        self.write_record(columns, n_rows)
+
+    def repeat(self, columns, n_rows, steps = {}):
+        ''' Writes a record of n_rows rows: the rows in columns over and over,
+            column name going up by steps[name] every time they start again
+            (e.g. times). Only the rows given are stored. Pending rows are
+            written first.
+        '''
+        self.flush()
+        columns, period = self.check(columns)
+        self.write_record(columns, n_rows, repeat = {'period': period, 'steps': steps})
+
+    def check(self, columns):
+        ''' Columns as arrays, and their number of rows '''
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+
+        if self.columns is None:
+            self.columns = list(columns)
+        elif set(columns) != set(self.columns):
+            raise ValueError('Columns do not match the ones already in ' + self.path)
+
+        n_rows = set(len(values) for values in columns.values())
+        if len(n_rows) != 1:
+            raise ValueError('All columns must have the same number of rows')
+
+        return columns, n_rows.pop()
+
+    def write_record(self, columns, n_rows, meta = None, repeat = None):
+        header = {'rows': n_rows, 'columns': {}}
+        if meta is not None:
+            header['meta'] = meta
+        if repeat is not None:
+            header['repeat'] = repeat
+
+        buffers = []
+        for name, values in columns.items():
+            if values.dtype.hasobject:
+                raise TypeError('Column ' + name + ' has no fixed size dtype')
+            buffers.append((name, np.ascontiguousarray(values)))
+
+        # Column offsets are relative to the start of the record data, but
+        # chosen so that the absolute position in the file is aligned. They
+        # depend on the length of the header, so room is reserved for it.
+        start = self.f.tell()
+        header_room = 256
+
+        while True:
+            data_start = start + 8 + header_room
+
+            offset = 0
+            for name, values in buffers:
+                offset += (-(data_start + offset)) % ALIGNMENT
+                header['columns'][name] = {'dtype': values.dtype.str,
+                                           'shape': list(values.shape[1:]),
+                                           'offset': offset,
+                                           'nbytes': values.nbytes}
+                offset += values.nbytes
+            header['nbytes'] = offset
+
+            header_bytes = json.dumps(header).encode()
+            if len(header_bytes) <= header_room:
+                break
+            header_room *= 2
+
+        header_bytes += b' ' * (header_room - len(header_bytes))
+
+        self.f.write(struct.pack('<Q', header_room))
+        self.f.write(header_bytes)
+        for name, values in buffers:
+            position = data_start + header['columns'][name]['offset']
+            self.f.write(b'\0' * (position - self.f.tell()))
+            self.f.write(values.tobytes())
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ColumnReader:
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.columns = []
+        self.records = []   # (rows, {name: (dtype, shape, absolute offset, nbytes)}, repeat)
+        self.end = len(MAGIC)
+
+        self.scan()
+
+    def scan(self):
+        ''' Reads the headers of all complete records '''
+        size = os.path.getsize(self.path)
+
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(self.path + ' is not a columnar results file')
+
+            while True:
+                position = f.tell()
+                length = f.read(8)
+                if len(length) < 8:
+                    break
+
+                header_room = struct.unpack('<Q', length)[0]
+                header_bytes = f.read(header_room)
+                if len(header_bytes) < header_room:
+                    break
+
+                header = json.loads(header_bytes.decode())
+                data_start = position + 8 + header_room
+                if data_start + header['nbytes'] > size:
+                    break
+
+                self.meta.update(header.get('meta', {}))
+                if header['rows'] > 0 or len(header['columns']) > 0:
+                    self.records.append((header['rows'],
+                                         {name: (np.dtype(c['dtype']), tuple(c['shape']),
+                                                 data_start + c['offset'], c['nbytes'])
+                                          for name, c in header['columns'].items()},
+                                         header.get('repeat')))
+                    if len(self.columns) == 0:
+                        self.columns = list(header['columns'])
+
+                self.end = data_start + header['nbytes']
+                f.seek(self.end)
+
+    # ---------- READING ----------
+
+    @property
+    def rows(self):
+        return sum(rows for rows, _, _ in self.records)
+
+    def read(self, name, mmap = False):
+        ''' Returns column name as an array. With mmap = True, the data of
+            each record is memory mapped instead of read.
+        '''
+        if name not in self.columns:
+            raise KeyError(name)
+
+        parts = []
+        with open(self.path, 'rb') as f:
+            for rows, columns, repeat in self.records:
+                dtype, shape, offset, nbytes = columns[name]
+
+                if repeat is not None:
+                    # Rows stored once, expanded
+                    f.seek(offset)
+                    period = repeat['period']
+                    pattern = np.frombuffer(f.read(nbytes), dtype = dtype).reshape((period,) + shape)
+                    ix = np.arange(rows)
+                    step = repeat['steps'].get(name, 0) * (ix // period)
+                    parts.append(pattern[ix % period] + step.reshape((rows,) + (1,) * len(shape)).astype(dtype))
+                elif mmap:
+                    parts.append(np.memmap(self.path, dtype = dtype, mode = 'r',
+                                           offset = offset, shape = (rows,) + shape)
+                                 if nbytes > 0 else np.zeros((rows,) + shape, dtype = dtype))
+                else:
+                    f.seek(offset)
+                    parts.append(np.frombuffer(f.read(nbytes), dtype = dtype).reshape((rows,) + shape))
+
+        if len(parts) == 1:
+            return parts[0]
+        if len(parts) == 0:
+            return np.zeros(0)
+
+        return np.concatenate(parts)
+
+    def read_all(self):
+        ''' Returns a dictionary with all the columns '''
+        return {name: self.read(name) for name in self.columns}
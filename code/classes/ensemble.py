@@ -0,0 +1,91 @@
+######################################################################
+######################################################################
+# Monte Carlo ensembles: R replicates of the same scenario, each one
+# with its own random stream spawned from a single seed (so that the
+# whole ensemble is reproducible), run in a pool of processes. Returns
+# the mean and confidence interval of the performance time and the
+# frustration of every agent, cycle by cycle.
+######################################################################
+######################################################################
+
+import os
+import numpy as np
+
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+from workplace import Workplace
+
+def run_replicate(data, seed, batch_negotiation = False):
+    ''' Runs one replicate. Returns its Tperf trajectory and the frustration
+        trajectory of every agent (one row per agent).
+    '''
+    wp = Workplace(data = data, seed = seed, batch_negotiation = batch_negotiation)
+    wp.process_tasks(output_moods = False)
+
+    t_perf = np.array(list(wp.Tperf.values()))
+    frustration = np.array([agent.frustration for agent in wp.agents])
+
+    return t_perf, frustration
+
+def confidence_interval(samples, confidence = 0.95):
+    ''' Mean and (normal approximation) confidence interval along the first
+        axis of samples (one entry per replicate)
+    '''
+    mean = samples.mean(axis = 0)
+
+    if len(samples) < 2:
+        return mean, mean.copy(), mean.copy()
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_width = z * samples.std(axis = 0, ddof = 1) / np.sqrt(len(samples))
+
+    return mean, mean - half_width, mean + half_width
+
+def run_ensemble(data, replicates, seed = None, workers = None, confidence = 0.95,
+                 target_width = None, batch_size = None, batch_negotiation = False):
+    ''' Runs up to replicates replicates of the scenario in data (contents of
+        an input file). Replicate k always uses the k-th stream spawned from
+        seed, whatever the number of workers.
+        If target_width is given, replicates are run in batches of batch_size
+        (default: number of workers) and the ensemble stops as soon as every
+        confidence interval (Tperf and frustration, at every cycle) is
+        narrower than target_width.
+        Returns a dictionary with 'replicates', and 'Tperf', 'frustration'
+        and 'sum_perf_time', each of them a dictionary with 'mean', 'low'
+        and 'high'.
+    '''
+    root = np.random.SeedSequence(seed)
+
+    t_perfs, frustrations = [], []
+
+    if batch_size is None:
+        batch_size = replicates if target_width is None else (workers or os.cpu_count())
+
+    with ProcessPoolExecutor(workers) as pool:
+        while len(t_perfs) < replicates:
+            n = min(batch_size, replicates - len(t_perfs))
+            seeds = root.spawn(n)
+
+            for t_perf, frustration in pool.map(run_replicate, [data] * n, seeds, [batch_negotiation] * n):
+                t_perfs.append(t_perf)
+                frustrations.append(frustration)
+
+            if target_width is not None:
+                widths = [high - low for _, low, high in
+                          [confidence_interval(np.array(t_perfs), confidence),
+                           confidence_interval(np.array(frustrations), confidence)]]
+
+                if len(t_perfs) >= 2 and max(np.max(w, initial = 0) for w in widths) < target_width:
+                    break
+
+    t_perfs, frustrations = np.array(t_perfs), np.array(frustrations)
+
+    result = {'replicates': len(t_perfs)}
+    for name, samples in [('Tperf', t_perfs),
+                          ('frustration', frustrations),
+                          ('sum_perf_time', t_perfs.sum(axis = 1))]:
+        mean, low, high = confidence_interval(samples, confidence)
+        result[name] = {'mean': mean, 'low': low, 'high': high}
+
+    return result
@@ -0,0 +1,359 @@
+######################################################################
+######################################################################
+# Compact histories. The simulator keeps, cycle after cycle, the
+# expertise and motivation of every skill, the frustration and times
+# of every agent, the performance of the workplace... By default
+# these are Python lists and dicts. The classes below store them in
+# growable numpy arrays instead, and can keep only part of them:
+#
+#   Retention('full')            every value
+#   Retention('decimate', k)     one value out of k (and the latest)
+#   Retention('ring', n)         the last n values
+#   Retention('summary')         only the latest value and running
+#                                statistics (count, sum, min, max)
+#
+# They behave like the lists/dicts they replace (h[-1], len(h),
+# np.array(h), h.values()...), so getters and plots work unchanged.
+# The latest value and the running statistics are always exact.
+#
+# A value pattern repeated many times (cycles skipped by a steady
+# state, see steady_state.py) is appended with repeat(): with full
+# retention it is kept as a run, and expanded when the values are read.
+######################################################################
+######################################################################
+
+import numpy as np
+
+from collections import namedtuple
+
+class Retention(namedtuple('Retention', ['kind', 'size'])):
+    ''' What a history keeps: kind is 'full', 'decimate' (size = k),
+        'ring' (size = n) or 'summary'
+    '''
+    __slots__ = ()
+
+    def __new__(cls, kind = 'full', size = None):
+        if kind not in ['full', 'decimate', 'ring', 'summary']:
+            raise ValueError('Unknown retention policy: ' + str(kind))
+        if kind in ['decimate', 'ring'] and (size is None or size < 1):
+            raise ValueError('Retention ' + kind + ' needs a size of at least 1')
+        return super().__new__(cls, kind, size)
+
+FULL = Retention('full')
+
+class History:
+    ''' List-like history of numbers '''
+    def __init__(self, initial = [], retention = FULL, dtype = float):
+        self.retention = retention
+        self.data = np.empty(16 if retention.kind != 'ring' else retention.size, dtype = dtype)
+        self.stored = 0     # Values in self.data
+        self.start = 0      # Position of the oldest value (ring buffer)
+
+        # Runs of repeated values (full retention), as (values of self.data
+        # before the run, pattern, step, number of values): see repeat
+        self.runs = []
+        self.run_values = 0
+
+        # Running statistics, over every value ever appended
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.last = None
+
+        for value in initial:
+            self.append(value)
+
+    # ---------- WRITING ----------
+
+    def append(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+        self.last = value
+
+        kind = self.retention.kind
+
+        if kind == 'full' or (kind == 'decimate' and (self.count - 1) % self.retention.size == 0):
+            self.store(value)
+        elif kind == 'ring':
+            if self.stored < len(self.data):
+                self.data[self.stored] = value
+                self.stored += 1
+            else:
+                self.data[self.start] = value
+                self.start = (self.start + 1) % len(self.data)
+        elif kind == 'summary':
+            self.data[0] = value
+            self.stored = 1
+
+    def extend(self, values):
+        if not isinstance(values, np.ndarray):
+            for value in values:
+                self.append(value)
+            return
+
+        # Arrays are appended at once: statistics and kept values with numpy
+        if len(values) == 0:
+            return
+
+        first = self.count    # Number of values before these
+        self.count += len(values)
+        self.sum += values.sum().item()
+        self.update_range(values.min().item(), values.max().item())
+        self.last = values[-1].item()
+
+        self.keep(values, first)
+
+    def repeat(self, pattern, n, step = 0):
+        ''' Appends n values: pattern over and over, its values going up by
+            step every time it starts again (e.g. times). Only the pattern
+            is kept with full retention.
+        '''
+        if n == 0:
+            return
+
+        pattern = np.asarray(pattern, dtype = self.data.dtype)
+        rounds, rest = divmod(n, len(pattern))
+
+        first = self.count
+        self.count += n
+        self.sum += (pattern.sum() * rounds + step * len(pattern) * (rounds * (rounds - 1) // 2) +
+                     pattern[:rest].sum() + step * rounds * rest).item()
+
+        # Values move linearly from round to round: the extremes are in the first or last ones
+        ends = np.concatenate([pattern[:n], pattern + step * (rounds - 1) if rounds > 0 else pattern[:0],
+                               pattern[:rest] + step * rounds])
+        self.update_range(ends.min().item(), ends.max().item())
+        self.last = (pattern[(n - 1) % len(pattern)] + step * ((n - 1) // len(pattern))).item()
+
+        kind = self.retention.kind
+
+        if kind == 'full':
+            self.runs.append((self.stored, pattern, step, n))
+            self.run_values += n
+        elif kind == 'ring':
+            start = max(0, n - len(self.data))
+            self.keep(run_values(pattern, step, start, n), first + start)
+        elif kind == 'decimate':
+            self.keep(run_values(pattern, step, 0, n), first)
+        elif kind == 'summary':
+            self.data[0] = self.last
+            self.stored = 1
+
+    def update_range(self, low, high):
+        self.min = low if self.min is None or low < self.min else self.min
+        self.max = high if self.max is None or high > self.max else self.max
+
+    def keep(self, values, first):
+        ''' Stores what the retention policy keeps of values (an array), the
+            first of them being value number first
+        '''
+        kind = self.retention.kind
+
+        if kind == 'full':
+            self.store_many(values)
+        elif kind == 'decimate':
+            self.store_many(values[(-first) % self.retention.size::self.retention.size])
+        elif kind == 'ring':
+            values = values[-len(self.data):]
+            free = min(len(self.data) - self.stored, len(values))
+            self.data[self.stored:self.stored + free] = values[:free]
+            self.stored += free
+
+            values = values[free:]
+            self.data[(self.start + np.arange(len(values))) % len(self.data)] = values
+            self.start = (self.start + len(values)) % len(self.data)
+        elif kind == 'summary':
+            self.data[0] = values[-1]
+            self.stored = 1
+
+    def store(self, value):
+        if self.stored == len(self.data):
+            self.data = np.resize(self.data, 2 * len(self.data))
+        self.data[self.stored] = value
+        self.stored += 1
+
+    def store_many(self, values):
+        if self.stored + len(values) > len(self.data):
+            self.data = np.resize(self.data, max(self.stored + len(values), 2 * len(self.data)))
+        self.data[self.stored:self.stored + len(values)] = values
+        self.stored += len(values)
+
+    # ---------- READING ----------
+
+    def array(self):
+        ''' Values kept, oldest first '''
+        if len(self.runs) > 0:
+            parts, stored = [], 0
+            for position, pattern, step, n in self.runs:
+                parts += [self.data[stored:position], run_values(pattern, step, 0, n)]
+                stored = position
+            return np.concatenate(parts + [self.data[stored:self.stored]])
+
+        if self.start == 0:
+            return self.data[:self.stored].copy()
+        return np.concatenate([self.data[self.start:self.stored], self.data[:self.start]])
+
+    def tail(self, n):
+        ''' The last n values appended (they must have been kept) '''
+        kind = self.retention.kind
+
+        if n == 0:
+            return []
+        if n == 1 and self.count > 0:
+            return [self.last]
+        if kind == 'full' and (len(self.runs) == 0 or n <= self.stored - self.runs[-1][0]):
+            return self.data[self.stored - n:self.stored].tolist()
+        if kind == 'full':
+            return self.array()[-n:].tolist()
+        if kind == 'ring' and n <= self.stored:
+            return self.data[(self.start + self.stored - n + np.arange(n)) % len(self.data)].tolist()
+
+        raise ValueError('The last ' + str(n) + ' values are not kept with retention ' + kind)
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'mean': self.sum / self.count if self.count > 0 else None, 'last': self.last}
+
+    def __len__(self):
+        return self.stored + self.run_values
+
+    def __getitem__(self, ix):
+        # The latest value is always known, even if it was not kept
+        if isinstance(ix, int) and ix == -1 and self.count > 0:
+            return self.last
+
+        values = self.array()[ix]
+        return values.tolist() if isinstance(ix, slice) else values.item()
+
+    def __iter__(self):
+        return iter(self.array().tolist())
+
+    def __array__(self, dtype = None, copy = None):
+        values = self.array()
+        return values if dtype is None else values.astype(dtype)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple)) and len(other) == 0:
+            return self.count == 0
+        return list(self) == list(other)
+
+    def __str__(self):
+        return str(list(self))
+
+    __repr__ = __str__
+
+class KeyedHistory:
+    ''' Dict-like history of numbers indexed by (increasing) time '''
+    def __init__(self, retention = FULL, dtype = float):
+        self.keys_history = History(retention = retention, dtype = np.int64)
+        self.values_history = History(retention = retention, dtype = dtype)
+
+    def __setitem__(self, key, value):
+        if self.keys_history.count > 0 and key == self.keys_history.last:
+            raise KeyError('Time ' + str(key) + ' already has a value')
+        self.keys_history.append(key)
+        self.values_history.append(value)
+
+    def repeat(self, keys, values, n, key_step):
+        ''' Sets n values at once: values over and over, at keys going up by
+            key_step every time they start again (see History.repeat)
+        '''
+        self.keys_history.repeat(keys, n, key_step)
+        self.values_history.repeat(values, n)
+
+    def __getitem__(self, key):
+        if self.keys_history.count > 0 and key == self.keys_history.last:
+            return self.values_history.last
+
+        keys = self.keys_history.array()
+        ix = np.searchsorted(keys, key)
+        if ix == len(keys) or keys[ix] != key:
+            raise KeyError(key)
+        return self.values_history.array()[ix].item()
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return len(self.values_history)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.keys_history.array()
+
+    def values(self):
+        return self.values_history.array()
+
+    def items(self):
+        return zip(self.keys().tolist(), self.values().tolist())
+
+    def total(self):
+        ''' Sum of all the values ever set '''
+        return self.values_history.sum
+
+    def summary(self):
+        return self.values_history.summary()
+
+class RecordHistory:
+    ''' List-like history of dictionaries with the same integer fields
+        (like the actions in Agent.action_history)
+    '''
+    def __init__(self, fields, retention = FULL):
+        self.fields = fields
+        self.columns = {field: History(retention = retention, dtype = np.int64) for field in fields}
+
+    def append(self, record):
+        for field in self.fields:
+            self.columns[field].append(record[field])
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def repeat(self, records, n, steps = {}):
+        ''' Appends n records: records over and over, field f going up by
+            steps[f] every time they start again (see History.repeat)
+        '''
+        for field in self.fields:
+            self.columns[field].repeat([record[field] for record in records], n, steps.get(field, 0))
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return list(self)[ix]
+        return {field: self.columns[field][ix] for field in self.fields}
+
+    def __iter__(self):
+        columns = [self.columns[field].array().tolist() for field in self.fields]
+        return (dict(zip(self.fields, values)) for values in zip(*columns))
+
+    def __str__(self):
+        return str(list(self))
+
+    __repr__ = __str__
+
+def run_values(pattern, step, start, stop):
+    ''' Values start to stop of a run (see History.repeat) '''
+    ix = np.arange(start, stop)
+    return pattern[ix % len(pattern)] + step * (ix // len(pattern))
+
+def history_sum(series):
+    ''' Sum of a series of values: a dict (or KeyedHistory), a list (or History) '''
+    if isinstance(series, KeyedHistory):
+        return series.total()
+    if isinstance(series, History):
+        return series.sum
+    if isinstance(series, dict):
+        return sum(series.values())
+    return sum(series)
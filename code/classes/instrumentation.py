@@ -0,0 +1,256 @@
+######################################################################
+######################################################################
+# Instrumentation of a Workplace: time spent in every phase of a
+# cycle (allocation, performance times, flush_prev_act, update_memory,
+# bookkeeping, steady state jumps) and counters (negotiations,
+# negotiation steps, negotiations that reached MAX_COORD_STEPS,
+# timeline events, cycles skipped by steady_state.SteadyState). It is
+# opt-in: Workplace(file, instrumentation = Instrumentation(sinks)).
+# Without it, the simulator only checks for it a few times per cycle.
+#
+# Every cycle (and every steady state jump) produces a flat record
+# (dictionary) that is passed to the sinks: SummarySink keeps them in
+# memory, StreamSink writes them to a CSV or JSONL file, ProfileSink
+# runs cProfile and/or tracemalloc while the workplace works. Sinks
+# are started once: a run done in several process_tasks calls (with
+# until) pauses and resumes them, and they are stopped when the
+# workplace has processed all its tasks.
+######################################################################
+######################################################################
+
+import csv
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+
+PHASES = ['allocation', 'performance', 'flush_prev_act', 'update_memory', 'bookkeeping', 'steady_state']
+COUNTERS = ['actions', 'negotiations', 'negotiation_steps', 'capped_negotiations', 'events', 'skipped_cycles']
+
+class Instrumentation:
+    def __init__(self, sinks = None):
+        self.sinks = [] if sinks is None else list(sinks)
+
+        # Totals over all the cycles
+        self.cycles = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+        self.record = None
+        self.last = None
+        self.state = None           # None (not started yet), 'running', 'paused' or 'stopped'
+        self.steady_seconds = 0.0   # Steady state attempts not in a record yet
+
+    # ---------- RUN ----------
+
+    def start(self):
+        ''' Called when the workplace starts (or goes on) processing tasks '''
+        if self.state is None:
+            for sink in self.sinks:
+                sink.start()
+        elif self.state == 'paused':
+            for sink in self.sinks:
+                sink.resume()
+
+        if self.state != 'stopped':
+            self.state = 'running'
+
+    def pause(self):
+        ''' Called when the workplace stops before processing all its tasks '''
+        if self.state == 'running':
+            for sink in self.sinks:
+                sink.pause()
+            self.state = 'paused'
+
+    def stop(self):
+        ''' Called when the workplace has processed all its tasks '''
+        if self.state in [None, 'stopped']:
+            return
+
+        self.seconds['steady_state'] += self.steady_seconds
+        self.steady_seconds = 0.0
+
+        summary = self.summary()
+
+        for sink in self.sinks:
+            sink.stop(summary)
+
+        self.state = 'stopped'
+
+    # ---------- CYCLES ----------
+
+    def begin_cycle(self):
+        self.record = dict.fromkeys([phase + '_seconds' for phase in PHASES], 0.0)
+        self.record.update(dict.fromkeys(COUNTERS, 0))
+        self.last = time.perf_counter()
+
+        # Steady state attempts since the last record go to this one
+        self.record['steady_state_seconds'] = self.steady_seconds
+        self.steady_seconds = 0.0
+
+    def lap(self, phase):
+        ''' Time since the previous lap (or the beginning of the cycle) goes to phase '''
+        now = time.perf_counter()
+        self.record[phase + '_seconds'] += now - self.last
+        self.last = now
+
+    def count(self, counter, n = 1):
+        if self.record is not None:
+            self.record[counter] += n
+
+    def count_negotiation(self, steps, max_steps):
+        ''' A negotiation took steps (unscaled) steps '''
+        if self.record is not None:
+            self.record['negotiations'] += 1
+            self.record['negotiation_steps'] += steps
+            self.record['capped_negotiations'] += steps > 0 and steps >= max_steps
+
+    def steady_state(self, seconds, segment = None, task_id = None):
+        ''' A steady state jump was tried, for seconds. If it was done (the
+            cycles of steady_state.Segment segment were skipped), they get a
+            record of their own.
+        '''
+        self.steady_seconds += seconds
+
+        if segment is not None:
+            self.begin_cycle()
+            self.record['skipped_cycles'] = segment.cycles
+            self.end_cycle(segment.start_time, task_id, segment.cycles)
+
+    def end_cycle(self, time, task_id, cycles = 1):
+        record = dict(time = time, task = task_id, **self.record)
+
+        self.cycles += cycles
+        for phase in PHASES:
+            self.seconds[phase] += record[phase + '_seconds']
+        for counter in COUNTERS:
+            self.counters[counter] += record[counter]
+
+        for sink in self.sinks:
+            sink.cycle(record)
+
+        self.record = None
+
+    # ---------- RESULTS ----------
+
+    def summary(self):
+        ''' Totals: cycles, seconds per phase, counters '''
+        summary = {'cycles': self.cycles, 'seconds': dict(self.seconds), 'total_seconds': sum(self.seconds.values())}
+        summary.update(self.counters)
+        return summary
+
+    def __str__(self):
+        summary = self.summary()
+        total = summary['total_seconds'] or 1
+
+        lines = ['{} cycles, {:.4f} s'.format(summary['cycles'], summary['total_seconds'])]
+        lines += ['  {:16s}{:10.4f} s {:6.1f}%'.format(phase, seconds, 100 * seconds / total)
+                  for phase, seconds in summary['seconds'].items()]
+        lines += ['  {:20s}{}'.format(counter, summary[counter]) for counter in COUNTERS]
+
+        return '\n'.join(lines)
+
+# ---------- SINKS ----------
+# A sink has start(), cycle(record), pause(), resume() and stop(summary)
+
+class Sink:
+    def start(self):
+        pass
+
+    def cycle(self, record):
+        pass
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def stop(self, summary):
+        pass
+
+class SummarySink(Sink):
+    ''' Keeps every cycle record, and the summary of the run, in memory '''
+    def __init__(self):
+        self.records = []
+        self.summary = None
+
+    def cycle(self, record):
+        self.records.append(record)
+
+    def stop(self, summary):
+        self.summary = summary
+
+class StreamSink(Sink):
+    ''' Writes every cycle record to a file, as CSV or JSONL (from the extension
+        of path, unless format is given). The file stays open until the run
+        ends. With append, records go after the ones already in the file
+        (e.g. for a run resumed from a checkpoint).
+    '''
+    def __init__(self, path, format = None, append = False):
+        self.path = path
+        self.format = format if format is not None else ('csv' if path.endswith('.csv') else 'jsonl')
+        self.append = append
+        self.f = None
+        self.writer = None
+
+    def start(self):
+        self.f = open(self.path, 'a' if self.append else 'w', newline = '')
+        if self.format == 'csv':
+            self.writer = csv.DictWriter(self.f, ['time', 'task'] + [phase + '_seconds' for phase in PHASES] + COUNTERS)
+            if self.f.tell() == 0:
+                self.writer.writeheader()
+
+    def cycle(self, record):
+        if self.format == 'csv':
+            self.writer.writerow(record)
+        else:
+            self.f.write(json.dumps(record) + '\n')
+
+    def pause(self):
+        self.f.flush()
+
+    def stop(self, summary):
+        self.f.close()
+
+class ProfileSink(Sink):
+    ''' Runs cProfile (profile = True) and/or tracemalloc (memory = True)
+        while the workplace works (the profiler is paused between calls
+        to process_tasks, tracemalloc goes on). Afterwards, stats has the pstats.Stats of
+        the run (also saved to path, if given) and peak_bytes the peak of
+        traced memory.
+    '''
+    def __init__(self, profile = True, memory = False, path = None):
+        self.profile = profile
+        self.memory = memory
+        self.path = path
+
+        self.profiler = None
+        self.stats = None
+        self.peak_bytes = None
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def pause(self):
+        if self.profile:
+            self.profiler.disable()
+
+    def resume(self):
+        if self.profile:
+            self.profiler.enable()
+
+    def stop(self, summary):
+        if self.profile:
+            self.profiler.disable()
+            self.stats = pstats.Stats(self.profiler)
+            if self.path is not None:
+                self.stats.dump_stats(self.path)
+        if self.memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
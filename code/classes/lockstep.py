@@ -0,0 +1,315 @@
+######################################################################
+######################################################################
+# Lockstep engine: K independent two-agent workplaces held as numpy
+# arrays (expertise[K, agent, skill], frustration[K, agent], action
+# completion[K, task, action]...) instead of Workplace/Agent/Skill
+# objects, and advanced one cycle at a time all together. Every cycle
+# does, for all the workplaces at once, what Workplace.process_tasks
+# does for one: initial I/YOU, negotiation, scaling and frustration
+# (action by action), performance times and learning/forgetting. The
+# arithmetic is the same, operation by operation, so the results of
+# every workplace are the same as with the object engine (with the
+# same seed).
+#
+# Used by sweep.py (--engine lockstep) to run thousands of configurations.
+######################################################################
+######################################################################
+
+import math
+import numpy as np
+
+from agent import Agent, negotiate_batch_steps, random_int
+from relationships import RelationshipMatrix
+import my_parameters as P
+
+MOV_AVG_FACTOR = 0.8    # As in Agent.update_frustration
+HARD_LIMITER = 0.1      # As in agent.immediate_frustration
+
+class LockstepEngine:
+    def __init__(self, datas, seeds = None, record = True):
+        ''' datas: contents of the input files of the workplaces (two agents
+            each). seeds: one per workplace (numpy's global random state is
+            used if None). With record = True, the performance times and the
+            frustration of every cycle are kept (see result).
+        '''
+        n = len(datas)
+
+        self.params = [P.Parameters.from_dict(data['parameters']) for data in datas]
+        self.rngs = [None] * n if seeds is None else [np.random.default_rng(seed) for seed in seeds]
+
+        # Parameters of every workplace, one array per field
+        self.p = {field: np.array([getattr(params, field) for params in self.params])
+                  for field in P.Parameters._fields if field != 'MBTI'}
+
+        # ---------- AGENTS ----------
+        for data in datas:
+            if len(data['agents']) != 2:
+                raise ValueError('The lockstep engine only runs workplaces of two agents')
+
+        n_skills = max(len(agent['skillset']) for data in datas for agent in data['agents'])
+
+        self.expertise = np.zeros((n, 2, n_skills))
+        self.motivation = np.zeros((n, 2, n_skills))
+        self.frustration = np.zeros((n, 2))
+        self.has_frustration = np.zeros((n, 2), dtype=bool)
+        self.r_ij = np.zeros(n)
+
+        for k, (data, params) in enumerate(zip(datas, self.params)):
+            agents = []
+            for a, agent in enumerate(data['agents']):
+                for skill in agent['skillset']:
+                    self.expertise[k, a, skill['id']] = skill['exp']
+                    self.motivation[k, a, skill['id']] = skill['mot']
+
+                if agent.get('initial_frustration') is not None:
+                    self.frustration[k, a] = agent['initial_frustration']
+                    self.has_frustration[k, a] = True
+
+                agents.append(Agent(a, mbti = agent.get('mbti'), params = params))
+
+            self.r_ij[k] = RelationshipMatrix(agents, params, data.get('relationships')).get(0, 1)
+
+        # ---------- TASKS ----------
+        self.n_tasks = np.array([len(data['tasks']) for data in datas])
+        n_actions = max([len(task['actions']) for data in datas for task in data['tasks']] + [0])
+
+        self.skill_id = np.zeros((n, max(self.n_tasks.max(initial = 0), 1), n_actions), dtype=int)
+        self.duration = np.zeros(self.skill_id.shape)   # Padding: no duration, never pending
+        self.completion = np.zeros(self.skill_id.shape, dtype=int)
+
+        for k, data in enumerate(datas):
+            for t, task in enumerate(data['tasks']):
+                for j, action in enumerate(task['actions']):
+                    self.skill_id[k, t, j] = action['skill_id']
+                    self.duration[k, t, j] = action['duration']
+
+        self.current_task = np.zeros(n, dtype=int)
+
+        # ---------- RESULTS ----------
+        self.time = np.zeros(n, dtype=int)
+        self.sum_perf_time = np.zeros(n)
+        self.total_coordination_time = np.zeros(n)
+
+        self.record = record
+        self.history = []   # Per cycle: (workplaces, Tperf, coordination time, frustration)
+
+    def __len__(self):
+        return len(self.params)
+
+    # ---------- SIMULATION ----------
+
+    def run(self):
+        ''' Runs every workplace until all its tasks are done '''
+        while self.step() > 0:
+            pass
+
+        return self
+
+    def step(self):
+        ''' Advances every unfinished workplace by one cycle. Returns the
+            number of workplaces that took part in it.
+        '''
+        ks = self.start_cycle()
+        if len(ks) == 0:
+            return 0
+
+        tasks = self.current_task[ks]
+        pending = self.completion[ks, tasks] < self.duration[ks, tasks]   # [workplace, action]
+        skills = self.skill_id[ks, tasks]
+
+        # Negotiations of the cycle, ordered by workplace and then by action
+        rows, slots = np.nonzero(pending)
+        lane_k, lane_skill = ks[rows], skills[rows, slots]
+
+        i0, you0 = self.initial_i_you(lane_k, 0, lane_skill)
+        i1, you1 = self.initial_i_you(lane_k, 1, lane_skill)
+
+        winners, steps = self.negotiate(lane_k, i0, you0, i1, you1)
+
+        # Allocation time and frustration change action by action
+        coordination = np.zeros(len(ks))
+
+        for j in range(pending.shape[1]):
+            lanes = np.flatnonzero(slots == j)
+            if len(lanes) == 0:
+                continue
+
+            k = lane_k[lanes]
+            allocation_time = self.scale_allocation_time(k, steps[lanes])
+
+            frustration = self.immediate_frustration(k, allocation_time)
+            has = self.has_frustration[k]
+            self.frustration[k] = np.where(has, MOV_AVG_FACTOR * self.frustration[k] +
+                                                (1-MOV_AVG_FACTOR) * frustration[:, None],
+                                           self.frustration[k])
+
+            coordination[rows[lanes]] += allocation_time
+            self.completion[k, tasks[rows[lanes]], j] += 1
+
+        # Performance time of every agent: its actions, in order
+        performance = np.zeros((len(ks), 2))
+        frustration = np.where(self.has_frustration, self.frustration, -1)
+
+        for j in range(pending.shape[1]):
+            lanes = np.flatnonzero(slots == j)
+            if len(lanes) == 0:
+                continue
+
+            k, winner, skill = lane_k[lanes], winners[lanes], lane_skill[lanes]
+            p = {field: self.p[field][k] for field in ['TASK_UNIT_DURATION', 'ALPHA_E', 'ALPHA_M', 'ALPHA_F',
+                                                       'MAX_E', 'MAX_M', 'MAX_H']}
+
+            performance[rows[lanes], winner] += \
+                p['TASK_UNIT_DURATION'] / ((p['ALPHA_E'] * self.expertise[k, winner, skill] / p['MAX_E']) +
+                                           (p['ALPHA_M'] * self.motivation[k, winner, skill] / p['MAX_M']) +
+                                           (p['ALPHA_F'] * frustration[k, winner] / p['MAX_H']))
+
+        t_perf = np.maximum(performance[:, 0], performance[:, 1]) + coordination
+
+        self.sum_perf_time[ks] += t_perf
+        self.total_coordination_time[ks] += coordination
+
+        if self.record:
+            self.history.append((ks, t_perf, coordination, frustration[ks]))
+
+        # Skills used in this cycle are learnt, the rest forgotten
+        learn = np.zeros((len(ks), 2, self.expertise.shape[2]), dtype=bool)
+        learn[rows, winners, lane_skill] = True
+        self.update_memory(ks, learn)
+
+        self.time[ks] += 1
+
+        return len(ks)
+
+    def start_cycle(self):
+        ''' Moves every workplace to its first task with pending actions.
+            Returns the workplaces that still have work to do.
+        '''
+        while True:
+            ks = np.flatnonzero(self.current_task < self.n_tasks)
+            tasks = self.current_task[ks]
+
+            done = ks[~(self.completion[ks, tasks] < self.duration[ks, tasks]).any(axis = 1)]
+            if len(done) == 0:
+                return ks
+
+            self.current_task[done] += 1
+
+    # ---------- VECTORISED AGENT FUNCTIONS ----------
+    # Same operations as their counterparts in agent.py, for many
+    # workplaces (k) at once
+
+    def initial_i_you(self, k, agent, skill):
+        ''' Agent.get_initial_i_you '''
+        exp = self.expertise[k, agent, skill]
+        mot = self.motivation[k, agent, skill]
+
+        TH_E, TH_M, MAX_E, MAX_M = self.p['TH_E'][k], self.p['TH_M'][k], self.p['MAX_E'][k], self.p['MAX_M'][k]
+
+        factor = 1 / (self.p['ALPHA_E'][k] + self.p['ALPHA_M'][k])
+
+        ALPHA_E = self.p['ALPHA_E'][k] * factor
+        ALPHA_M = self.p['ALPHA_M'][k] * factor
+
+        sufficient_mot = mot >= TH_M
+
+        i = np.where(sufficient_mot,
+                     ALPHA_E * (exp - TH_E) / (MAX_E - TH_E) + ALPHA_M * (mot - TH_M) / (MAX_M - TH_M),
+                     ALPHA_E * (exp - TH_E) / (MAX_E - TH_E))
+        you = np.where(sufficient_mot, 0, ALPHA_M * (TH_M - mot) / TH_M)
+
+        # Insufficient expertise
+        i = np.where(exp < TH_E, 0, i)
+        you = np.where(exp < TH_E, 1, you)
+
+        return i, you
+
+    def negotiate(self, k, i0, you0, i1, you1):
+        ''' agent.negotiate_batch, with the parameters and random stream of
+            every workplace
+        '''
+        max_steps = self.p['MAX_COORD_STEPS'][k]
+        params = self.params[0]._replace(MAX_COORD_STEPS = int(max_steps.max(initial = 0)))
+
+        winners, steps = negotiate_batch_steps(i0, you0, i1, you1, self.p['INHIBIT'][k], self.p['EXCITE'][k],
+                                               params)
+
+        # Negotiations that reached their own maximum are decided at random,
+        # in order of action within every workplace
+        capped = steps >= max_steps
+        steps = np.where(capped, max_steps, steps)
+
+        for lane in np.flatnonzero(capped):
+            winners[lane] = 0 if random_int(self.rngs[k[lane]], 2) else 1
+
+        return winners, steps
+
+    def scale_allocation_time(self, k, allocation_time):
+        ''' agent.scale_allocation_time '''
+        r_ij, MAX_H = self.r_ij[k], self.p['MAX_H'][k]
+        f0 = np.where(self.has_frustration[k, 0], self.frustration[k, 0], -1)
+        f1 = np.where(self.has_frustration[k, 1], self.frustration[k, 1], -1)
+
+        MAX_DELTA = np.where((r_ij == -1) | (f0 == -1) | (f1 == -1), 0, 0.5)
+
+        return allocation_time * (1 + MAX_DELTA * ((-(r_ij - 0.5)/0.5 + (f0 - MAX_H/2)/(MAX_H/2) + (f1 - MAX_H/2)/(MAX_H/2)) / 3))
+
+    def immediate_frustration(self, k, alloc_time):
+        ''' agent.immediate_frustration (the same for both agents) '''
+        r_ij, MAX_H = self.r_ij[k], self.p['MAX_H'][k]
+        MAX_COORD_STEPS, BETA = self.p['MAX_COORD_STEPS'][k], self.p['BETA'][k]
+
+        personality = (1 - r_ij) / r_ij
+
+        limit = np.round(MAX_COORD_STEPS * HARD_LIMITER)
+        alloc_time = np.where(alloc_time < limit, alloc_time, limit - 1)
+        coord_penalty = (alloc_time / (MAX_COORD_STEPS / 10)) / \
+                        (1 - (alloc_time / (MAX_COORD_STEPS / 10)))
+
+        # math.exp, not np.exp: they can differ in the last bit
+        exponential = np.array([math.exp(x) for x in (-BETA * personality * coord_penalty).tolist()])
+
+        return MAX_H * (1 - exponential)
+
+    def update_memory(self, ks, learn):
+        ''' Agent.update_memory: skills in learn are learnt, the rest forgotten '''
+        p = {field: self.p[field][ks, None, None] for field in ['LAM_LEARN', 'LAM_MOTIV', 'MU_LEARN', 'MU_MOTIV',
+                                                                 'MAX_E', 'MAX_M']}
+        exp, mot = self.expertise[ks], self.motivation[ks]
+
+        self.expertise[ks] = np.where(learn,
+                                      exp + p['LAM_LEARN'] * ( (p['MAX_E'] - exp) / p['MAX_E']),
+                                      ((exp - p['MU_LEARN']) * p['MAX_E']) / (p['MAX_E'] - p['MU_LEARN']))
+        self.motivation[ks] = np.where(learn,
+                                       ((mot - p['MU_MOTIV']) * p['MAX_M']) / (p['MAX_M'] - p['MU_MOTIV']),
+                                       mot + p['LAM_MOTIV'] * ( (p['MAX_M'] - mot) / p['MAX_M']))
+
+    # ---------- RESULTS ----------
+
+    def summaries(self):
+        ''' Same summary as sweep.summarise, for every workplace (arrays) '''
+        frustration = np.where(self.has_frustration, self.frustration, -1)
+
+        return {'sum_perf_time': np.round(self.sum_perf_time).astype(int),
+                'total_coordination_time': self.total_coordination_time.copy(),
+                'cycles': self.time.copy(),
+                'final_frustration_0': frustration[:, 0],
+                'final_frustration_1': frustration[:, 1]}
+
+    def result(self, k):
+        ''' Trajectories of workplace k: Tperf and coordination time of every
+            cycle, frustration of both agents at the end of every cycle, and
+            final expertise and motivation
+        '''
+        t_perf, coordination, frustration = [], [], []
+
+        for ks, cycle_t_perf, cycle_coordination, cycle_frustration in self.history:
+            row = np.searchsorted(ks, k)
+            if row < len(ks) and ks[row] == k:
+                t_perf.append(cycle_t_perf[row])
+                coordination.append(cycle_coordination[row])
+                frustration.append(cycle_frustration[row])
+
+        return {'Tperf': np.array(t_perf), 'coordination_times': np.array(coordination),
+                'frustration': np.array(frustration).reshape(-1, 2),
+                'expertise': self.expertise[k].copy(), 'motivation': self.motivation[k].copy()}
@@ -0,0 +1,146 @@
+######################################################################
+######################################################################
+# Memo of negotiation outcomes. A negotiation only depends on the
+# initial I/YOU of the agents (and on inhibit, excite and the maximum
+# number of steps), and once expertise and motivation saturate the
+# same initial values come back cycle after cycle. The raw outcome
+# (chosen agent and number of steps, before the relationship and
+# frustration scaling) is remembered for the most recent ones.
+# Negotiations that reached the maximum number of steps are decided
+# at random, so for them only the number of steps is reused and the
+# agent is drawn again, exactly as negotiating again would do.
+######################################################################
+######################################################################
+
+import numpy as np
+
+from collections import OrderedDict
+
+from agent import negotiate_raw, negotiate_batch_steps, random_int
+from multi_agent import negotiate_n
+import my_parameters as P
+
+class NegotiationMemo:
+    def __init__(self, maxsize = 4096):
+        self.maxsize = maxsize
+        self.results = OrderedDict()    # key -> (agent, steps), least recently used first
+
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- LRU ----------
+
+    def get(self, key):
+        ''' Remembered result for key (None if there is none) '''
+        result = self.results.get(key)
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last = False)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.results), 'maxsize': self.maxsize}
+
+    def clear(self):
+        self.results.clear()
+        self.hits = self.misses = 0
+
+    # ---------- NEGOTIATIONS ----------
+    # Same arguments and results as the functions they replace
+
+    def negotiate_raw(self, i0, you0, i1, you1, inhibit = None, excite = None,
+                      params = P.DEFAULT_PARAMETERS, rng = None):
+        ''' agent.negotiate_raw, remembered '''
+        inhibit = params.INHIBIT if inhibit is None else inhibit
+        excite = params.EXCITE if excite is None else excite
+
+        key = (i0, you0, i1, you1, inhibit, excite, params.MAX_COORD_STEPS)
+        result = self.get(key)
+
+        if result is None:
+            result = negotiate_raw(i0, you0, i1, you1, inhibit, excite, params, rng)
+            self.put(key, result)
+            return result
+
+        agent, allocation_time = result
+        if capped(allocation_time, params):
+            agent = 0 if random_int(rng, 2) else 1
+
+        return agent, allocation_time
+
+    def negotiate_batch(self, i0, you0, i1, you1, inhibit = None, excite = None,
+                        params = P.DEFAULT_PARAMETERS, rng = None):
+        ''' agent.negotiate_batch, remembered. Only the negotiations that are
+            not remembered (each different one once) are run.
+        '''
+        inhibit = params.INHIBIT if inhibit is None else inhibit
+        excite = params.EXCITE if excite is None else excite
+
+        keys = [(lane_i0, lane_you0, lane_i1, lane_you1, inhibit, excite, params.MAX_COORD_STEPS)
+                for lane_i0, lane_you0, lane_i1, lane_you1 in zip(i0, you0, i1, you1)]
+
+        results = {}
+        to_negotiate = []
+        for lane, key in enumerate(keys):
+            if key in results:
+                self.hits += 1     # Same negotiation earlier in this batch
+                continue
+            results[key] = self.get(key)
+            if results[key] is None:
+                to_negotiate.append(lane)
+
+        if len(to_negotiate) > 0:
+            agents, allocation_times = negotiate_batch_steps([i0[lane] for lane in to_negotiate],
+                                                             [you0[lane] for lane in to_negotiate],
+                                                             [i1[lane] for lane in to_negotiate],
+                                                             [you1[lane] for lane in to_negotiate],
+                                                             inhibit, excite, params)
+            for lane, agent, allocation_time in zip(to_negotiate, agents, allocation_times):
+                results[keys[lane]] = (int(agent), int(allocation_time))
+                self.put(keys[lane], results[keys[lane]])
+
+        agents = np.zeros(len(keys), dtype=int)
+        allocation_times = np.zeros(len(keys), dtype=int)
+
+        # Random decisions in lane order, as in negotiate_batch
+        for lane, key in enumerate(keys):
+            agent, allocation_time = results[key]
+            if capped(allocation_time, params):
+                agent = 0 if random_int(rng, 2) else 1
+            agents[lane], allocation_times[lane] = agent, allocation_time
+
+        return agents, allocation_times
+
+    def negotiate_n(self, i, you, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS, rng = None):
+        ''' multi_agent.negotiate_n, remembered '''
+        inhibit = params.INHIBIT if inhibit is None else inhibit
+        excite = params.EXCITE if excite is None else excite
+
+        key = (tuple(i), tuple(you), inhibit, excite, params.MAX_COORD_STEPS)
+        result = self.get(key)
+
+        if result is None:
+            result = negotiate_n(i, you, inhibit, excite, params, rng)
+            self.put(key, result)
+            return result
+
+        winner, allocation_time = result
+        if capped(allocation_time, params):
+            winner = random_int(rng, len(i))
+
+        return winner, allocation_time
+
+def capped(allocation_time, params):
+    ''' The negotiation reached the maximum number of steps (and was decided at random) '''
+    return allocation_time > 0 and allocation_time >= params.MAX_COORD_STEPS
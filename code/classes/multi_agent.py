@@ -0,0 +1,214 @@
+######################################################################
+######################################################################
+# Task allocation for teams of any size. The two-agent I/YOU dynamics
+# of agent.negotiate are generalised to N participants: every agent
+# is inhibited/excited by its main rival, the most willing of the
+# others. Only a few candidate agents per skill take part in each
+# negotiation, so the cost per action grows linearly with the team.
+######################################################################
+######################################################################
+
+import numpy as np
+import my_parameters as P
+
+from agent import negotiate_raw, immediate_frustration, random_int
+
+def select_candidates(wp, skill_id, n_candidates = None):
+    ''' Returns the indices (in ascending order) of the n_candidates agents
+        that are most willing to perform an action of skill skill_id.
+        Willingness is the difference between their initial I and YOU.
+        n_candidates defaults to the one in the workplace parameters.
+    '''
+    n_candidates = wp.params.N_CANDIDATES if n_candidates is None else n_candidates
+
+    willingness = np.array([i - you for i, you in
+                            [agent.get_initial_i_you(wp, skill_id) for agent in wp.agents]])
+
+    # Stable sort so that ties are broken by agent index
+    candidates = np.argsort(-willingness, kind='stable')[:n_candidates]
+
+    return sorted(int(c) for c in candidates)
+
+# Returns tuple containing:
+# (assignment, allocation_time, skill_id, action_id)
+def choose_agent_n(wp, action, candidates = None):
+    ''' Same as agent.choose_agent, but for any number of agents. Only the
+        candidates negotiate; the rest of the team keeps its frustration
+        and gets an allocation time of 0 for this action.
+    '''
+    if candidates is None:
+        candidates = select_candidates(wp, action.skill_id)
+
+    participants = [wp.agents[k] for k in candidates]
+
+    i, you = zip(*[agent.get_initial_i_you(wp, action.skill_id) for agent in participants])
+
+    # Begin negotiation process (remembered, if the workplace has a memo)
+    negotiate = negotiate_n if wp.negotiation_memo is None else wp.negotiation_memo.negotiate_n
+    winner, allocation_time = negotiate(i, you, params = wp.params, rng = wp.rng)
+
+    if wp.instrumentation is not None:
+        wp.instrumentation.count_negotiation(allocation_time, wp.params.MAX_COORD_STEPS)
+
+    # frustration should be updated before their interaction
+    frustrations = [agent.get_frustration() for agent in participants]
+
+    allocation_time = scale_allocation_time_n(allocation_time,
+                                              r_ij = wp.relationships.mean(candidates),
+                                              frustrations = frustrations, params = wp.params)
+
+    # Update each agent's internal tracking of allocation time
+    candidates_set = set(candidates)
+    for k, agent in enumerate(wp.agents):
+        agent.insert_alloc_time(allocation_time if k in candidates_set else 0)
+
+    # Calculate immediate frustration with information from latest interaction
+    r_ijs = wp.relationships.mean_with_others(candidates)
+    for agent, f in zip(participants, calculate_immediate_frustration_n(participants, wp.params, r_ijs)):
+        agent.update_frustration(f)
+    for k, agent in enumerate(wp.agents):
+        if k not in candidates_set:
+            agent.keep_frustration()
+
+    # Update action progress by one cycle
+    action.completion += 1
+
+    return (candidates[winner], allocation_time, action.skill_id, action._id)
+
+def choose_agents_n(wp, actions):
+    ''' choose_agent_n for all the pending actions of a cycle. Expertise and
+        motivation do not change during a cycle, so candidates are selected
+        once per skill.
+    '''
+    candidates = {}
+    actions_to_process = []
+
+    for action in actions:
+        if action.skill_id not in candidates:
+            candidates[action.skill_id] = select_candidates(wp, action.skill_id)
+
+        actions_to_process.append(choose_agent_n(wp, action, candidates[action.skill_id]))
+
+    return actions_to_process
+
+# Negotiations whose I and YOU all change by less than this in a step have
+# stalled (they head to a state where nobody wins): they are decided as if
+# they had reached MAX_COORD_STEPS. Negotiations that end are never that slow
+STALL_TOLERANCE = 1e-5
+
+def negotiate_n(i, you, inhibit = None, excite = None, params = P.DEFAULT_PARAMETERS, rng = None):
+    ''' I/YOU dynamics for N participants. Every agent interacts, with the
+        two-agent rule, with its main rival: the most willing of the other
+        agents (for the most willing agent, the second one). With N = 2 this
+        is exactly agent.negotiate. Negotiation ends when a single agent says
+        "I" and not everybody says "YOU". It is stopped, and decided randomly,
+        at MAX_COORD_STEPS, when it comes back to an earlier state or when it
+        stalls (see STALL_TOLERANCE).
+        Returns the index of the chosen participant and the number of steps.
+    '''
+    inhibit = params.INHIBIT if inhibit is None else inhibit
+    excite = params.EXCITE if excite is None else excite
+
+    n = len(i)
+
+    if n == 1:
+        return 0, 0
+    if n == 2:
+        return negotiate_raw(i[0], you[0], i[1], you[1], inhibit, excite, params, rng)
+
+    # A handful of participants: plain floats are much faster than numpy
+    i = [float(x) for x in i]
+    you = [float(x) for x in you]
+
+    allocation_time = 0
+
+    # Cycle detection, as in agent.negotiate_raw
+    saved_i, saved_you = i, you
+    next_save = 1
+
+    while still_negotiating_n(i, you):
+        first, second = main_rivals(i, you)
+        i_first, you_first = i[first], you[first]
+        i_second, you_second = i[second], you[second]
+
+        new_i, new_you = [], []
+        change = 0
+        for k in range(n):
+            i_k, you_k = i[k], you[k]
+            i_rival, you_rival = (i_second, you_second) if k == first else (i_first, you_first)
+
+            diff_i = abs(i_k - i_rival)
+            diff_you = abs(you_k - you_rival)
+
+            new_i_k = i_k - inhibit * i_k * i_rival * diff_i + excite * you_rival * (1 - i_k) * diff_you
+            new_you_k = you_k - inhibit * you_k * you_rival * diff_you + excite * (1 - you_k) * i_rival * diff_i
+
+            change = max(change, abs(new_i_k - i_k), abs(new_you_k - you_k))
+            new_i.append(new_i_k)
+            new_you.append(new_you_k)
+
+        i, you = new_i, new_you
+
+        allocation_time += 1
+
+        if allocation_time >= params.MAX_COORD_STEPS or (i == saved_i and you == saved_you) or \
+           (change < STALL_TOLERANCE and still_negotiating_n(i, you)):
+            return random_int(rng, n), max(allocation_time, params.MAX_COORD_STEPS)
+
+        if allocation_time == next_save:
+            saved_i, saved_you = i, you
+            next_save *= 2
+
+    says_i = [k for k in range(n) if i[k] > you[k]]
+
+    # Otherwise the most willing one (the first of them, if tied)
+    winner = says_i[0] if len(says_i) == 1 else max(range(n), key = lambda k: (i[k] - you[k], -k))
+
+    return winner, allocation_time
+
+def main_rivals(i, you):
+    ''' Indices of the most and the second most willing agents (lowest
+        YOU - I, ties broken by index)
+    '''
+    first = second = None
+    lowest = second_lowest = float('inf')
+
+    for k in range(len(i)):
+        reluctance = you[k] - i[k]
+        if reluctance < lowest:
+            first, second = k, first
+            lowest, second_lowest = reluctance, lowest
+        elif reluctance < second_lowest:
+            second, second_lowest = k, reluctance
+
+    return first, second
+
+def still_negotiating_n(i, you):
+    ''' Two or more agents want to do it, or nobody does '''
+    says_i = sum(1 for i_k, you_k in zip(i, you) if i_k > you_k)
+    says_you = sum(1 for i_k, you_k in zip(i, you) if you_k > i_k)
+    return says_i >= 2 or says_you == len(i)
+
+def scale_allocation_time_n(allocation_time, r_ij = -1, frustrations = [], params = P.DEFAULT_PARAMETERS):
+    ''' agent.scale_allocation_time for any number of participants: the
+        relationship term and every participant's frustration are averaged
+    '''
+    P = params
+
+    MAX_DELTA = 0 if (r_ij == -1 or -1 in frustrations) else 0.5
+
+    terms = [-(r_ij - 0.5)/0.5] + [(f - P.MAX_H/2)/(P.MAX_H/2) for f in frustrations]
+
+    allocation_time *= (1 + MAX_DELTA * (sum(terms) / len(terms)))
+
+    return allocation_time
+
+def calculate_immediate_frustration_n(agents, params, r_ijs):
+    ''' I(T,r_ij) of every participant, r_ijs[ix] being the mean relationship
+        of agents[ix] with the rest of the participants
+        (see relationships.RelationshipMatrix.mean_with_others)
+    '''
+    if len(agents) < 2:
+        return [0] * len(agents)
+
+    return [immediate_frustration(r_ij, agent.allocation_times[-1], params) for agent, r_ij in zip(agents, r_ijs)]
@@ -23,6 +23,9 @@ INHIBIT = .1
 
 MAX_COORD_STEPS = 1000
 
+# Agents taking part in each negotiation when there are more than two
+N_CANDIDATES = 3
+
 MBTI = [[0.67, 0.33, 0.83, 0.5, 0.83, 0.5, 1, 0.67, 0.5, 0.17, 0.67, 0.33, 0.67, 0.33, 0.83, 0.5],
         [0.33, 0.67, 0.5, 0.83, 0.5, 0.83, 0.67, 1, 0.17, 0.5, 0.33, 0.67, 0.33, 0.67, 0.5, 0.83],
         [0.83, 0.5, 0.67, 0.33, 1, 0.67, 0.83, 0.5, 0.67, 0.33, 0.5, 0.17, 0.83, 0.5, 0.67, 0.33],
@@ -39,3 +42,56 @@ MBTI = [[0.67, 0.33, 0.83, 0.5, 0.83, 0.5, 1, 0.67, 0.5, 0.17, 0.67, 0.33, 0.67,
         [0.33, 0.67, 0.5, 0.83, 0.17, 0.5, 0.33, 0.67, 0.17, 0.5, 0.33, 0.67, 0, 0.33, 0.17, 0.5],
         [0.83, 0.5, 0.67, 0.33, 0.67, 0.33, 0.5, 0.17, 0.67, 0.33, 0.5, 0.17, 0.5, 0.17, 0.33, 0],
         [0.5, 0.83, 0.33, 0.67, 0.33, 0.67, 0.17, 0.5, 0.33, 0.67, 0.17, 0.5, 0.17, 0.5, 0, 0.33]]
+
+######################################################################
+# Parameters of one simulation. The values above are only defaults:
+# every Workplace holds its own (immutable) Parameters, so several
+# workplaces with different inputs can live in the same process.
+######################################################################
+from collections import namedtuple
+
+# Keys used in the "parameters" section of the input json files
+JSON_KEYS = ['task_unit_duration', 'alpha_e', 'alpha_m', 'alpha_f', 'beta',
+             'lam_learn', 'lam_motiv', 'mu_learn', 'mu_motiv', 'th_e', 'th_m',
+             'max_e', 'max_m', 'max_h', 'excite', 'inhibit', 'max_coord_steps',
+             'n_candidates']
+
+class Parameters(namedtuple('Parameters', [key.upper() for key in JSON_KEYS] + ['MBTI'])):
+    ''' Immutable and hashable set of parameters. Fields have the same names
+        as the defaults of this module (P.ALPHA_E -> params.ALPHA_E)
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, params, base = None):
+        ''' Loads parameters from the dictionary that comes from json file.
+            Missing parameters are taken from base (defaults if None).
+        '''
+        values = (DEFAULT_PARAMETERS if base is None else base)._asdict()
+
+        for key in JSON_KEYS:
+            if key in params:
+                values[key.upper()] = params[key]
+
+        if 'mbti' in params:
+            values['MBTI'] = tuple(tuple(row) for row in params['mbti'])
+
+        # Normalise alphas
+        if values['ALPHA_E'] + values['ALPHA_F'] + values['ALPHA_M'] != 1:
+            factor = 1 / (values['ALPHA_E'] + values['ALPHA_F'] + values['ALPHA_M'])
+            values['ALPHA_E'] *= factor
+            values['ALPHA_F'] *= factor
+            values['ALPHA_M'] *= factor
+
+        return cls(**values)
+
+    def to_dict(self):
+        ''' Inverse of from_dict (json keys) '''
+        params = {key: getattr(self, key.upper()) for key in JSON_KEYS}
+        params['mbti'] = [list(row) for row in self.MBTI]
+        return params
+
+DEFAULT_PARAMETERS = Parameters(TASK_UNIT_DURATION, ALPHA_E, ALPHA_M, ALPHA_F, BETA,
+                                LAM_LEARN, LAM_MOTIV, MU_LEARN, MU_MOTIV, TH_E, TH_M,
+                                MAX_E, MAX_M, MAX_H, EXCITE, INHIBIT, MAX_COORD_STEPS,
+                                N_CANDIDATES, tuple(tuple(row) for row in MBTI))
@@ -0,0 +1,270 @@
+######################################################################
+######################################################################
+# Plots of a Workplace (expertise, motivation, frustration, allocation
+# and performance times), with plotly (in the notebook) or matplotlib.
+# They are kept apart from the simulator, and plotly and matplotlib
+# are only imported when a plot is made: running simulations (sweeps,
+# ensembles...) does not need them.
+######################################################################
+######################################################################
+
+import numpy as np
+
+def plot_skills(wp, agent, skill_ids = (0, 1)):
+    ''' Plots the expertise of an agent (skills in skill_ids) as a function of number of cycles'''
+    import plotly.graph_objs as go
+    from plotly.offline import iplot
+
+    x = np.round(np.array(list(range(len(agent.skillset[skill_ids[0]].expertise)))))
+
+    data = [
+            go.Scatter(
+                x = x,
+                y = [y if y > 0 else 0 for y in np.round(np.array(agent.skillset[skill_id].expertise))],
+                mode = 'lines+markers',
+                name = 'Skill ' + str(skill_id + 1)
+            ) for skill_id in skill_ids
+           ]
+
+    layout = go.Layout(
+        title='Expertise',
+        xaxis=dict(
+            title='Cycles',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        yaxis=dict(
+            title='Expertise',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        )
+    )
+
+    fig = go.Figure(data=data, layout=layout)
+
+    iplot(fig)
+
+def plot_skills_matplotlib(wp, agent, skill_ids = (0, 1)):
+    ''' Plots the expertise of an agent (skills in skill_ids) as a function of number of cycles'''
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+
+    for skill_id in skill_ids:
+        y = np.round(np.array(agent.skillset[skill_id].expertise))
+        x = np.round(np.array(list(range(len(y)))))
+
+        plt.plot(x, [_y if _y > 0 else 0 for _y in y], '.-')
+
+    plt.xlabel('Cycles')
+    plt.ylabel('Expertise')
+    plt.title('Evolution of expertise: Agent ' + str(agent._id))
+    plt.legend(['Skill ' + str(skill_id + 1) for skill_id in skill_ids])
+    plt.draw()
+
+    return fig
+
+def plot_motivation(wp, agent, skill_ids = (0, 1)):
+    ''' Plots the motivation of an agent (skills in skill_ids) as a function of #cycles'''
+    import plotly.graph_objs as go
+    from plotly.offline import iplot
+
+    x = np.round(np.array(list(range(len(agent.skillset[skill_ids[0]].motivation)))))
+
+    data = [
+            go.Scatter(
+                x = x,
+                y = [y if y > 0 else 0 for y in np.round(np.array(agent.skillset[skill_id].motivation))],
+                mode = 'lines+markers',
+                name = 'Skill ' + str(skill_id + 1)
+            ) for skill_id in skill_ids
+           ]
+
+    layout = go.Layout(
+        title='Motivation',
+        xaxis=dict(
+            title='Cycles',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        yaxis=dict(
+            title='Motivation',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        )
+    )
+
+    fig = go.Figure(data=data, layout=layout)
+
+    iplot(fig)
+
+def plot_frustration(wp):
+    ''' Plots frustration of every agent as a function of #cycles'''
+    import plotly.graph_objs as go
+    from plotly.offline import iplot
+
+    data = [
+            go.Scatter(
+                x = np.array(list(range(len(agent.frustration)))),
+                y = np.array(agent.frustration),
+                mode = 'lines+markers',
+                name = 'Agent ' + str(agent._id + 1)
+            ) for agent in wp.agents
+           ]
+
+    layout = go.Layout(
+        title='Frustration',
+        xaxis=dict(
+            title='Cycles',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        yaxis=dict(
+            title='Frustration',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        showlegend=True
+    )
+
+    fig = go.Figure(data=data, layout=layout)
+
+    iplot(fig)
+
+def plot_frustration_matplotlib(wp):
+    ''' Plots frustration of every agent as a function of #cycles'''
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+
+    for agent in wp.agents:
+        y = np.array(agent.frustration)
+        x = np.array(list(range(len(y))))
+
+        plt.plot(x, y, '.-')
+
+    plt.xlabel('Cycles')
+    plt.ylabel('Frustration')
+    plt.title('Frustration')
+    plt.legend(['Agent ' + str(agent._id + 1) for agent in wp.agents])
+    plt.draw()
+
+    return fig
+
+def plot_allocations(wp):
+    ''' Plots allocation time it took for every cycle'''
+    import plotly.graph_objs as go
+    from plotly.offline import iplot
+
+    data = [
+            go.Scatter(
+                x = np.array(list(range(len(agent.allocation_times)))),
+                y = np.array(agent.allocation_times),
+                mode = 'lines+markers',
+                name = 'Agent ' + str(agent._id + 1)
+            ) for agent in wp.agents
+           ]
+
+    layout = go.Layout(
+        title='Allocations',
+        xaxis=dict(
+            title='Cycles',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        yaxis=dict(
+            title='Allocation time',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        )
+    )
+
+    fig = go.Figure(data=data, layout=layout)
+
+    iplot(fig)
+
+def plot_performance(wp):
+    ''' Plots performance times of the agents and of the whole system'''
+    import plotly.graph_objs as go
+    from plotly.offline import iplot
+
+    y, names = wp.get_performance_series()
+
+    x = np.array(list(range(len(y[0]))))
+
+    data = [
+            go.Scatter(
+                x = x,
+                y = _y,
+                mode = 'lines+markers',
+                name = names[i]
+            ) for i, _y in enumerate(y)
+           ]
+
+    layout = go.Layout(
+        title='Performance',
+        xaxis=dict(
+            title='Cycles',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        ),
+        yaxis=dict(
+            title='Performance Time',
+            titlefont=dict(
+                family='Arial, sans-serif',
+                size=24,
+                color='black'
+            )
+        )
+    )
+
+    fig = go.Figure(data=data, layout=layout)
+    iplot(fig)
+
+def plot_performance_matplotlib(wp):
+    ''' Plots performance times of the agents and of the whole system'''
+    import matplotlib.pyplot as plt
+
+    y, names = wp.get_performance_series()
+
+    x = np.array(list(range(len(y[0]))))
+
+    fig = plt.figure()
+
+    for _y in y:
+        plt.plot(x, _y, '.-')
+
+    plt.xlabel('Cycles')
+    plt.ylabel('Time')
+    plt.title('Performance')
+    plt.legend(names)
+    plt.draw()
+
+    return fig
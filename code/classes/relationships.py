@@ -0,0 +1,92 @@
+######################################################################
+######################################################################
+# Relationships (r_ij) between the agents of a team. They come from
+# the MBTI table of the parameters (P.MBTI) and can be overridden for
+# particular pairs of agents. Every agent's MBTI index is resolved
+# once, when the agent is created (Agent.mbti_ix), so a relationship
+# is a lookup: in a matrix for small teams, or in the MBTI table (plus
+# a dictionary of overrides) for large teams, to avoid n^2 entries.
+######################################################################
+######################################################################
+
+import numpy as np
+import my_parameters as P
+
+DENSE_MAX_AGENTS = 64   # Larger teams use the sparse representation
+
+class RelationshipMatrix:
+    def __init__(self, agents, params = P.DEFAULT_PARAMETERS, overrides = None, dense = None):
+        ''' agents: the agents of the team, in order. overrides: r_ij of some
+            pairs, either a dictionary (i, j) -> r_ij or a list of
+            {"agents": [i, j], "r": r_ij} (as in input files). Overrides are
+            symmetric. dense defaults to teams of up to DENSE_MAX_AGENTS.
+        '''
+        self.params = params
+        self.n_agents = len(agents)
+        self.mbti_ix = [agent.mbti_ix for agent in agents]
+        self.dense = self.n_agents <= DENSE_MAX_AGENTS if dense is None else dense
+
+        self.overrides = {}
+        for pair, r_ij in parse_overrides(overrides).items():
+            self.overrides[pair] = self.overrides[pair[::-1]] = r_ij
+
+        if self.dense:
+            self.matrix = [[self.compute(i, j) for j in range(self.n_agents)] for i in range(self.n_agents)]
+
+    def __len__(self):
+        return self.n_agents
+
+    def compute(self, i, j):
+        ''' r_ij of agents i and j: override, MBTI table, or -1 if one of them
+            has no MBTI. 0 is replaced by the smallest float (as in
+            agent.get_relationship)
+        '''
+        if (i, j) in self.overrides:
+            r_ij = self.overrides[(i, j)]
+        elif self.mbti_ix[i] >= 0 and self.mbti_ix[j] >= 0:
+            r_ij = self.params.MBTI[self.mbti_ix[i]][self.mbti_ix[j]]
+        else:
+            r_ij = -1
+
+        return r_ij if r_ij != 0 else np.finfo(float).eps
+
+    def get(self, i, j):
+        return self.matrix[i][j] if self.dense else self.compute(i, j)
+
+    def mean(self, ids):
+        ''' Mean r_ij over all pairs of agents in ids, or -1 if some of them is -1
+            (the r_ij of a negotiation, see multi_agent.choose_agent_n)
+        '''
+        if len(ids) < 2:
+            return -1
+
+        relationships = [self.get(i, j) for ix, i in enumerate(ids) for j in ids[ix+1:]]
+
+        if -1 in relationships:
+            return -1
+
+        return sum(relationships) / len(relationships)
+
+    def mean_with_others(self, ids):
+        ''' For every agent in ids, its mean r_ij with the others in ids (-1 if
+            some of them is -1, None if it is alone)
+        '''
+        means = []
+
+        for i in ids:
+            relationships = [self.get(i, j) for j in ids if j != i]
+
+            if len(relationships) == 0:
+                means.append(None)
+            else:
+                means.append(-1 if -1 in relationships else sum(relationships) / len(relationships))
+
+        return means
+
+def parse_overrides(overrides):
+    ''' Overrides as a dictionary (i, j) -> r_ij '''
+    if overrides is None:
+        return {}
+    if isinstance(overrides, dict):
+        return {tuple(pair): r_ij for pair, r_ij in overrides.items()}
+    return {tuple(override['agents']): override['r'] for override in overrides}
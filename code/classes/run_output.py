@@ -0,0 +1,144 @@
+######################################################################
+######################################################################
+# Output of a run: every cycle, a row with the performance time
+# (Tperf), coordination time, and for every agent its performance
+# time, frustration, expertise and motivation (one value per skill)
+# is appended to a columnar file (see columnar.py) while the workplace
+# works. A column is read with ColumnReader(path).read('frustration_0'),
+# without loading the others.
+#
+# Usage: Workplace(file, output = 'run.col'), or
+#        Workplace(file, output = RunOutput('run.col', skills = False))
+#
+# write_moods(wp, path) writes the frustration of all the agents (one
+# row per interaction) for media/print_frustration_movie.py.
+######################################################################
+######################################################################
+
+import os
+import numpy as np
+
+from columnar import ColumnWriter
+
+# Where process_tasks(output_moods = True) writes the moods
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'media')
+
+class RunOutput:
+    def __init__(self, path, chunk_rows = 256, skills = True):
+        ''' Rows are written to path in records of chunk_rows cycles. Without
+            skills, expertise and motivation are left out.
+        '''
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.skills = skills
+
+        self.writer = None
+        self.end = None     # Size of the file after the last flush (to resume after a checkpoint)
+
+    def open(self, wp):
+        if self.end is None:
+            meta = {'kind': 'run', 'n_agents': len(wp.agents), 'seed': str(wp.seed)}
+            self.writer = ColumnWriter(self.path, meta = meta, chunk_rows = self.chunk_rows)
+        else:
+            # Resumed from a checkpoint: rows written after it are dropped
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.end)
+            self.writer = ColumnWriter(self.path, chunk_rows = self.chunk_rows, append = True)
+
+    def cycle(self, wp):
+        ''' Appends the row of the cycle that wp has just done '''
+        self.append(wp, cycle_row(wp, wp.time - 1, self.skills))
+
+    def append(self, wp, row):
+        if self.writer is None:
+            self.open(wp)
+
+        self.writer.append_row(row)
+
+    def repeat(self, wp, rows, n, expertise = None, motivation = None):
+        ''' Appends n rows: rows (of consecutive cycles) over and over, time
+            going on. They are stored once (see ColumnWriter.repeat), unless
+            expertise and motivation are given: one matrix per agent, with
+            the values of every skill in each of the n cycles.
+        '''
+        if self.writer is None:
+            self.open(wp)
+
+        columns = {name: np.array([row[name] for row in rows]) for name in rows[0]}
+
+        if expertise is None:
+            self.writer.repeat(columns, n, {'time': len(rows)})
+            return
+
+        ix = np.arange(n)
+        columns = {name: values[ix % len(rows)] for name, values in columns.items()}
+        columns['time'] = rows[0]['time'] + ix
+        for k in range(len(expertise)):
+            columns['expertise_' + str(k)] = np.asarray(expertise[k], dtype = float)
+            columns['motivation_' + str(k)] = np.asarray(motivation[k], dtype = float)
+
+        self.writer.flush()
+        self.writer.write(columns)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+            self.end = self.writer.f.tell()
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.f.close()
+            self.writer = None
+
+    def __getstate__(self):
+        # Saved with a checkpoint: what has been written so far is what the
+        # checkpoint has done
+        self.flush()
+        state = self.__dict__.copy()
+        state['writer'] = None
+        return state
+
+def cycle_row(wp, time, skills = True):
+    ''' Values of cycle time (the last one done) '''
+    expertise = motivation = None
+    if skills:
+        expertise = [[agent.get_latest_expertise(ix) for ix in range(len(agent.skillset))] for agent in wp.agents]
+        motivation = [[agent.get_latest_motivation(ix) for ix in range(len(agent.skillset))] for agent in wp.agents]
+
+    return make_row(time, wp.Tperf[time], wp.coordination_times[time],
+                    [agent.performance_times[time] for agent in wp.agents],
+                    [agent.get_frustration() for agent in wp.agents], expertise, motivation)
+
+def make_row(time, Tperf, coordination_time, performance, frustration, expertise = None, motivation = None):
+    ''' Row of cycle time, with the values of every agent (expertise and
+        motivation: one list per agent, with a value per skill)
+    '''
+    row = {'time': time,
+           'Tperf': float(Tperf),
+           'coordination_time': float(coordination_time)}
+
+    for k in range(len(performance)):
+        suffix = '_' + str(k)
+        row['performance' + suffix] = float(performance[k])
+        row['frustration' + suffix] = float(frustration[k])
+
+        if expertise is not None:
+            row['expertise' + suffix] = np.array(expertise[k], dtype = float)
+            row['motivation' + suffix] = np.array(motivation[k], dtype = float)
+
+    return row
+
+def write_moods(wp, path):
+    ''' Frustration of all the agents after every interaction: column
+        frustration, one row per interaction and one value per agent (NaN if
+        an agent has fewer values)
+    '''
+    histories = [np.asarray(agent.frustration, dtype = float) for agent in wp.agents]
+
+    moods = np.full((max(len(history) for history in histories), len(histories)), np.nan)
+    for k, history in enumerate(histories):
+        moods[:len(history), k] = history
+
+    with ColumnWriter(path, meta = {'kind': 'moods', 'n_agents': len(wp.agents)}) as writer:
+        writer.write({'frustration': moods})
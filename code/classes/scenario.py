@@ -0,0 +1,252 @@
+######################################################################
+######################################################################
+# Compiled scenarios: the contents of an input file (agents, tasks,
+# parameters) in a binary file (columnar.py format) that is memory
+# mapped instead of parsed. Skills of the agents and actions of the
+# tasks (and their arrival times) are arrays; parameters, MBTI and
+# relationships go in the header. Many processes (sweep workers) can
+# share one scenario file without each of them reading and parsing the
+# json: agents and tasks are read from views of the mapped arrays. A run only copies what it
+# changes: the skills of the agents (their histories start from the
+# values in the file) and the actions of a task, read from the file
+# when the task is processed.
+#
+# Compiling (from code/classes):
+#   python scenario.py input_low_good.json -o input_low_good.scenario
+# and then Workplace('input_low_good.scenario') works as with the json.
+######################################################################
+######################################################################
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from argparse import ArgumentParser
+
+from columnar import ColumnWriter, ColumnReader
+from task import Task, Action
+import my_parameters as P
+
+FORMAT_VERSION = 2
+
+COLUMNS = ['skill_offsets', 'skill_id', 'skill_exp', 'skill_mot',
+           'action_offsets', 'action_id', 'action_skill_id', 'action_duration', 'task_arrival']
+
+def read_json(path):
+    ''' Contents of a json input file. Files with the json encoded twice (a
+        json string with the json inside, as old generators wrote them) are
+        also read.
+    '''
+    with open(path) as f:
+        data = json.load(f)
+
+    while isinstance(data, str):
+        data = json.loads(data)
+
+    return data
+
+def data_digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys = True).encode()).hexdigest()
+
+# ---------- COMPILING ----------
+
+def number_array(values):
+    ''' Integer array if all values are integers (as in the json), float otherwise '''
+    return np.array(values, dtype = np.int64 if all(isinstance(v, int) for v in values) else float)
+
+def compile_scenario(data, path):
+    ''' Writes the contents of an input file (data) to path, as a scenario '''
+    skills = [agent['skillset'] for agent in data['agents']]
+    actions = [task['actions'] for task in data['tasks']]
+
+    columns = {
+        'skill_offsets': np.cumsum([0] + [len(skillset) for skillset in skills]),
+        'skill_id': np.array([skill['id'] for skillset in skills for skill in skillset], dtype = np.int64),
+        'skill_exp': number_array([skill['exp'] for skillset in skills for skill in skillset]),
+        'skill_mot': number_array([skill['mot'] for skillset in skills for skill in skillset]),
+        'action_offsets': np.cumsum([0] + [len(task_actions) for task_actions in actions]),
+        'action_id': np.array([action['id'] for task_actions in actions for action in task_actions], dtype = np.int64),
+        'action_skill_id': np.array([action['skill_id'] for task_actions in actions for action in task_actions],
+                                    dtype = np.int64),
+        'action_duration': np.array([action['duration'] for task_actions in actions for action in task_actions],
+                                    dtype = np.int64),
+        'task_arrival': number_array([task.get('arrival', 0) for task in data['tasks']]),
+    }
+
+    meta = {
+        'format': 'scenario',
+        'version': FORMAT_VERSION,
+        'digest': data_digest(data),
+        'parameters': data['parameters'],
+        'agents': [{'mbti': agent.get('mbti'), 'initial_frustration': agent.get('initial_frustration')}
+                   for agent in data['agents']],
+        'relationships': data.get('relationships'),
+        'arrivals': any('arrival' in task for task in data['tasks']),
+    }
+
+    # A single row, every column being a whole array
+    with ColumnWriter(path, meta = meta) as writer:
+        writer.write({name: values.reshape(1, -1) for name, values in columns.items()})
+
+def compile_file(json_path, path = None):
+    ''' Compiles an input file (path defaults to the same name, .scenario) '''
+    if path is None:
+        path = os.path.splitext(json_path)[0] + '.scenario'
+
+    compile_scenario(read_json(json_path), path)
+    return path
+
+# ---------- LOADING ----------
+
+class Scenario:
+    def __init__(self, path):
+        ''' Opens a compiled scenario; its arrays are memory mapped '''
+        reader = ColumnReader(path)
+
+        if reader.meta.get('format') != 'scenario' or reader.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(path + ' is not a scenario of version ' + str(FORMAT_VERSION))
+
+        self.path = path
+        self.meta = reader.meta
+        self.digest = reader.meta['digest']
+        self.arrays = {name: reader.read(name, mmap = True)[0] for name in COLUMNS}
+
+    @property
+    def n_agents(self):
+        return len(self.meta['agents'])
+
+    @property
+    def n_tasks(self):
+        return len(self.arrays['action_offsets']) - 1
+
+    def __getstate__(self):
+        # Other processes map the file again
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def parameters(self, overrides = None):
+        ''' Parameters (json names), with the ones in overrides (as in a sweep) '''
+        parameters = dict(self.meta['parameters'])
+
+        for name, value in (overrides or {}).items():
+            if name in P.JSON_KEYS:
+                parameters[name] = value
+            elif name != 'mbti':
+                raise KeyError('Unknown sweep variable: ' + name)
+
+        return parameters
+
+    def agents(self, overrides = None):
+        ''' Agents as in the input file (mbti can be overridden) '''
+        offsets = self.arrays['skill_offsets']
+
+        agents = []
+        for k, agent_meta in enumerate(self.meta['agents']):
+            rows = slice(offsets[k], offsets[k + 1])
+            ids, exp, mot = [self.arrays[name][rows].tolist() for name in ('skill_id', 'skill_exp', 'skill_mot')]
+
+            agent = {'skillset': [{'id': _id, 'exp': e, 'mot': m} for _id, e, m in zip(ids, exp, mot)]}
+            for name in ('mbti', 'initial_frustration'):
+                if agent_meta[name] is not None:
+                    agent[name] = agent_meta[name]
+            agents.append(agent)
+
+        if overrides is not None and 'mbti' in overrides:
+            for agent, mbti in zip(agents, overrides['mbti']):
+                agent['mbti'] = mbti
+
+        return agents
+
+    def tasks(self):
+        ''' Tasks (ScenarioTask objects, ids from 0) '''
+        arrivals = self.arrays['task_arrival'].tolist()
+        return [ScenarioTask(self, idx, arrivals[idx]) for idx in range(self.n_tasks)]
+
+    def load_into(self, wp, overrides = None, verbose = False):
+        ''' Loads agents, tasks and parameters into wp (as Workplace.load_data),
+            with the overrides of a sweep run (json parameter names, 'mbti')
+        '''
+        wp.scenario = self
+
+        wp.import_parameters(self.parameters(overrides))
+
+        for idx, agent in enumerate(self.agents(overrides)):
+            wp.add_agent(idx, agent, verbose = verbose)
+        wp.tasks_todo.extend(self.tasks())
+
+        wp.set_relationships(self.meta['relationships'])
+
+    def to_data(self, overrides = None):
+        ''' Contents of the json input file (with overrides) '''
+        offsets = self.arrays['action_offsets'].tolist()
+        ids, skill_ids, durations, arrivals = [self.arrays[name].tolist()
+                                               for name in ('action_id', 'action_skill_id', 'action_duration',
+                                                            'task_arrival')]
+
+        data = {'parameters': self.parameters(overrides),
+                'agents': self.agents(overrides),
+                'tasks': [{'actions': [{'id': ids[ix], 'skill_id': skill_ids[ix], 'duration': durations[ix]}
+                                       for ix in range(offsets[idx], offsets[idx + 1])]}
+                          for idx in range(self.n_tasks)]}
+
+        # Arrival times (see scheduler.py), if the input file had them
+        if self.meta['arrivals']:
+            for task, arrival in zip(data['tasks'], arrivals):
+                task['arrival'] = arrival
+
+        if self.meta['relationships'] is not None:
+            data['relationships'] = self.meta['relationships']
+
+        return data
+
+# ---------- TASKS ----------
+
+class ScenarioTask(Task):
+    ''' Task of a scenario (same use as Task). Its actions are made from the
+        mapped arrays of the scenario when the task is first processed.
+    '''
+    def __init__(self, scenario, _id, arrival = 0):
+        self.scenario = scenario
+        self._id = _id
+        self.arrival = arrival
+        self._actions = None
+
+    def action_rows(self):
+        if self._actions is not None:
+            return super().action_rows()
+
+        arrays = self.scenario.arrays
+        rows = slice(*arrays['action_offsets'][self._id:self._id + 2].tolist())
+        columns = [arrays[name][rows] for name in ('action_id', 'action_skill_id', 'action_duration')]
+
+        return np.column_stack(columns + [np.zeros(rows.stop - rows.start, dtype = np.int64)]).tolist()
+
+    @property
+    def actions(self):
+        if self._actions is None:
+            self._actions = [Action(*row) for row in self.action_rows()]
+        return self._actions
+
+# ---------- COMMAND LINE ----------
+
+def parse_args():
+    parser = ArgumentParser(description='Compile an input file into a scenario')
+    parser.add_argument('input', type=str,
+                        help='Input file (name in IO/inputs, or a path).')
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='Scenario file (default: the input with .scenario).')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    input_file = args.input if os.path.isfile(args.input) else '../IO/inputs/' + args.input
+    path = compile_file(input_file, args.output)
+
+    print('Scenario written to ' + path)
+
+if __name__ == '__main__':
+    main()
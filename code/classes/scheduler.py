@@ -0,0 +1,203 @@
+######################################################################
+######################################################################
+# Event-driven mode: instead of one task at a time, cycle after cycle,
+# several tasks are open at once and time is real time. Whenever an
+# agent becomes free, the free agents negotiate (only among them, see
+# multi_agent.choose_agent_n) for the pending actions of the open
+# tasks, oldest task first. The winner works one unit of the action,
+# which takes the negotiation plus its performance time; the others
+# are only busy while negotiating. Events (task arrivals, agents that
+# become free or finish a unit) are kept in a priority queue ordered
+# by time.
+#
+# Tasks arrive at time 0, or at their "arrival" in the input file (in
+# any order: all the tasks are read at the start, so a stream of tasks
+# is read whole).
+# Learning and forgetting happen when an agent finishes a unit of
+# work. The result is the throughput and latency of the tasks:
+#   summary = wp.process_tasks_concurrent(max_open_tasks = 4)
+######################################################################
+######################################################################
+
+import heapq
+import itertools
+import numpy as np
+
+from collections import deque
+
+from multi_agent import choose_agent_n
+from timeline import Event
+
+# Kinds of events
+ARRIVAL, FREE, DONE = 'arrival', 'free', 'done'
+
+class EventScheduler:
+    def __init__(self, wp, max_open_tasks = None):
+        ''' Schedules the tasks of wp, with at most max_open_tasks of them
+            being worked on at a time (None: no limit)
+        '''
+        self.wp = wp
+        self.max_open_tasks = max_open_tasks
+
+        self.now = 0.0
+        self.events = []                # Heap of (time, order, kind, data)
+        self.order = itertools.count()  # Breaks ties: events at the same time, in the order they came
+
+        self.free = set(range(len(wp.agents)))
+        self.busy_time = [0.0] * len(wp.agents)
+
+        self.backlog = deque()          # Tasks that arrived and are not open yet
+        self.open_tasks = []            # Tasks being worked on, oldest first
+        self.in_progress = set()        # id() of the actions an agent is working on
+        self.running = {}               # Units in progress of every open task (by task id)
+
+        self.task_metrics = []
+        self.metrics = {}               # Metrics of every open task (by task id)
+
+    def push(self, time, kind, data):
+        heapq.heappush(self.events, (time, next(self.order), kind, data))
+
+    # ---------- RUN ----------
+
+    def run(self):
+        ''' Processes all the tasks; returns the summary (see summary()) '''
+        self.push_arrivals()
+
+        while len(self.events) > 0:
+            self.now, _, kind, data = heapq.heappop(self.events)
+
+            if kind == ARRIVAL:
+                self.backlog.append(data)
+                self.metrics[data._id] = {'task': data._id, 'arrival': self.now, 'actions': len(data.actions)}
+            elif kind == FREE:
+                self.free.add(data)
+            else:
+                self.unit_done(*data)
+
+            # Agents are assigned once all the events of this time are handled
+            if len(self.events) == 0 or self.events[0][0] > self.now:
+                self.dispatch()
+
+        return self.summary()
+
+    def push_arrivals(self):
+        ''' Arrivals of all the tasks. Tasks that arrive at the same time are
+            opened in the order they were read.
+        '''
+        while self.wp.has_tasks():
+            task = self.wp.tasks_todo.popleft()
+            self.push(max(getattr(task, 'arrival', 0), self.now), ARRIVAL, task)
+
+    def dispatch(self):
+        ''' Opens tasks from the backlog and gives pending actions to free agents '''
+        while len(self.backlog) > 0 and (self.max_open_tasks is None or len(self.open_tasks) < self.max_open_tasks):
+            task = self.backlog.popleft()
+            self.open_tasks.append(task)
+            self.running[task._id] = 0
+            self.finish_if_done(task)
+
+        for task in list(self.open_tasks):
+            for action in task.actions:
+                if len(self.free) == 0:
+                    return
+                if action.completion < action.duration and id(action) not in self.in_progress:
+                    self.assign(task, action)
+
+    def assign(self, task, action):
+        ''' The free agents negotiate for action, and the winner starts a unit of it '''
+        wp = self.wp
+
+        candidates = self.candidates(action.skill_id)
+        winner, allocation_time, skill_id, action_id = choose_agent_n(wp, action, candidates)
+
+        agent = wp.agents[winner]
+        performance_time = agent.calculate_performance_time([skill_id], [agent._id], self.now)
+        duration = allocation_time + performance_time
+
+        agent.current_action.append({'task': task._id, 'action': action_id, 'start_time': self.now})
+        wp.timeline.add_event(Event(start_time = self.now, duration = duration, task_id = task._id,
+                                    action_id = action_id, agent_id = winner))
+
+        if 'start_time' not in self.metrics[task._id]:
+            self.metrics[task._id]['start_time'] = self.now
+
+        self.in_progress.add(id(action))
+        self.running[task._id] += 1
+
+        self.free.remove(winner)
+        self.busy_time[winner] += duration
+        self.push(self.now + duration, DONE, (winner, task, action))
+
+        # The others were busy negotiating
+        if allocation_time > 0:
+            for k in candidates:
+                if k != winner:
+                    self.free.remove(k)
+                    self.busy_time[k] += allocation_time
+                    self.push(self.now + allocation_time, FREE, k)
+
+    def candidates(self, skill_id):
+        ''' The (at most N_CANDIDATES) free agents most willing to do an action of skill_id '''
+        free = sorted(self.free)
+        n_candidates = self.wp.params.N_CANDIDATES
+
+        if len(free) <= n_candidates:
+            return free
+
+        willingness = np.array([i - you for i, you in
+                                [self.wp.agents[k].get_initial_i_you(self.wp, skill_id) for k in free]])
+
+        # Stable sort so that ties are broken by agent index (as in multi_agent.select_candidates)
+        return sorted(free[ix] for ix in np.argsort(-willingness, kind='stable')[:n_candidates])
+
+    def unit_done(self, k, task, action):
+        agent = self.wp.agents[k]
+
+        # The agent learns the skill it used and forgets the others
+        agent.flush_prev_act([agent._id], [action.skill_id])
+        agent.update_memory()
+
+        self.in_progress.remove(id(action))
+        self.running[task._id] -= 1
+        self.free.add(k)
+
+        self.finish_if_done(task)
+
+    def finish_if_done(self, task):
+        if self.running[task._id] > 0 or any(action.completion < action.duration for action in task.actions):
+            return
+
+        metrics = self.metrics.pop(task._id)
+        metrics.setdefault('start_time', self.now)
+        metrics['end_time'] = self.now
+        metrics['latency'] = self.now - metrics['arrival']
+        self.task_metrics.append(metrics)
+
+        self.open_tasks.remove(task)
+        del self.running[task._id]
+
+        if self.wp.keep_completed_tasks:
+            self.wp.completed_tasks.append(task)
+
+    # ---------- RESULTS ----------
+
+    def summary(self):
+        ''' Makespan (time of the last event), throughput (tasks per unit of
+            time), latency of the tasks (from arrival to end) and utilisation
+            of every agent (fraction of the makespan it was busy)
+        '''
+        latencies = np.array([metrics['latency'] for metrics in self.task_metrics], dtype = float)
+        makespan = self.now
+
+        summary = {'makespan': makespan,
+                   'tasks': len(self.task_metrics),
+                   'throughput': len(self.task_metrics) / makespan if makespan > 0 else 0.0,
+                   'utilisation': [busy / makespan if makespan > 0 else 0.0 for busy in self.busy_time]}
+
+        if len(latencies) > 0:
+            summary.update({'mean_latency': float(latencies.mean()),
+                            'p50_latency': float(np.percentile(latencies, 50)),
+                            'p95_latency': float(np.percentile(latencies, 95)),
+                            'max_latency': float(latencies.max())})
+
+        return summary
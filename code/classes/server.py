@@ -0,0 +1,553 @@
+######################################################################
+######################################################################
+# Local simulation service. One server on localhost runs the
+# simulations of everybody: workers are processes that have already
+# imported the simulator, identical submissions share one run, and a
+# bounded queue pushes back when there is too much work. Only the
+# standard library is used (asyncio for the HTTP front end).
+#
+# Start it (from code/classes):
+#   python server.py --port 8765 -j 4 --queue 64
+#
+# API (JSON):
+#   POST /jobs                  submit {"file": "input_low_good.json"}
+#                               or {"input": {...contents of an input
+#                               file...}}, with optional "seed",
+#                               "batch_negotiation", "lazy_skills",
+#                               "array_skills". Returns the job (202), or
+#                               503 if the queue is full.
+#   GET  /jobs/<id>             status of a job
+#   GET  /jobs/<id>/metrics     per-cycle metrics (JSON lines), streamed
+#                               while the job runs (?from=n: from cycle n)
+#   GET  /jobs/<id>/result      result of the run (?wait=s: wait up to s
+#                               seconds for it)
+#   GET  /status                workers, jobs queued and running
+######################################################################
+######################################################################
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import traceback
+import multiprocessing
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from workplace import Workplace
+from run_output import cycle_row
+from history import history_sum
+
+INPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'IO', 'inputs')
+
+# Submission fields passed on to the Workplace
+OPTIONS = ['seed', 'batch_negotiation', 'lazy_skills', 'array_skills']
+
+MAX_BODY = 64 * 1024 * 1024    # Largest submission accepted (bytes)
+ROWS_PER_MESSAGE = 64           # Metrics sent from the workers in batches of rows
+
+# ---------- WORKERS ----------
+
+_events = None  # Queue to the server (set in every worker)
+
+def init_worker(events):
+    global _events
+    _events = events
+
+def warm_up():
+    ''' Starts a worker (the simulator is imported with this module) '''
+    return os.getpid()
+
+class MetricsOutput:
+    ''' Run output (as run_output.RunOutput) that sends the row of every
+        cycle to the server, a few rows at a time
+    '''
+    skills = False
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.rows = []
+
+    def cycle(self, wp):
+        self.append(wp, cycle_row(wp, wp.time - 1, self.skills))
+
+    def append(self, wp, row):
+        self.rows.append(row)
+        if len(self.rows) >= ROWS_PER_MESSAGE:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) > 0:
+            _events.put(('rows', self.job_id, self.rows))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+
+def run_job(job_id, submission):
+    ''' Runs a submission in a worker. Metrics, and then the result (or the
+        error), are sent to the server through the events queue.
+    '''
+    try:
+        start = time.perf_counter()
+
+        output = MetricsOutput(job_id)
+        wp = Workplace(output = output, **{name: submission[name] for name in OPTIONS if name in submission})
+
+        if 'file' in submission:
+            wp.parse_json(submission['file'])
+        else:
+            wp.load_data(submission['input'])
+
+        tasks = []
+        wp.process_tasks(output_moods = False, task_metrics = tasks.append)
+        output.flush()
+
+        result = {'time': wp.time,
+                  'performance_time': wp.get_sum_perf_time(),
+                  'coordination_time': float(history_sum(wp.coordination_times)),
+                  'frustration': [float(agent.get_frustration()) for agent in wp.agents],
+                  'tasks': tasks,
+                  'seconds': time.perf_counter() - start}
+
+        _events.put(('done', job_id, result))
+    except Exception as error:
+        _events.put(('failed', job_id, type(error).__name__ + ': ' + str(error)))
+
+# ---------- JOBS ----------
+
+class Job:
+    def __init__(self, submission, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.submission = submission
+        self.key = key
+
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+        self.rows = []          # Metrics of every cycle
+        self.result = None
+        self.error = None
+
+        self.waiters = []       # Futures of the clients waiting for news
+
+    def notify(self):
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.waiters = []
+
+    async def changed(self, timeout = None):
+        ''' Waits until there are new rows or the job ends (or timeout) '''
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def done(self):
+        return self.status in ['done', 'failed']
+
+    def info(self):
+        return {'id': self.id, 'status': self.status, 'submitted': self.submitted,
+                'started': self.started, 'finished': self.finished,
+                'cycles': len(self.rows), 'error': self.error}
+
+def submission_key(submission):
+    ''' Identical submissions have the same key. Files are identified by
+        their path, size and modification time.
+    '''
+    identity = dict(submission)
+    if 'file' in identity:
+        stat = os.stat(identity['file'])
+        identity['file'] = [os.path.abspath(identity['file']), stat.st_size, stat.st_mtime_ns]
+
+    return hashlib.sha256(json.dumps(identity, sort_keys = True).encode()).hexdigest()
+
+def check_submission(submission):
+    ''' Returns the submission ready to run (file resolved), or raises ValueError '''
+    if not isinstance(submission, dict) or ('file' in submission) == ('input' in submission):
+        raise ValueError('A submission needs either "file" or "input"')
+
+    unknown = set(submission) - set(OPTIONS) - {'file', 'input'}
+    if len(unknown) > 0:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(unknown)))
+
+    if 'file' in submission and not isinstance(submission['file'], str):
+        raise ValueError('"file" must be the name or path of an input file')
+    if 'input' in submission and not isinstance(submission['input'], dict):
+        raise ValueError('"input" must be the contents of an input file (an object)')
+
+    seed = submission.get('seed')
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        raise ValueError('"seed" must be a non-negative integer')
+    for name in OPTIONS[1:]:
+        if name in submission and not isinstance(submission[name], bool):
+            raise ValueError('"' + name + '" must be true or false')
+
+    submission = dict(submission)
+    if 'file' in submission:
+        path = submission['file']
+        submission['file'] = path if os.path.isfile(path) else os.path.join(INPUTS_DIR, path)
+        if not os.path.isfile(submission['file']):
+            raise ValueError('No such input file: ' + path)
+
+    return submission
+
+# ---------- SERVER ----------
+
+class SimulationServer:
+    def __init__(self, host = '127.0.0.1', port = 8765, workers = None, queue_size = 64, max_jobs = 1000):
+        ''' Up to queue_size jobs wait for a worker; the last max_jobs
+            finished jobs (and their results) are kept
+        '''
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+
+        self.jobs = OrderedDict()   # All the jobs kept, by id
+        self.by_key = {}            # Jobs that identical submissions share
+        self.running = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+
+        # Workers are started by a process that is there before the server listens:
+        # forked from the server, workers started again (see restart_workers) would
+        # keep its open connections
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+        # Workers are started (and import the simulator) before any job comes
+        self.events = self.context.Queue()
+        self.restarting = asyncio.Lock()
+        await self.start_workers()
+
+        self.reader = threading.Thread(target = self.read_events, daemon = True)
+        self.reader.start()
+
+        self.dispatchers = [asyncio.ensure_future(self.dispatch()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+
+    async def start_workers(self):
+        ''' Starts the workers and waits until they are ready '''
+        self.executor = ProcessPoolExecutor(self.workers, mp_context = self.context,
+                                            initializer = init_worker, initargs = (self.events,))
+        await asyncio.gather(*[self.loop.run_in_executor(self.executor, warm_up) for _ in range(self.workers)])
+
+    async def restart_workers(self, broken):
+        ''' New workers instead of those of executor broken (one of them died),
+            unless another dispatcher has already started them
+        '''
+        async with self.restarting:
+            if self.executor is broken:
+                broken.shutdown(wait = False)
+                await self.start_workers()
+
+    async def serve_forever(self):
+        await self.start()
+        print('Simulation server on http://' + self.host + ':' + str(self.port) + ' with ' + \
+              str(self.workers) + ' workers')
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+
+        # Workers only exit once their messages are read, so the reader goes on
+        # until they have; then it is stopped, while the event loop is still there
+        await asyncio.to_thread(self.executor.shutdown, cancel_futures = True)
+        self.events.put(None)
+        await asyncio.to_thread(self.reader.join)
+
+    # ---------- JOBS ----------
+
+    def submit(self, submission):
+        ''' Returns (job, shared): the job of an identical submission if there
+            is one (running, queued, or done with a seed), a new one otherwise.
+            Raises asyncio.QueueFull if there is no room for it.
+        '''
+        key = submission_key(submission)
+
+        job = self.by_key.get(key)
+        if job is not None and (not job.done() or (job.status == 'done' and submission.get('seed') is not None)):
+            return job, True
+
+        job = Job(submission, key)
+        self.queue.put_nowait(job)
+
+        self.jobs[job.id] = job
+        self.by_key[key] = job
+        return job, False
+
+    async def dispatch(self):
+        ''' Gives queued jobs to a worker, one at a time '''
+        while True:
+            job = await self.queue.get()
+
+            job.status = 'running'
+            job.started = time.time()
+            self.running += 1
+
+            try:
+                await self.run(job)
+            except Exception as error:
+                self.receive(('failed', job.id, type(error).__name__ + ': ' + str(error)))
+            finally:
+                self.running -= 1
+
+    async def run(self, job):
+        ''' Runs job in a worker. If a worker dies (killed, out of memory...),
+            the jobs that were running fail and new workers are started
+        '''
+        while True:
+            executor = self.executor
+            try:
+                running = self.loop.run_in_executor(executor, run_job, job.id, job.submission)
+            except BrokenProcessPool:
+                # The job did not start: it waits for the new workers
+                await self.restart_workers(executor)
+                continue
+
+            try:
+                await running
+            except BrokenProcessPool:
+                await self.restart_workers(executor)
+                raise BrokenProcessPool('A worker died while running the job')
+            return
+
+    def read_events(self):
+        ''' Thread that passes the messages of the workers to the event loop '''
+        while True:
+            message = self.events.get()
+            if message is None:
+                break
+            self.loop.call_soon_threadsafe(self.receive, message)
+
+    def receive(self, message):
+        kind, job_id, data = message
+
+        job = self.jobs.get(job_id)
+        if job is None or job.done():
+            return
+
+        if kind == 'rows':
+            job.rows.extend(data)
+        else:
+            job.status = kind
+            job.finished = time.time()
+            if kind == 'done':
+                job.result = data
+            else:
+                job.error = data
+                del self.by_key[job.key]
+
+            self.forget_old_jobs()
+
+        job.notify()
+
+    def forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.done()]
+
+        for job in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self.jobs[job.id]
+            if self.by_key.get(job.key) is job:
+                del self.by_key[job.key]
+
+    # ---------- HTTP ----------
+
+    async def handle(self, reader, writer):
+        try:
+            await self.serve_request(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass    # The client went away
+        finally:
+            writer.close()
+
+    async def serve_request(self, reader, writer):
+        try:
+            method, target, headers, body = await read_request(reader)
+            await self.route(method, target, body, writer)
+        except HttpError as error:
+            await respond(writer, error.status, {'error': error.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as error:
+            traceback.print_exc()
+            await respond(writer, 500, {'error': 'Internal error: ' + type(error).__name__ + ': ' + str(error)})
+
+    async def route(self, method, target, body, writer):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part != '']
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if parts == ['jobs'] and method == 'POST':
+            await self.post_job(body, writer)
+        elif parts == ['status'] and method == 'GET':
+            await respond(writer, 200, {'workers': self.workers, 'queued': self.queue.qsize(),
+                                        'queue_size': self.queue_size, 'running': self.running,
+                                        'jobs': len(self.jobs)})
+        elif len(parts) in [2, 3] and parts[0] == 'jobs' and method == 'GET':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, 'No such job: ' + parts[1])
+
+            if len(parts) == 2:
+                await respond(writer, 200, job.info())
+            elif parts[2] == 'metrics':
+                await self.stream_metrics(job, query_number(query, 'from', int), writer)
+            elif parts[2] == 'result':
+                await self.get_result(job, query_number(query, 'wait', float), writer)
+            else:
+                raise HttpError(404, 'Not found: ' + url.path)
+        else:
+            raise HttpError(404, 'Not found: ' + method + ' ' + url.path)
+
+    async def post_job(self, body, writer):
+        try:
+            submission = check_submission(json.loads(body))
+        except ValueError as error:
+            raise HttpError(400, str(error))
+
+        try:
+            job, shared = self.submit(submission)
+        except asyncio.QueueFull:
+            await respond(writer, 503, {'error': 'Too many jobs queued, try again later'}, {'Retry-After': '1'})
+            return
+
+        await respond(writer, 200 if shared else 202, dict(job.info(), shared = shared))
+
+    async def get_result(self, job, wait, writer):
+        deadline = self.loop.time() + wait
+        while not job.done() and self.loop.time() < deadline:
+            await job.changed(deadline - self.loop.time())
+
+        if job.status == 'done':
+            await respond(writer, 200, dict(job.info(), result = job.result))
+        elif job.status == 'failed':
+            await respond(writer, 500, job.info())
+        else:
+            await respond(writer, 202, job.info())
+
+    async def stream_metrics(self, job, sent, writer):
+        ''' Rows from cycle sent on, as they come, until the job ends '''
+        writer.write(('HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                      'Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n').encode())
+
+        while True:
+            if len(job.rows) > sent:
+                rows = job.rows[sent:]
+                sent += len(rows)
+                chunk = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+            elif job.done():
+                break
+            else:
+                await job.changed()
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def query_number(query, name, kind, default = 0):
+    ''' Non-negative number (int or float, as kind) in the query string '''
+    try:
+        value = kind(query.get(name, default))
+    except ValueError:
+        value = -1
+
+    if not 0 <= value < float('inf'):
+        raise HttpError(400, name + ' must be a non-negative number')
+    return value
+
+async def read_request(reader):
+    ''' Method, target, headers and body of an HTTP request '''
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+        raise HttpError(400, 'Bad request line')
+    method, target, _ = request_line
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b'\r\n', b'\n', b'']:
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, 'Bad Content-Length')
+
+    if length < 0:
+        raise HttpError(400, 'Bad Content-Length')
+    if length > MAX_BODY:
+        raise HttpError(413, 'Submissions are limited to ' + str(MAX_BODY) + ' bytes')
+
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method, target, headers, body
+
+async def respond(writer, status, body, headers = None):
+    data = json.dumps(body).encode()
+
+    head = 'HTTP/1.1 ' + str(status) + ' ' + HTTPStatus(status).phrase + '\r\n' + \
+           'Content-Type: application/json\r\nContent-Length: ' + str(len(data)) + '\r\nConnection: close\r\n'
+    for name, value in (headers or {}).items():
+        head += name + ': ' + value + '\r\n'
+
+    writer.write(head.encode() + b'\r\n' + data)
+    await writer.drain()
+
+# ---------- COMMAND LINE ----------
+
+def parse_args():
+    parser = ArgumentParser(description='Local simulation server')
+    parser.add_argument('--host', default='127.0.0.1', type=str,
+                        help='Address to listen on (default: only this machine).')
+    parser.add_argument('-p', '--port', default=8765, type=int,
+                        help='Port to listen on.')
+    parser.add_argument('-j', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: all cores).')
+    parser.add_argument('-q', '--queue', default=64, type=int,
+                        help='Jobs that can wait for a worker; more are refused until there is room.')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    server = SimulationServer(args.host, args.port, workers = args.workers, queue_size = args.queue)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
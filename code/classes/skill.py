@@ -1,10 +1,367 @@
+import math
+import bisect
+import numpy as np
+
+from functools import lru_cache
+
+from history import History, FULL
+
 class Skill:
-  def __init__(self, _id = -1, exp = 0, mot = 0):
+  def __init__(self, _id = -1, exp = 0, mot = 0, retention = None):
+    self._id = _id
+
+    # With a retention policy, histories are kept in arrays (see history.py)
+    if retention is None:
+      self.expertise = [exp]
+      self.motivation = [mot]
+    else:
+      self.expertise = History([exp], retention)
+      self.motivation = History([mot], retention)
+
+  def __str__(self):
+    return '< skill_id: ' + str(self._id) + \
+           ', expertise: ' + str(self.expertise) + \
+           ', motivation: ' + str(self.motivation) + ' >'
+
+######################################################################
+# Lazy skills. Learning and forgetting (Agent.update_memory) are affine
+# recurrences, x' = a * x + b, so n steps can be done at once:
+#   x_n = a^n * x_0 + b * (a^n - 1) / (a - 1)
+# A LazySkillStore only remembers, for every skill, the step at which
+# it last changed between learning and forgetting and its values then.
+# The rest is computed when it is asked for.
+######################################################################
+@lru_cache(maxsize=None)
+def memory_coefficients(params):
+  ''' (a, b) of the four recurrences of Agent.update_memory:
+      learn expertise, learn motivation, forget expertise, forget motivation
+  '''
+  P = params
+  return ((1 - P.LAM_LEARN / P.MAX_E, P.LAM_LEARN),
+          (P.MAX_M / (P.MAX_M - P.MU_MOTIV), -P.MU_MOTIV * P.MAX_M / (P.MAX_M - P.MU_MOTIV)),
+          (P.MAX_E / (P.MAX_E - P.MU_LEARN), -P.MU_LEARN * P.MAX_E / (P.MAX_E - P.MU_LEARN)),
+          (1 - P.LAM_MOTIV / P.MAX_M, P.LAM_MOTIV))
+
+def affine_steps(a, b, n):
+  ''' Returns (A, B) such that n steps of x' = a * x + b are x_n = A * x_0 + B '''
+  if n == 0:
+    return 1.0, 0.0
+  if a == 1:
+    return 1.0, n * b
+  if a > 0:
+    # a^n - 1 without cancellation when a is close to 1
+    growth = math.expm1(n * math.log(a))
+    return growth + 1, b * growth / (a - 1)
+
+  return a ** n, b * (a ** n - 1) / (a - 1)
+
+def affine_series(steps, x0, n):
+  ''' The n values after x0 of x' = a * x + b, the (a, b) of every step
+      being steps[j % len(steps)] (e.g. learning and forgetting in turns)
+  '''
+  # Whole rounds of steps are a single affine step
+  a_round, b_round = 1.0, 0.0
+  for a, b in steps:
+    a_round, b_round = a * a_round, a * b_round + b
+
+  rounds = np.arange(-(-n // len(steps)))
+  if a_round == 1:
+    A, B = np.ones(len(rounds)), rounds * b_round
+  elif a_round > 0:
+    growth = np.expm1(rounds * math.log(a_round))
+    A, B = growth + 1, b_round * growth / (a_round - 1)
+  else:
+    A = a_round ** rounds
+    B = b_round * (A - 1) / (a_round - 1)
+
+  # Values at the start of every round, and then step by step within it
+  x = A * x0 + B
+  values = np.empty((len(rounds), len(steps)))
+  for k, (a, b) in enumerate(steps):
+    x = a * x + b
+    values[:, k] = x
+
+  return values.ravel()[:n]
+
+class LazySkillStore:
+  def __init__(self, skills, params):
+    self.params = params
+    self.step = 0        # Number of memory updates so far
+
+    # For every skill, segments of steps with the same regime, as
+    # (first step, expertise, motivation, learning)
+    self.segments = [[(0, skill.expertise[-1], skill.motivation[-1], False)] for skill in skills]
+    self.learning = set()
+
+    self.skills = [LazySkill(self, skill._id) for skill in skills]
+    self.ltm = LongTermMemory(self)
+
+  def values_at(self, skill_id, step, segment = None):
+    ''' Expertise and motivation of a skill after step memory updates '''
+    start, exp, mot, learning = self.segments[skill_id][-1] if segment is None else segment
+
+    coefficients = memory_coefficients(self.params)
+    (a_e, b_e), (a_m, b_m) = coefficients[0:2] if learning else coefficients[2:4]
+
+    A_e, B_e = affine_steps(a_e, b_e, step - start)
+    A_m, B_m = affine_steps(a_m, b_m, step - start)
+
+    return A_e * exp + B_e, A_m * mot + B_m
+
+  def expertise(self, skill_id):
+    return self.values_at(skill_id, self.step)[0]
+
+  def motivation(self, skill_id):
+    return self.values_at(skill_id, self.step)[1]
+
+  def set_learning(self, skill_ids):
+    ''' Skills in skill_ids are learnt from now on, the rest are forgotten.
+        Only the skills that change regime are touched.
+    '''
+    skill_ids = set(skill_ids)
+
+    for skill_id in (skill_ids - self.learning) | (self.learning - skill_ids):
+      exp, mot = self.values_at(skill_id, self.step)
+      segment = (self.step, exp, mot, skill_id in skill_ids)
+
+      if self.segments[skill_id][-1][0] == self.step:
+        self.segments[skill_id][-1] = segment
+      else:
+        self.segments[skill_id].append(segment)
+
+    self.learning = skill_ids
+
+  def advance(self, n = 1):
+    ''' n memory updates (learning and forgetting) of every skill '''
+    self.step += n
+
+  def history(self, skill_id, which):
+    ''' Full history (as in Skill.expertise / Skill.motivation) of a skill.
+        which is 0 for expertise and 1 for motivation.
+    '''
+    segments = self.segments[skill_id]
+    values = np.empty(self.step + 1)
+
+    for k, segment in enumerate(segments):
+      end = segments[k+1][0] if k + 1 < len(segments) else self.step + 1
+      values[segment[0]:end] = [self.values_at(skill_id, step, segment)[which]
+                                for step in range(segment[0], end)]
+
+    return values
+
+class LazySkill:
+  ''' Same interface as Skill, for skills kept in a LazySkillStore '''
+  def __init__(self, store, _id):
+    self.store = store
+    self._id = _id
+    self.expertise = LazyHistory(store, _id, 0)
+    self.motivation = LazyHistory(store, _id, 1)
+
+  def __str__(self):
+    return '< skill_id: ' + str(self._id) + \
+           ', expertise: ' + str(self.expertise[-1]) + \
+           ', motivation: ' + str(self.motivation[-1]) + ' (lazy) >'
+
+class LazyHistory:
+  ''' Read-only list-like view of the history of a lazy skill '''
+  def __init__(self, store, skill_id, which):
+    self.store = store
+    self.skill_id = skill_id
+    self.which = which
+
+  def __len__(self):
+    return self.store.step + 1
+
+  def __getitem__(self, ix):
+    if isinstance(ix, slice):
+      return self.store.history(self.skill_id, self.which)[ix].tolist()
+
+    step = ix + len(self) if ix < 0 else ix
+    if not 0 <= step < len(self):
+      raise IndexError('history index out of range')
+
+    segments = self.store.segments[self.skill_id]
+    if step >= segments[-1][0]:
+      segment = segments[-1]
+    else:
+      segment = segments[bisect.bisect_right([segment[0] for segment in segments], step) - 1]
+
+    return self.store.values_at(self.skill_id, step, segment)[self.which]
+
+  def __iter__(self):
+    return iter(self.store.history(self.skill_id, self.which).tolist())
+
+  def __array__(self, dtype = None, copy = None):
+    values = self.store.history(self.skill_id, self.which)
+    return values if dtype is None else values.astype(dtype)
+
+  def __str__(self):
+    return str(list(self))
+
+class LongTermMemory:
+  ''' Skills of a LazySkillStore that are being forgotten (same use as Agent.ltm) '''
+  def __init__(self, store):
+    self.store = store
+
+  def __iter__(self):
+    return (skill for skill in self.store.skills if skill._id not in self.store.learning)
+
+  def __len__(self):
+    return len(self.store.skills) - len(self.store.learning)
+
+######################################################################
+# Skills as arrays. A SkillArrays keeps the expertise and motivation of
+# all the skills of an agent in vectors indexed by skill id, with the
+# step at which every skill was last brought up to date, and a boolean
+# mask for the short-term memory. As in a LazySkillStore, a memory
+# update only counts steps: the skills that change between learning and
+# forgetting, or that are read, are brought up to date at once with the
+# closed form of the recurrences (so results are Agent's up to floating
+# point rounding). Their histories are History objects, filled with the
+# values of the steps they missed, so the retention policy applies.
+######################################################################
+def affine_columns(a, b, x0, n):
+  ''' The n[c] values after x0[c] of x' = a[c] * x + b[c], for every
+      column c, one column after the other
+  '''
+  column = np.repeat(np.arange(len(n)), n)
+  steps = np.arange(1, len(column) + 1) - np.repeat(np.cumsum(n) - n, n)
+  a, b = a[column], b[column]
+
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    # a^n - 1 without cancellation when a is close to 1 (see affine_steps)
+    growth = np.where(a > 0, np.expm1(steps * np.log(a)), a ** steps - 1)
+    B = np.where(a == 1, steps * b, b * growth / (a - 1))
+
+  return (growth + 1) * x0[column] + B
+
+class SkillArrays:
+  def __init__(self, skills, params, retention = None):
+    self.params = params
+    self.step = 0        # Number of memory updates so far
+
+    # Values of every skill at the step it was last brought up to date
+    self.exp = np.array([skill.expertise[-1] for skill in skills], dtype = float)
+    self.mot = np.array([skill.motivation[-1] for skill in skills], dtype = float)
+    self.since = np.zeros(len(skills), dtype = np.int64)
+
+    self.stm = np.zeros(len(skills), dtype = bool)
+    self.learning = set()   # Skill ids in the mask
+
+    retention = FULL if retention is None else retention
+    self.exp_history = [History([exp], retention) for exp in self.exp.tolist()]
+    self.mot_history = [History([mot], retention) for mot in self.mot.tolist()]
+
+    self.skills = [ArraySkill(self, skill._id) for skill in skills]
+    self.ltm = ArrayLongTermMemory(self)
+
+  def update(self, skill_ids):
+    ''' Brings the skills in skill_ids (and their histories) up to date '''
+    if len(skill_ids) == 1 and self.step - self.since[skill_ids[0]] <= 16:
+      return self.update_one(int(skill_ids[0]))
+
+    skill_ids = np.asarray(skill_ids, dtype = np.int64)
+    skill_ids = skill_ids[self.since[skill_ids] < self.step]
+    if len(skill_ids) == 0:
+      return
+
+    (l_e, l_m, f_e, f_m) = [np.array(coefficients) for coefficients in memory_coefficients(self.params)]
+    stm = self.stm[skill_ids, np.newaxis]
+    (a_e, b_e), (a_m, b_m) = np.where(stm, l_e, f_e).T, np.where(stm, l_m, f_m).T
+
+    n = self.step - self.since[skill_ids]
+    exp = affine_columns(a_e, b_e, self.exp[skill_ids], n)
+    mot = affine_columns(a_m, b_m, self.mot[skill_ids], n)
+
+    ends = np.cumsum(n)
+    for skill_id, start, end in zip(skill_ids.tolist(), (ends - n).tolist(), ends.tolist()):
+      self.exp_history[skill_id].extend(exp[start:end])
+      self.mot_history[skill_id].extend(mot[start:end])
+
+    self.exp[skill_ids] = exp[ends - 1]
+    self.mot[skill_ids] = mot[ends - 1]
+    self.since[skill_ids] = self.step
+
+  def update_one(self, skill_id):
+    ''' update of a single skill a few steps behind, without numpy '''
+    n = self.step - self.since[skill_id].item()
+    if n == 0:
+      return
+
+    coefficients = memory_coefficients(self.params)
+    (a_e, b_e), (a_m, b_m) = coefficients[0:2] if self.stm[skill_id] else coefficients[2:4]
+    exp, mot = self.exp[skill_id].item(), self.mot[skill_id].item()
+
+    for steps in range(1, n + 1):
+      A_e, B_e = affine_steps(a_e, b_e, steps)
+      A_m, B_m = affine_steps(a_m, b_m, steps)
+      self.exp_history[skill_id].append(A_e * exp + B_e)
+      self.mot_history[skill_id].append(A_m * mot + B_m)
+
+    self.exp[skill_id] = self.exp_history[skill_id].last
+    self.mot[skill_id] = self.mot_history[skill_id].last
+    self.since[skill_id] = self.step
+
+  def values(self, skill_ids):
+    ''' Current expertise and motivation of the skills in skill_ids '''
+    self.update(np.unique(skill_ids))
+    return self.exp[skill_ids], self.mot[skill_ids]
+
+  def expertise(self, skill_id):
+    if self.since[skill_id] < self.step:
+      self.update([skill_id])
+    return self.exp[skill_id].item()
+
+  def motivation(self, skill_id):
+    if self.since[skill_id] < self.step:
+      self.update([skill_id])
+    return self.mot[skill_id].item()
+
+  def set_learning(self, skill_ids):
+    ''' Skills in skill_ids are learnt from now on, the rest are forgotten.
+        Only the skills that change regime are touched.
+    '''
+    skill_ids = set(skill_ids)
+    changed = sorted((skill_ids - self.learning) | (self.learning - skill_ids))
+
+    if len(changed) > 0:
+      self.update(changed)
+      self.stm[changed] = ~self.stm[changed]
+
+    self.learning = skill_ids
+
+  def advance(self, n = 1):
+    ''' n memory updates (learning and forgetting) of every skill '''
+    self.step += n
+
+class ArraySkill:
+  ''' Same interface as Skill, for skills kept in a SkillArrays '''
+  def __init__(self, store, _id):
+    self.store = store
     self._id = _id
-    self.expertise = [exp]
-    self.motivation = [mot]
+
+  @property
+  def expertise(self):
+    self.store.update([self._id])
+    return self.store.exp_history[self._id]
+
+  @property
+  def motivation(self):
+    self.store.update([self._id])
+    return self.store.mot_history[self._id]
 
   def __str__(self):
     return '< skill_id: ' + str(self._id) + \
            ', expertise: ' + str(self.expertise) + \
-           ', motivation: ' + str(self.motivation) + ' >'
\ No newline at end of file
+           ', motivation: ' + str(self.motivation) + ' >'
+
+class ArrayLongTermMemory:
+  ''' Skills of a SkillArrays that are being forgotten (same use as Agent.ltm) '''
+  def __init__(self, store):
+    self.store = store
+
+  def __iter__(self):
+    return (skill for skill in self.store.skills if not self.store.stm[skill._id])
+
+  def __len__(self):
+    return len(self.store.skills) - len(self.store.learning)
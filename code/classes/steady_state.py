@@ -0,0 +1,306 @@
+######################################################################
+######################################################################
+# Steady states. In long actions, once the skills being used have been
+# learnt (expertise close to MAX_E), cycles repeat themselves: same
+# allocation, performance and coordination time and frustration, cycle
+# after cycle or every few cycles. A SteadyState watches the cycles of
+# the workplace and, when the last ones repeat (within a tolerance)
+# with a period of up to max_period cycles, jumps ahead to the end of
+# the shortest pending action instead of negotiating every cycle:
+#  - the skipped cycles get the values (Tperf, coordination time,
+#    allocation times, frustration...) of the repeating ones, kept
+#    as runs in the histories and the output (see history.History.
+#    repeat), so this costs the same for any number of cycles,
+#  - learning and forgetting are computed for all of them at once
+#    (they are affine recurrences, see skill.py): lazy and array
+#    skills only count the cycles, plain skills (and output with
+#    skills) get the values of every cycle with numpy,
+#  - the timeline gets one event per action and agent for the whole
+#    jump, and steady_state.segments records every jump.
+# Jumps are cut short where expertise or motivation of the skills
+# being used would move more than the tolerance, or cross TH_E/TH_M.
+# Cycles that drew random numbers (undecided negotiations, counted by
+# the workplace's agent.CountingRng) are never steady, so the results only differ
+# within the tolerance. Cycles before the skills are learnt are done
+# one by one: only runs with long actions gain.
+#
+# Usage: Workplace(file, steady_state = SteadyState(tolerance = 1e-6))
+######################################################################
+######################################################################
+
+import numpy as np
+
+from collections import deque, namedtuple
+
+from agent import LazyAgent, ArrayAgent
+from run_output import make_row
+from skill import memory_coefficients, affine_series
+from timeline import Event
+
+# What a cycle did. key is (task, action ids, skill ids, assignments),
+# values the numbers compared between cycles. alloc and frustration
+# are the values appended to every agent's histories.
+Cycle = namedtuple('Cycle', ['key', 'values', 'alloc', 'frustration', 'performance', 'Tperf', 'coordination'])
+
+# Cycles skipped at once
+Segment = namedtuple('Segment', ['start_time', 'cycles', 'period', 'performance_time', 'coordination_time'])
+
+class SteadyState:
+    def __init__(self, tolerance = 1e-6, max_period = 4, repeats = 3, min_skip = 8):
+        ''' Cycles are the same if their values differ by less than tolerance
+            (relative, for values above 1). A period must repeat repeats times
+            before jumping, and jumps shorter than min_skip cycles are not done.
+        '''
+        self.tolerance = tolerance
+        self.max_period = max_period
+        self.repeats = repeats
+        self.min_skip = min_skip
+
+        self.cycles = deque(maxlen = max_period * (repeats + 1))
+        self.segments = []
+        self.before = None
+        self.next_try = 0
+
+    # ---------- WATCHING ----------
+
+    def begin_cycle(self, wp):
+        self.before = (wp.rng.draws, [(count(agent.allocation_times), count(agent.frustration))
+                                      for agent in wp.agents])
+
+    def end_cycle(self, wp, assignments, allocation_times, skill_ids, action_ids):
+        ''' Called by Workplace.process_cycle with what the cycle did, before time goes on '''
+        draws, counts = self.before
+
+        if wp.rng.draws != draws:
+            self.cycles.clear()
+            return
+
+        alloc = [tail(agent.allocation_times, count(agent.allocation_times) - n_alloc)
+                 for agent, (n_alloc, _) in zip(wp.agents, counts)]
+        frustration = [tail(agent.frustration, count(agent.frustration) - n_frustration)
+                       for agent, (_, n_frustration) in zip(wp.agents, counts)]
+        performance = [agent.performance_times[wp.time] for agent in wp.agents]
+
+        # Negotiations of the next cycle start from these
+        i_you = [value for agent in wp.agents for skill_id in sorted(set(skill_ids))
+                 for value in agent.get_initial_i_you(wp, skill_id)]
+
+        Tperf, coordination = wp.Tperf[wp.time], wp.coordination_times[wp.time]
+
+        values = np.array(list(allocation_times) + [value for values in alloc + frustration for value in values] +
+                          performance + [Tperf, coordination] + i_you, dtype = float)
+
+        key = (wp.current_task._id, tuple(action_ids), tuple(skill_ids), tuple(int(k) for k in assignments))
+
+        self.cycles.append(Cycle(key, values, alloc, frustration, performance, Tperf, coordination))
+
+    def same(self, cycle0, cycle1):
+        return cycle0.key == cycle1.key and len(cycle0.values) == len(cycle1.values) and \
+               np.all(np.abs(cycle0.values - cycle1.values) <= self.tolerance * np.maximum(1, np.abs(cycle1.values)))
+
+    def period(self):
+        ''' Shortest period with which the last cycles repeat, or None '''
+        for period in range(1, self.max_period + 1):
+            if len(self.cycles) < period * (self.repeats + 1):
+                return None
+
+            if all(self.same(self.cycles[-j], self.cycles[-j - period]) for j in range(1, period * self.repeats + 1)):
+                return period
+
+        return None
+
+    # ---------- JUMPING ----------
+
+    def skip(self, wp, until = None):
+        ''' If the last cycles of wp repeat, does the next ones at once (until
+            the shortest pending action is completed, or time reaches until).
+            Returns the Segment skipped, or None.
+        '''
+        if wp.time < self.next_try:
+            return None
+
+        period = self.period()
+        if period is None:
+            return None
+
+        phases = list(self.cycles)[-period:]
+        task_id, action_ids, skill_ids, _ = phases[-1].key
+
+        pending = [action for action in wp.current_task.actions if action.completion < action.duration]
+        if tuple(action._id for action in pending) != action_ids:
+            return None
+
+        cycles = min(action.duration - action.completion for action in pending)
+        if until is not None:
+            cycles = min(cycles, until - wp.time)
+        if cycles < self.min_skip:
+            return None
+
+        # Skills learnt by every agent in every phase
+        learning = [[set(skill_id for skill_id, assignment in zip(phase.key[2], phase.key[3]) if assignment == k)
+                     for phase in phases] for k in range(len(wp.agents))]
+
+        # How long the skills being negotiated stay steady
+        for k, agent in enumerate(wp.agents):
+            series = memory_series(agent, learning[k], cycles, set(skill_ids))
+            for skill_id, values in series.items():
+                learnt = any(skill_id in skills for skills in learning[k])
+                cycles = min(cycles, self.steady_cycles(agent, skill_id, values, learnt, period))
+
+        if cycles < self.min_skip:
+            # Not worth trying again before a few more cycles
+            self.next_try = wp.time + self.min_skip
+            return None
+
+        # Expertise and motivation after every cycle
+        with_skills = wp.output is not None and wp.output.skills
+        series = [memory_series(agent, agent_learning, cycles, range(len(agent.skillset)))
+                  if with_skills or not isinstance(agent, (LazyAgent, ArrayAgent)) else None
+                  for agent, agent_learning in zip(wp.agents, learning)]
+
+        t0 = wp.time
+        times = list(range(t0, t0 + period))
+
+        # Every history gets the values of the period as a run (see history.History.repeat)
+        wp.coordination_times.repeat(times, [phase.coordination for phase in phases], cycles, period)
+        wp.Tperf.repeat(times, [phase.Tperf for phase in phases], cycles, period)
+        performance_time = run_sum([float(phase.Tperf) for phase in phases], cycles)
+        coordination_time = run_sum([float(phase.coordination) for phase in phases], cycles)
+
+        records = []
+        for k, agent in enumerate(wp.agents):
+            agent.performance_times.repeat(times, [phase.performance[k] for phase in phases], cycles, period)
+            agent.allocation_times.repeat([value for phase in phases for value in phase.alloc[k]],
+                                          run_sum([len(phase.alloc[k]) for phase in phases], cycles))
+            agent.frustration.repeat([value for phase in phases for value in phase.frustration[k]],
+                                     run_sum([len(phase.frustration[k]) for phase in phases], cycles))
+
+            # Actions of a cycle go to action_history when the next one starts
+            # (see Agent.flush_prev_act): the ones of the last cycle are current
+            agent_records = [[{'task': task_id, 'action': action_id, 'start_time': time}
+                              for action_id, assignment in zip(action_ids, phase.key[3]) if assignment == k]
+                             for time, phase in zip(times, phases)]
+            agent.action_history.extend(agent.current_action)
+            agent.action_history.repeat([record for cycle_records in agent_records for record in cycle_records],
+                                        run_sum([len(cycle_records) for cycle_records in agent_records], cycles - 1),
+                                        {'start_time': period})
+            records.append([dict(record, start_time = t0 + cycles - 1)
+                            for record in agent_records[(cycles - 1) % period]])
+
+        if wp.output is not None:
+            rows = []
+            frustration = [agent.get_frustration() for agent in wp.agents]
+            for time, phase in zip(times, phases):
+                for k in range(len(wp.agents)):
+                    if len(phase.frustration[k]) > 0:
+                        frustration[k] = phase.frustration[k][-1]
+                rows.append(make_row(time, phase.Tperf, phase.coordination, phase.performance, frustration))
+
+            expertise = motivation = None
+            if with_skills:
+                expertise = [np.column_stack([values[0] for values in agent_series.values()]) for agent_series in series]
+                motivation = [np.column_stack([values[1] for values in agent_series.values()]) for agent_series in series]
+            wp.output.repeat(wp, rows[:cycles], cycles, expertise, motivation)
+
+        last = phases[(cycles - 1) % period]
+
+        for agent, agent_learning, agent_series, agent_records in zip(wp.agents, learning, series, records):
+            if isinstance(agent, (LazyAgent, ArrayAgent)):
+                if all(skills == agent_learning[0] for skills in agent_learning):
+                    agent.memory.set_learning(agent_learning[0])
+                    agent.memory.advance(cycles)
+                else:
+                    for j in range(cycles):
+                        agent.memory.set_learning(agent_learning[j % period])
+                        agent.memory.advance()
+            else:
+                for skill in agent.skillset:
+                    skill.expertise.extend(agent_series[skill._id][0])
+                    skill.motivation.extend(agent_series[skill._id][1])
+
+            # Short and long-term memory as after the last cycle
+            agent.current_action = []
+            agent.flush_prev_act(last.key[3], last.key[2])
+            agent.current_action = agent_records
+
+        for action in pending:
+            action.completion += cycles
+
+        add_events(wp.timeline, t0, cycles, phases, task_id)
+
+        wp.time += cycles
+        self.cycles.clear()
+
+        segment = Segment(t0, cycles, period, performance_time, coordination_time)
+        self.segments.append(segment)
+        return segment
+
+    def steady_cycles(self, agent, skill_id, values, learnt, period):
+        ''' Cycles (of the ones in values, expertise and motivation of a skill
+            after every cycle) before the skill moves more than the tolerance
+            from the first period, or crosses TH_E or TH_M. Below TH_E, the
+            values of a skill that is not learnt do not matter.
+        '''
+        P = agent.params
+        exp, mot = values
+        exp0, mot0 = agent.get_latest_expertise(skill_id), agent.get_latest_motivation(skill_id)
+
+        moved = (exp >= P.TH_E) != (exp0 >= P.TH_E)
+
+        if learnt or exp0 >= P.TH_E:
+            same_phase = np.arange(len(exp)) % period
+            moved |= (mot >= P.TH_M) != (mot0 >= P.TH_M)
+            moved |= np.abs(exp - exp[same_phase]) > self.tolerance * P.MAX_E
+            moved |= np.abs(mot - mot[same_phase]) > self.tolerance * P.MAX_M
+
+        return int(np.argmax(moved)) if moved.any() else len(exp)
+
+def memory_series(agent, learning, cycles, skill_ids):
+    ''' Expertise and motivation of the skills in skill_ids after each of the
+        next cycles, the skills in learning[j % len(learning)] being learnt in
+        cycle j and the rest forgotten ({skill_id: (expertise, motivation)})
+    '''
+    learn_exp, learn_mot, forget_exp, forget_mot = memory_coefficients(agent.params)
+
+    series = {}
+    for skill_id in sorted(skill_ids):
+        exp_steps = [learn_exp if skill_id in skills else forget_exp for skills in learning]
+        mot_steps = [learn_mot if skill_id in skills else forget_mot for skills in learning]
+        series[skill_id] = (affine_series(exp_steps, agent.get_latest_expertise(skill_id), cycles),
+                            affine_series(mot_steps, agent.get_latest_motivation(skill_id), cycles))
+
+    return series
+
+def add_events(timeline, t0, cycles, phases, task_id):
+    ''' Events of the skipped cycles: one for the whole jump if an action is
+        always done by the same agent, one per cycle otherwise
+    '''
+    period = len(phases)
+    events = []
+
+    for ix, action_id in enumerate(phases[0].key[1]):
+        agents = [phase.key[3][ix] for phase in phases]
+
+        if all(agent_id == agents[0] for agent_id in agents):
+            events.append(Event(start_time = t0, duration = cycles, task_id = task_id,
+                                action_id = action_id, agent_id = agents[0]))
+        else:
+            events.extend(Event(start_time = t0 + j, duration = 1, task_id = task_id,
+                                action_id = action_id, agent_id = agents[j % period]) for j in range(cycles))
+
+    for event in sorted(events, key = lambda event: event.start_time):
+        timeline.add_event(event)
+
+# ---------- HELPERS ----------
+
+def run_sum(values, n):
+    ''' Sum of the first n values of values repeated over and over '''
+    rounds, rest = divmod(n, len(values))
+    return rounds * sum(values) + sum(values[:rest])
+
+def count(history):
+    ''' Values ever appended to a history (a list or history.History) '''
+    return len(history) if isinstance(history, list) else history.count
+
+def tail(history, n):
+    return history[len(history) - n:] if isinstance(history, list) else history.tail(n)
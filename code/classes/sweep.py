@@ -0,0 +1,272 @@
+######################################################################
+######################################################################
+# Parameter sweeps: the same input file is run with many different
+# parameters (or MBTI pairings) in a pool of processes, and a summary
+# of every run is streamed into a single columnar results file (see
+# columnar.py). Every run draws its random numbers from its own seed,
+# derived from the seed of the sweep and the run id, so results do not
+# depend on the workers, and an interrupted sweep is resumed by running
+# it again with the same design, seed and output file.
+#
+# Example (from code/classes):
+#   python sweep.py -i input_low_good.json -g grid.json -o sweep.col
+# where grid.json is e.g. {"beta": [0.5, 1], "mbti": [["ISTP", "ENFJ"]]}
+######################################################################
+######################################################################
+
+import os
+import copy
+import json
+import hashlib
+import itertools
+import numpy as np
+import multiprocessing
+
+from argparse import ArgumentParser
+
+from workplace import Workplace
+from columnar import ColumnWriter, ColumnReader
+from history import history_sum
+from cache import ResultCache
+from memo import NegotiationMemo
+from lockstep import LockstepEngine
+from scenario import Scenario, read_json
+import my_parameters as P
+
+# ---------- DESIGNS ----------
+# A design is a list of runs, every run being a dictionary of overrides:
+# json parameter names ('beta', 'excite'...) or 'mbti' (one per agent)
+
+def grid_design(grid):
+    ''' All the combinations of the values in grid (name -> list of values) '''
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+def random_design(ranges, n_runs, seed = 0):
+    ''' n_runs random runs. Every entry of ranges is either [low, high]
+        (uniform) or {"choices": [...]} (one of them at random)
+    '''
+    rng = np.random.RandomState(seed)
+    design = [{} for _ in range(n_runs)]
+
+    for name, spec in ranges.items():
+        if isinstance(spec, dict):
+            picks = rng.randint(0, len(spec['choices']), size = n_runs)
+            values = [spec['choices'][pick] for pick in picks]
+        else:
+            values = rng.uniform(spec[0], spec[1], size = n_runs).tolist()
+
+        for run, value in zip(design, values):
+            run[name] = value
+
+    return design
+
+def design_hash(base_data, design, seed = 0):
+    ''' Identifies a sweep, so that a results file is only resumed with the
+        same input, design and seed
+    '''
+    if isinstance(base_data, Scenario):
+        base_data = base_data.digest
+
+    return hashlib.sha1(json.dumps([base_data, design, seed], sort_keys = True).encode()).hexdigest()
+
+def run_seed(seed, run_id):
+    ''' Seed of the random numbers of run run_id of a sweep with seed seed '''
+    return np.random.SeedSequence([seed, run_id])
+
+# ---------- RUNS ----------
+
+def apply_overrides(base_data, overrides):
+    ''' Returns a copy of the input data with the overrides of a run '''
+    if isinstance(base_data, Scenario):
+        return base_data.to_data(overrides)
+
+    data = copy.deepcopy(base_data)
+
+    for name, value in overrides.items():
+        if name == 'mbti':
+            for agent, mbti in zip(data['agents'], value):
+                agent['mbti'] = mbti
+        elif name in P.JSON_KEYS:
+            data['parameters'][name] = value
+        else:
+            raise KeyError('Unknown sweep variable: ' + name)
+
+    return data
+
+def summarise(wp):
+    ''' Summary of a finished run '''
+    summary = {
+        'sum_perf_time': wp.get_sum_perf_time(),
+        'total_coordination_time': float(history_sum(wp.coordination_times)),
+        'cycles': wp.time,
+    }
+
+    for agent in wp.agents:
+        summary['final_frustration_' + str(agent._id)] = float(agent.get_frustration())
+
+    return summary
+
+# Input data of the sweep (data of the json or a scenario.Scenario, which every
+# worker maps again), seed, cache of results and memo of negotiations, loaded once per worker process
+_base_data = None
+_seed = 0
+_cache = None
+_memo = None
+
+def init_worker(base_data, cache_dir = None, memo_size = 0, seed = 0):
+    global _base_data, _seed, _cache, _memo
+    _base_data = base_data
+    _seed = seed
+    _cache = ResultCache(cache_dir) if cache_dir is not None else None
+    _memo = NegotiationMemo(memo_size) if memo_size > 0 else None
+
+def run_one(run):
+    ''' Runs one point of the design (run_id, overrides) and returns a row of
+        the results file
+    '''
+    run_id, overrides = run
+
+    if _memo is not None:
+        hits, misses = _memo.hits, _memo.misses
+
+    seed = run_seed(_seed, run_id)
+
+    if isinstance(_base_data, Scenario):
+        wp = Workplace(seed = seed, cache = _cache, negotiation_memo = _memo)
+        _base_data.load_into(wp, overrides)
+    else:
+        wp = Workplace(data = apply_overrides(_base_data, overrides), seed = seed, cache = _cache, negotiation_memo = _memo)
+    wp.process_tasks(output_moods = False)
+
+    row = {'run_id': run_id}
+    for name, value in overrides.items():
+        row[name] = '-'.join(value) if name == 'mbti' else value
+    row.update(summarise(wp))
+
+    if _memo is not None:
+        row['memo_hits'] = _memo.hits - hits
+        row['memo_misses'] = _memo.misses - misses
+
+    return row
+
+def run_lockstep(runs):
+    ''' Runs a batch of points of the design (list of (run_id, overrides))
+        with the lockstep engine and returns their rows
+    '''
+    engine = LockstepEngine([apply_overrides(_base_data, overrides) for _, overrides in runs],
+                            seeds = [run_seed(_seed, run_id) for run_id, _ in runs], record = False)
+    summaries = engine.run().summaries()
+
+    rows = []
+    for k, (run_id, overrides) in enumerate(runs):
+        row = {'run_id': run_id}
+        for name, value in overrides.items():
+            row[name] = '-'.join(value) if name == 'mbti' else value
+        row.update({name: values[k].item() for name, values in summaries.items()})
+        rows.append(row)
+
+    return rows
+
+def run_sweep(base_data, design, output, workers = None, chunksize = 4, flush_every = 64, verbose = True,
+              cache_dir = None, memo_size = 0, engine = 'objects', lockstep_batch = 1024, seed = 0):
+    ''' Runs every point of the design in a pool of processes and streams
+        the results into output. Runs already in output are skipped, and runs
+        whose results are in the cache in cache_dir (if given) are not redone.
+        With memo_size > 0, every worker remembers that many negotiation
+        outcomes (see memo.py) and the rows get its hits and misses.
+        With engine = 'lockstep', runs (of two agents) are done in batches
+        of lockstep_batch by lockstep.LockstepEngine, with the same results.
+        Run run_id draws its random numbers from run_seed(seed, run_id).
+        Returns the number of runs done now.
+    '''
+    meta = {'design_hash': design_hash(base_data, design, seed), 'n_runs': len(design)}
+
+    done = set()
+    if os.path.isfile(output):
+        reader = ColumnReader(output)
+        if reader.meta.get('design_hash') != meta['design_hash']:
+            raise ValueError(output + ' belongs to a different sweep')
+        if 'run_id' in reader.columns:
+            done = set(reader.read('run_id').tolist())
+
+    todo = [(run_id, overrides) for run_id, overrides in enumerate(design) if run_id not in done]
+
+    if verbose:
+        print(str(len(done)) + ' runs already done, ' + str(len(todo)) + ' to go.')
+
+    if engine == 'lockstep':
+        # Every task is a batch of runs, and returns a list of rows
+        work = [todo[ix:ix + lockstep_batch] for ix in range(0, len(todo), lockstep_batch)]
+        function, chunksize = run_lockstep, 1
+    elif engine == 'objects':
+        work, function = todo, run_one
+    else:
+        raise ValueError('Unknown engine: ' + engine)
+
+    with ColumnWriter(output, meta = meta, chunk_rows = flush_every, append = True) as writer:
+        if workers == 1:
+            init_worker(base_data, cache_dir, memo_size, seed)
+            for result in map(function, work):
+                for row in (result if engine == 'lockstep' else [result]):
+                    writer.append_row(row)
+        else:
+            with multiprocessing.Pool(workers, initializer = init_worker, initargs = (base_data, cache_dir, memo_size, seed)) as pool:
+                for result in pool.imap_unordered(function, work, chunksize = chunksize):
+                    for row in (result if engine == 'lockstep' else [result]):
+                        writer.append_row(row)
+
+    return len(todo)
+
+# ---------- COMMAND LINE ----------
+
+def parse_args():
+    parser = ArgumentParser(description='Run a parameter sweep')
+    parser.add_argument('-i', '--input', default='input_low_good.json', type=str,
+                        help='Base input file (name in IO/inputs, or a path), json or compiled .scenario.')
+    parser.add_argument('-g', '--grid', type=str,
+                        help='json file with the values of every variable (full grid).')
+    parser.add_argument('-r', '--random', type=str,
+                        help='json file with the ranges of every variable (random design).')
+    parser.add_argument('-n', '--runs', default=100, type=int,
+                        help='Number of runs of a random design.')
+    parser.add_argument('-s', '--seed', default=0, type=int,
+                        help='Seed of the sweep (random numbers of every run, and random design).')
+    parser.add_argument('-o', '--output', default='sweep.col', type=str,
+                        help='Results file (resumed if it exists).')
+    parser.add_argument('-w', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: all cores).')
+    parser.add_argument('-c', '--chunksize', default=4, type=int,
+                        help='Runs sent to a worker at a time.')
+    parser.add_argument('--cache', default=None, type=str,
+                        help='Directory of a cache of results, shared between sweeps.')
+    parser.add_argument('--memo', default=0, type=int,
+                        help='Negotiation outcomes remembered by every worker (0: none).')
+    parser.add_argument('-e', '--engine', default='objects', choices=['objects', 'lockstep'],
+                        help='Simulate every run on its own (objects) or many at once (lockstep, two agents).')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    input_file = args.input if os.path.isfile(args.input) else '../IO/inputs/' + args.input
+    base_data = Scenario(input_file) if input_file.endswith('.scenario') else read_json(input_file)
+
+    if args.grid:
+        with open(args.grid) as f:
+            design = grid_design(json.load(f))
+    elif args.random:
+        with open(args.random) as f:
+            design = random_design(json.load(f), args.runs, args.seed)
+    else:
+        print('Please provide a grid (-g) or a random design (-r).')
+        exit(1)
+
+    n_done = run_sweep(base_data, design, args.output, workers = args.workers, chunksize = args.chunksize,
+                       cache_dir = args.cache, memo_size = args.memo,
+                       engine = args.engine, seed = args.seed)
+
+    print(str(n_done) + ' runs processed! Results in ' + args.output)
+
+if __name__ == '__main__':
+    main()
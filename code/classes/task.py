@@ -16,6 +16,13 @@ class Task:
         self.actions = [Action(action['id'], action['skill_id'], action['duration'], 0)
                         for action in json_task['actions']] if json_task != None else []
 
+        # When the task can be started (only used by the event-driven scheduler)
+        self.arrival = json_task.get('arrival', 0) if json_task != None else 0
+
+    def action_rows(self):
+        ''' [id, skill id, duration, completion] of every action '''
+        return [[action._id, action.skill_id, action.duration, action.completion] for action in self.actions]
+
     def __str__(self):
         actions_str = ''
         for action in self.actions:
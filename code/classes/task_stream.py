@@ -0,0 +1,112 @@
+######################################################################
+######################################################################
+# Tasks that are not all loaded at once. A Workplace can take its
+# tasks from any iterable (a generator, a recorded workload...) with
+# Workplace.add_tasks(tasks): it only keeps the current task and a
+# few more (the lookahead) in memory. Input files can also be JSON
+# lines (.jsonl): first the agents and parameters, then one task per
+# line, e.g.
+#   {"parameters": {...}, "agents": [...]}
+#   {"actions": [{"id": 0, "skill_id": 1, "duration": 3}, ...]}
+#   {"actions": [...]}
+# The metrics of every task can be followed while the workplace works
+# (Workplace.iter_tasks, or process_tasks(task_metrics = ...)).
+######################################################################
+######################################################################
+
+import json
+
+from task import Task
+
+LOOKAHEAD = 16  # Tasks read in advance
+
+class TaskStream:
+    ''' Iterator of Tasks, from an iterable of Tasks or of dictionaries as in
+        input files. Dictionaries get consecutive ids from first_id.
+    '''
+    def __init__(self, tasks, first_id = 0):
+        self.tasks = iter(tasks)
+        self.next_id = first_id
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        task = next(self.tasks)
+
+        if not isinstance(task, Task):
+            task = Task(_id = self.next_id, json_task = task)
+        self.next_id = task._id + 1
+
+        return task
+
+class JsonlTasks:
+    ''' Iterator of the tasks (dictionaries) of a JSON lines file. It can be
+        pickled (in checkpoints): it goes on from the same line.
+    '''
+    def __init__(self, path, offset = 0):
+        self.path = path
+        self.offset = offset    # Of the next line to read
+        self.f = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.f is None:
+            self.f = open(self.path, 'rb')
+            self.f.seek(self.offset)
+
+        while True:
+            line = self.f.readline()
+            if not line:
+                self.f.close()
+                raise StopIteration
+
+            self.offset += len(line)
+
+            line = line.strip()
+            if len(line) > 0:
+                obj = json.loads(line)
+                if 'actions' in obj:
+                    return obj
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['f'] = None
+        return state
+
+def read_jsonl_header(path):
+    ''' Contents of a JSON lines input file without its tasks: the objects
+        before the first task, merged ({"parameters": ..., "agents": ...})
+    '''
+    data = {'tasks': []}
+
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            obj = json.loads(line)
+            if 'actions' in obj:
+                break
+            data.update(obj)
+
+    return data
+
+# ---------- METRICS ----------
+
+class TaskMetricsWriter:
+    ''' Writes the metrics of every task (see Workplace.iter_tasks) to a JSON
+        lines file as they come: process_tasks(task_metrics = TaskMetricsWriter(path))
+    '''
+    def __init__(self, path):
+        self.f = open(path, 'w')
+
+    def __call__(self, metrics):
+        self.f.write(json.dumps(metrics) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,377 @@
+######################################################################
+######################################################################
+# Team formation: from a pool of candidate agents (skills and MBTI,
+# as in input files), the team of a given size that does a workload
+# (the tasks and parameters of an input file) with the minimum total
+# performance time, or the minimum final frustration.
+#
+# The search starts from a greedy team (the agents with the highest
+# expertise and motivation in the skills the workload needs) and
+# improves it by swapping one member for one outsider: local search
+# (best swap until none improves) or simulated annealing. Teams are
+# simulated in a pool of processes, every team only once (scores are
+# remembered), and teams whose lower bound of the total performance
+# time is already worse than the best team are not simulated.
+#
+# Example (from code/classes):
+#   python teams.py -p pool.json -w input_low_good.json -k 2
+# where pool.json is {"agents": [...]}. With --mbti, every candidate
+# can also take any MBTI type.
+######################################################################
+######################################################################
+
+import os
+import json
+import math
+import random
+import numpy as np
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+from workplace import Workplace
+from scenario import read_json
+import my_parameters as P
+
+OBJECTIVES = ['sum_perf_time', 'frustration']
+
+# In the order of the MBTI table (see Agent.get_mbti_ix)
+MBTI_TYPES = [a + b + c + d for a in 'EI' for b in 'SN' for c in 'TF' for d in 'JP']
+
+# Neighbours scored per annealing iteration. It does not depend on the
+# number of workers, so that the team found does not either
+ANNEAL_BATCH = 8
+
+# ---------- SCORES ----------
+
+def team_data(workload, agents):
+    ''' Input data of workload (parameters and tasks) with these agents '''
+    data = {'parameters': workload['parameters'], 'agents': agents, 'tasks': workload['tasks']}
+    if 'relationships' in workload:
+        data['relationships'] = workload['relationships']
+    return data
+
+def score(data, objective = 'sum_perf_time', seed = 0):
+    ''' Simulates data. Lower is better. '''
+    wp = Workplace(data = data, seed = seed)
+    wp.process_tasks(output_moods = False)
+
+    if objective == 'sum_perf_time':
+        return wp.get_sum_perf_time()
+    if objective == 'frustration':
+        return float(np.mean([agent.get_frustration() for agent in wp.agents]))
+
+    raise ValueError('Unknown objective: ' + objective)
+
+def lower_bound(workload, agents, objective = 'sum_perf_time'):
+    ''' Total performance time that the team cannot beat: every cycle, the
+        slowest agent takes at least the work of the cycle divided among the
+        team, and coordination takes no time. Every action is done as fast
+        as possible: by the team's best expertise and motivation in its
+        skill, plus what they can have learnt since the start (at most
+        LAM_LEARN and LAM_MOTIV per cycle, up to the maximum). It assumes
+        that expertise and motivation stay positive (skills forgotten for
+        very long can go below 0). None when there is no bound (other
+        objectives, frustration in performance times, initial values above
+        the maximum, unusual parameters).
+    '''
+    params = P.Parameters.from_dict(workload['parameters'], base = P.DEFAULT_PARAMETERS)
+
+    if objective != 'sum_perf_time' or params.ALPHA_F != 0 or \
+       min(params.LAM_LEARN, params.LAM_MOTIV, params.MU_LEARN, params.MU_MOTIV) < 0 or \
+       params.LAM_LEARN > params.MAX_E or params.LAM_MOTIV > params.MAX_M:
+        return None
+
+    # Above the maximum, forgetting makes them grow
+    if any(skill['exp'] > params.MAX_E or skill['mot'] > params.MAX_M
+           for agent in agents for skill in agent['skillset']):
+        return None
+
+    best_e, best_m = {}, {}
+    for agent in agents:
+        for skill in agent['skillset']:
+            best_e[skill['id']] = max(best_e.get(skill['id'], -math.inf), skill['exp'])
+            best_m[skill['id']] = max(best_m.get(skill['id'], -math.inf), skill['mot'])
+
+    bound = 0
+    time = 0
+    for task in workload['tasks']:
+        actions = [(action['skill_id'], action['duration']) for action in task['actions']]
+        if any(skill_id not in best_e for skill_id, _ in actions):
+            return None
+
+        for cycle in range(max([duration for _, duration in actions], default = 0)):
+            work = 0
+            for skill_id, duration in actions:
+                if duration <= cycle:
+                    continue
+
+                exp = min(params.MAX_E, best_e[skill_id] + time * params.LAM_LEARN)
+                mot = min(params.MAX_M, best_m[skill_id] + time * params.LAM_MOTIV)
+                speed = params.ALPHA_E * exp / params.MAX_E + params.ALPHA_M * mot / params.MAX_M
+                if speed <= 0:
+                    return None
+
+                work += params.TASK_UNIT_DURATION / speed
+
+            bound += work / len(agents)
+            time += 1
+
+    return math.floor(bound)
+
+def strength(workload, agent):
+    ''' Expertise plus motivation in the skills of the workload, weighted by
+        how long they are needed
+    '''
+    needed = {}
+    for task in workload['tasks']:
+        for action in task['actions']:
+            needed[action['skill_id']] = needed.get(action['skill_id'], 0) + action['duration']
+
+    skills = {skill['id']: skill for skill in agent['skillset']}
+    return sum(weight * (skills[skill_id]['exp'] + skills[skill_id]['mot'])
+               for skill_id, weight in needed.items() if skill_id in skills)
+
+# Workload of the search, loaded once per worker process
+_workload = None
+
+def init_worker(workload):
+    global _workload
+    _workload = workload
+
+def score_team(args):
+    agents, objective, seed = args
+    return score(team_data(_workload, agents), objective, seed)
+
+# ---------- SEARCH ----------
+
+class TeamOptimizer:
+    def __init__(self, pool, workload, size, objective = 'sum_perf_time', mbti_types = None,
+                 seed = 0, workers = None):
+        ''' pool: candidate agents (dictionaries as in input files). workload:
+            contents of an input file (its agents are not used). size: agents
+            in the team. With mbti_types, every candidate can take any of
+            them. seed: of the simulations (all teams see the same random
+            numbers) and of the search.
+        '''
+        if objective not in OBJECTIVES:
+            raise ValueError('Unknown objective: ' + objective)
+        if size > len(pool):
+            raise ValueError('The team cannot be larger than the pool')
+
+        self.pool = pool
+        self.workload = workload
+        self.size = size
+        self.objective = objective
+        self.seed = seed
+        self.workers = workers
+
+        # Members are (agent in pool, MBTI) pairs
+        if mbti_types is None:
+            self.choices = [(ix, agent.get('mbti')) for ix, agent in enumerate(pool)]
+        else:
+            self.choices = [(ix, mbti) for ix in range(len(pool)) for mbti in mbti_types]
+
+        self.scores = {}        # team -> score
+        self.bounds = {}        # team -> lower bound
+        self.best = None
+        self.best_score = math.inf
+
+        self.evaluations = 0
+        self.hits = 0
+        self.pruned = 0
+
+        self.rng = random.Random(seed)
+
+    def agents(self, team):
+        agents = []
+        for ix, mbti in team:
+            agent = dict(self.pool[ix])
+            if mbti is not None:
+                agent['mbti'] = mbti
+            agents.append(agent)
+        return agents
+
+    def key(self, team):
+        return tuple(sorted(team, key = lambda member: (member[0], member[1] or '')))
+
+    # ---------- EVALUATION ----------
+
+    def evaluate(self, teams, executor = None):
+        ''' Scores of teams (math.inf for the ones pruned by their lower bound) '''
+        keys = [self.key(team) for team in teams]
+
+        to_run = []
+        for key in dict.fromkeys(keys):
+            if key in self.scores:
+                self.hits += 1
+                continue
+
+            if key not in self.bounds:
+                self.bounds[key] = lower_bound(self.workload, self.agents(key), self.objective)
+            if self.bounds[key] is not None and self.bounds[key] >= self.best_score:
+                self.pruned += 1
+                continue
+
+            to_run.append(key)
+
+        jobs = [(self.agents(key), self.objective, self.seed) for key in to_run]
+        results = executor.map(score_team, jobs) if executor is not None else map(score_team, jobs)
+
+        for key, result in zip(to_run, results):
+            self.scores[key] = result
+            self.evaluations += 1
+
+            if result < self.best_score:
+                self.best, self.best_score = key, result
+
+        return [self.scores.get(key, math.inf) for key in keys]
+
+    def neighbours(self, team):
+        ''' Teams with one member replaced by a choice not in the team (an agent
+            can be in the team once, with any MBTI)
+        '''
+        in_team = set(ix for ix, _ in team)
+
+        teams = []
+        for position, (member_ix, _) in enumerate(team):
+            for choice in self.choices:
+                if choice in team or (choice[0] in in_team and choice[0] != member_ix):
+                    continue
+                teams.append(team[:position] + (choice,) + team[position + 1:])
+
+        return teams
+
+    def greedy(self):
+        ''' The size strongest agents, with their own MBTI (or the first type) '''
+        ranking = sorted(range(len(self.pool)), key = lambda ix: -strength(self.workload, self.pool[ix]))
+
+        team = []
+        for ix in ranking[:self.size]:
+            team.append(next(choice for choice in self.choices if choice[0] == ix))
+
+        return self.key(team)
+
+    # ---------- METHODS ----------
+
+    def local_search(self, executor = None, max_rounds = 100):
+        ''' Best swap, until none improves the team '''
+        team = self.greedy()
+        self.evaluate([team], executor)
+
+        for _ in range(max_rounds):
+            current = self.scores.get(team, math.inf)
+            neighbours = self.neighbours(team)
+
+            scores = self.evaluate(neighbours, executor)
+            best_ix = int(np.argmin(scores)) if len(scores) > 0 else None
+
+            if best_ix is None or scores[best_ix] >= current:
+                break
+            team = self.key(neighbours[best_ix])
+
+        return team
+
+    def anneal(self, executor = None, iterations = 200, batch = None, temperature = None, cooling = 0.97):
+        ''' Simulated annealing: every iteration, batch random neighbours are
+            scored (in parallel) and the best of them is accepted if it is
+            better, or with probability exp(-worsening / temperature).
+            batch defaults to ANNEAL_BATCH and temperature to 5% of the score
+            of the greedy team.
+        '''
+        batch = batch if batch is not None else ANNEAL_BATCH
+
+        team = self.greedy()
+        current = self.evaluate([team], executor)[0]
+        temperature = temperature if temperature is not None else 0.05 * abs(current) + 1e-9
+
+        for _ in range(iterations):
+            neighbours = self.neighbours(team)
+            if len(neighbours) == 0:
+                break
+
+            proposals = self.rng.sample(neighbours, min(batch, len(neighbours)))
+            scores = self.evaluate(proposals, executor)
+
+            ix = int(np.argmin(scores))
+            if scores[ix] == math.inf:
+                continue    # All pruned: worse than the best team for sure
+
+            if scores[ix] <= current or self.rng.random() < math.exp(-(scores[ix] - current) / temperature):
+                team, current = self.key(proposals[ix]), scores[ix]
+
+            temperature *= cooling
+
+        return team
+
+    def run(self, method = 'local', **options):
+        ''' Searches with method ('local' or 'anneal'). Returns the best team
+            found: pool indices, MBTI, agents and score, and the number of
+            simulations, remembered scores used and teams pruned.
+        '''
+        if self.workers == 1:
+            self.search(method, None, options)
+        else:
+            with ProcessPoolExecutor(self.workers, initializer = init_worker, initargs = (self.workload,)) as executor:
+                self.search(method, executor, options)
+
+        return {'team': [ix for ix, _ in self.best],
+                'mbti': [mbti for _, mbti in self.best],
+                'agents': self.agents(self.best),
+                'score': self.best_score,
+                'evaluations': self.evaluations,
+                'hits': self.hits,
+                'pruned': self.pruned}
+
+    def search(self, method, executor, options):
+        if executor is None:
+            init_worker(self.workload)
+
+        if method == 'local':
+            self.local_search(executor, **options)
+        elif method == 'anneal':
+            self.anneal(executor, **options)
+        else:
+            raise ValueError('Unknown method: ' + method)
+
+# ---------- COMMAND LINE ----------
+
+def parse_args():
+    parser = ArgumentParser(description='Find the best team for a workload')
+    parser.add_argument('-p', '--pool', required=True, type=str,
+                        help='json file with the candidate agents ({"agents": [...]}).')
+    parser.add_argument('-w', '--workload', default='input_low_good.json', type=str,
+                        help='Input file with the tasks and parameters (name in IO/inputs, or a path).')
+    parser.add_argument('-k', '--size', default=2, type=int,
+                        help='Agents in the team.')
+    parser.add_argument('-o', '--objective', default='sum_perf_time', choices=OBJECTIVES,
+                        help='What to minimise.')
+    parser.add_argument('-m', '--method', default='local', choices=['local', 'anneal'],
+                        help='Local search (best swap) or simulated annealing.')
+    parser.add_argument('--mbti', action='store_true',
+                        help='Also choose the MBTI type of every member.')
+    parser.add_argument('-s', '--seed', default=0, type=int,
+                        help='Seed of the simulations and of the search.')
+    parser.add_argument('-j', '--workers', default=None, type=int,
+                        help='Number of worker processes (default: all cores).')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    pool = read_json(args.pool)['agents']
+    workload_file = args.workload if os.path.isfile(args.workload) else '../IO/inputs/' + args.workload
+    workload = read_json(workload_file)
+
+    optimizer = TeamOptimizer(pool, workload, args.size, objective = args.objective,
+                              mbti_types = MBTI_TYPES if args.mbti else None,
+                              seed = args.seed, workers = args.workers)
+    result = optimizer.run(args.method)
+
+    print('Best team: agents ' + str(result['team']) + ', MBTI ' + str(result['mbti']) + \
+          ', ' + args.objective + ' = ' + str(result['score']))
+    print(str(result['evaluations']) + ' teams simulated, ' + str(result['hits']) + ' scores remembered, ' + \
+          str(result['pruned']) + ' teams pruned.')
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,13 @@
 # This file is only needed to generate the Gantt diagrams that where
 # initially generated to debug the program and have an idea of what
 # agents are doing. It does not form part of the simulator 'stricto
-# sensu'
+# sensu'. The timeline can also be queried: what was an agent doing
+# between two times, which actions were taking place at a time...
 ######################################################################
 ######################################################################
 
-from plotly.offline import download_plotlyjs, init_notebook_mode, plot, iplot
-import plotly.graph_objs as go
+import heapq
+import bisect
 import numpy as np
 
 class Event:
@@ -26,25 +27,116 @@ class Event:
              'Task (Action): ', str(self.task_id), ' (', str(self.action_id), '), ', \
              'Agent: ', str(self.agent_id), ' ]'])
 
+class EventIndex:
+    ''' Events indexed for interval queries. They are kept in classes of
+        duration (class e has the events lasting less than 2^e and at least
+        2^(e-1); class 0, the ones shorter than 1), each ordered by start
+        time. An event of class e can only overlap [t0, t1) if it starts in
+        (t0 - 2^e, t1), so a query looks at a few events more than it
+        returns, however long the longest event is.
+    '''
+    def __init__(self):
+        self.classes = {}   # e -> ([start times], [(start time, order, event)])
+        self.count = 0      # Events added (their order, for events that start at the same time)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, event):
+        start = event.start_time
+        e = int(event.duration).bit_length() if event.duration > 0 else 0
+
+        if e not in self.classes:
+            self.classes[e] = ([], [])
+        starts, entries = self.classes[e]
+
+        # Events usually come in order, so this is almost always an append
+        if len(starts) == 0 or start >= starts[-1]:
+            starts.append(start)
+            entries.append((start, self.count, event))
+        else:
+            ix = bisect.bisect_right(starts, start)
+            starts.insert(ix, start)
+            entries.insert(ix, (start, self.count, event))
+
+        self.count += 1
+
+    def overlapping(self, t0, t1, closed = False):
+        ''' Events that overlap [t0, t1) (or [t0, t1] if closed), ordered by
+            start time (and then by the order in which they were added)
+        '''
+        found = []
+        for e, (starts, entries) in self.classes.items():
+            first = bisect.bisect_right(starts, t0 - 2**e)
+            last = bisect.bisect_right(starts, t1) if closed else bisect.bisect_left(starts, t1)
+            found.append([entry for entry in entries[first:last] if entry[0] + entry[2].duration > t0])
+
+        return [entry[2] for entry in heapq.merge(*found, key = lambda entry: entry[:2])]
+
+    def all(self):
+        ''' All the events, ordered by start time '''
+        return [entry[2] for entry in heapq.merge(*[entries for _, entries in self.classes.values()],
+                                                  key = lambda entry: entry[:2])]
+
 class Timeline:
     def __init__(self):
-        self.events = []             # Array of Events
-        self.end = None
+        self.index = EventIndex()    # All the events
+        self.by_agent = {}           # agent_id -> EventIndex of its events
+        self.end = 0
+
+        self._events = []            # Events ordered by start time (made again when events are added)
+
+    @property
+    def events(self):
+        ''' Array of Events, ordered by start time '''
+        if len(self._events) != len(self.index):
+            self._events = self.index.all()
+        return self._events
 
     def compute_end(self):
-        self.end = max(map(lambda e: e.start_time + e.duration, self.events)) \
-                    if len(self.events) > 0 else 1
+        # The end is kept up to date as events are added (0 without events)
         return self.end
 		
     def __str__(self):
         pass
 
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.events)
+
     def add_event(self, event = None):
         if event != None:
-            self.events.append(event)
-            self.events = sorted(self.events, key = lambda e: e.start_time)
+            # Events with the same start time keep the order in which they came
+            self.index.add(event)
+            if event.agent_id not in self.by_agent:
+                self.by_agent[event.agent_id] = EventIndex()
+            self.by_agent[event.agent_id].add(event)
+
+            self.end = max(self.end, event.start_time + event.duration)
+
+    # ---------- QUERIES ----------
+
+    def events_between(self, t0, t1, agent_id = None):
+        ''' Events (of agent_id, or of all agents) that overlap [t0, t1) '''
+        index = self.index if agent_id is None else self.by_agent.get(agent_id, EventIndex())
+        return index.overlapping(t0, t1)
+
+    def events_at(self, t, agent_id = None):
+        ''' Events (of agent_id, or of all agents) taking place at time t '''
+        index = self.index if agent_id is None else self.by_agent.get(agent_id, EventIndex())
+        return index.overlapping(t, t, closed = True)
+
+    def agent_events(self, agent_id):
+        ''' All the events of an agent, ordered by start time '''
+        return self.by_agent[agent_id].all() if agent_id in self.by_agent else []
 
     def plot_gantt(self):
+        # plotly is only needed (and imported) here
+        import plotly.graph_objs as go
+        from plotly.offline import iplot
+
         # Ensure that end is updated
         self.compute_end()
 
@@ -1,14 +1,20 @@
 import os
+import time
 import numpy as np
-import json
-import matplotlib.pyplot as plt
-from plotly.offline import download_plotlyjs, init_notebook_mode, plot, iplot
-import plotly.graph_objs as go
+
+from collections import deque
 
 from skill import Skill
-from agent import Agent, choose_agent
+from agent import Agent, LazyAgent, ArrayAgent, CountingRng, choose_agent, choose_agents, performance_times
+from multi_agent import choose_agents_n
 from task import Task
+from task_stream import TaskStream, JsonlTasks, read_jsonl_header, LOOKAHEAD
 from timeline import Timeline, Event
+from history import KeyedHistory, history_sum, FULL
+from cache import global_rng_state, same_rng_state
+from relationships import RelationshipMatrix, parse_overrides
+from scenario import Scenario, read_json
+from run_output import RunOutput, write_moods, MEDIA_DIR
 import my_parameters as P
 
 # Useful if you need to print JSON:
@@ -17,480 +23,512 @@ import my_parameters as P
 class Workplace:
     # ---------- INITIALISATION  ----------
 
-    def __init__(self, file=None, verbose=False):
+    def __init__(self, file=None, verbose=False, batch_negotiation=False, params=None, data=None, seed=None,
+                 lazy_skills=False, retention=None, cache=None, negotiation_memo=None, instrumentation=None,
+                 checkpoints=None, output=None, steady_state=None, array_skills=False):
         # Create an empty workplace
         self.agents = []
         self.completed_tasks = []
         self.current_task = None
-        self.tasks_todo = []
+        self.tasks_todo = deque()
         self.time = 0
+
+        # Tasks still to be read (see add_tasks), lookahead at a time
+        self.task_source = None
+        self.lookahead = LOOKAHEAD
+        self.keep_completed_tasks = True
+        self.current_task_metrics = None
         self.timeline = Timeline() # list of TimePoints
         self.coordination_times = {}
         self.Tperf = {}
 
+        # Keep histories in arrays, with this history.Retention policy (None: lists and dicts).
+        # Steady state jumps are kept as runs of values, which only arrays can hold.
+        if retention is None and steady_state is not None:
+            retention = FULL
+        self.retention = retention
+        if retention is not None:
+            self.coordination_times = KeyedHistory(retention)
+            self.Tperf = KeyedHistory(retention)
+
+        # Results of runs already done are taken from this cache.ResultCache
+        self.cache = cache
+
+        # Parameters of this workplace (the ones in the input file are loaded on top)
+        self.params = P.DEFAULT_PARAMETERS if params is None else params
+
         self.verbose = verbose
 
+        # Negotiate all the actions of a cycle at once (see agent.negotiate_batch)
+        self.batch_negotiation = batch_negotiation
+
+        # Random numbers of this workplace (numpy's global state if there is no seed),
+        # counted (see agent.CountingRng). seed can be anything np.random.default_rng
+        # accepts (int, SeedSequence...)
+        self.seed = seed
+        self.rng = CountingRng(None if seed is None else np.random.default_rng(seed))
+
+        self.data = None    # Contents of the input file
+        self.scenario = None    # Compiled input file (see scenario.py), instead of data
+
+        # Compute learning/forgetting only for the skills that are used (see agent.LazyAgent)
+        self.lazy_skills = lazy_skills
+
+        # Keep the skills of every agent in vectors (see agent.ArrayAgent)
+        self.array_skills = array_skills
+        if lazy_skills and array_skills:
+            raise ValueError('Skills are either lazy or arrays, not both')
+
+        # Remember negotiation outcomes in this memo.NegotiationMemo (can be shared by workplaces)
+        self.negotiation_memo = negotiation_memo
+
+        # Time the phases of every cycle and count negotiations (instrumentation.Instrumentation)
+        self.instrumentation = instrumentation
+
+        # Save the state every so often, to resume the run (checkpoint.Checkpoints)
+        self.checkpoints = checkpoints
+
+        # Per-cycle results are appended to this run_output.RunOutput (or path) as the run goes
+        self.output = RunOutput(output) if isinstance(output, str) else output
+
+        # Jump over cycles that repeat themselves (steady_state.SteadyState)
+        self.steady_state = steady_state
+        if steady_state is not None and retention is not None and retention.kind in ['decimate', 'summary']:
+            raise ValueError('Steady states need the last values of histories: use full or ring retention')
+
+        # r_ij of pairs of agents that do not follow the MBTI table ((i, j) -> r_ij)
+        self.relationship_overrides = {}
+        self._relationships = None
+
         if file:
             print("Reading from input file " + file + "...\n")
             self.parse_json(file, verbose)
+        elif data:
+            self.load_data(data, verbose)
 
 
 		
     def parse_json(self, filename, verbose = False):
         ''' reads json file and loads agents, tasks and parameters'''
-        with open(filename) as f:
-            data = json.load(f)
+        if filename.endswith('.jsonl'):
+            # Tasks are read while the workplace works (see task_stream.py)
+            self.load_data(read_jsonl_header(filename), verbose)
+            self.add_tasks(JsonlTasks(filename))
+            return
+
+        if filename.endswith('.scenario'):
+            Scenario(filename).load_into(self, verbose = verbose)
+            return
+
+        self.load_data(read_json(filename), verbose)
+
+    def load_data(self, data, verbose = False):
+        ''' loads agents, tasks and parameters from the contents of a json file'''
+        self.data = data
+
+        self.import_parameters(data['parameters'])
+
         for idx, agent in enumerate(data['agents'], verbose):
             self.add_agent(idx, agent, verbose = verbose)
         for idx, task in enumerate(data['tasks']):
             self.add_task(idx, task)
 
-        self.import_parameters(data['parameters'])
+        self.set_relationships(data.get('relationships'))
 
     def add_agent(self, idx, agent, verbose = False):
         skills = [Skill(_id = skill['id'],
                         exp = skill['exp'],
-                        mot = skill['mot'])
+                        mot = skill['mot'],
+                        retention = self.retention)
                   for skill in agent['skillset']]
 
         mbti = agent['mbti'] if 'mbti' in agent else None
         initial_frustration = agent['initial_frustration'] if 'initial_frustration' in agent else None
 
-        self.agents.append(Agent(_id = idx, mbti = mbti,
-                                 initial_frustration = initial_frustration,
-                                 skillset = skills,
-                                 verbose=verbose))
+        agent_class = LazyAgent if self.lazy_skills else ArrayAgent if self.array_skills else Agent
+
+        self.agents.append(agent_class(_id = idx, mbti = mbti,
+                                       initial_frustration = initial_frustration,
+                                       skillset = skills,
+                                       verbose=verbose,
+                                       params = self.params,
+                                       retention = self.retention))
+
+    def set_relationships(self, overrides):
+        ''' Overrides the r_ij of some pairs of agents: dictionary (i, j) -> r_ij
+            or list of {"agents": [i, j], "r": r_ij} (as in the input file)
+        '''
+        self.relationship_overrides.update(parse_overrides(overrides))
+        self._relationships = None
+
+    @property
+    def relationships(self):
+        ''' RelationshipMatrix of the team, built again if agents or parameters change '''
+        if self._relationships is None or self._relationships.n_agents != len(self.agents) or \
+           self._relationships.params is not self.params:
+            self._relationships = RelationshipMatrix(self.agents, self.params, self.relationship_overrides)
+
+        return self._relationships
 
     def add_task(self, idx, task):
         self.tasks_todo.append(Task(_id = idx, json_task = task))
 
+    def add_tasks(self, tasks, lookahead=LOOKAHEAD, keep_completed=False):
+        ''' Takes the tasks that follow from an iterable (of Tasks or of
+            dictionaries as in the input file), lookahead at a time. Unless
+            keep_completed, completed tasks are not kept in completed_tasks.
+            With checkpoints, tasks must be a JSON lines file (JsonlTasks) or
+            a list, which can be saved and read again (not a generator).
+        '''
+        if self.task_source is not None:
+            raise ValueError('The workplace already has a source of tasks')
+
+        first_id = len(self.completed_tasks) + len(self.tasks_todo)
+        task_source = TaskStream(tasks, first_id = first_id)
+
+        if self.checkpoints is not None:
+            from checkpoint import check_task_source
+            check_task_source(task_source)
+
+        self.task_source = task_source
+        self.lookahead = lookahead
+        self.keep_completed_tasks = keep_completed
+
     def import_parameters(self, params):
         ''' Loads all parameters from dictionary that comes from json file'''
-        if 'task_unit_duration' in params:
-            P.TASK_UNIT_DURATION = params['task_unit_duration']
-        if 'alpha_e' in params:
-            P.ALPHA_E = params['alpha_e']
-        if 'alpha_m' in params:
-            P.ALPHA_M = params['alpha_m']
-        if 'alpha_f' in params:
-            P.ALPHA_F = params['alpha_f']
-        if 'beta' in params:
-            P.BETA = params['beta']
-        if 'lam_learn' in params:
-            P.LAM_LEARN = params['lam_learn']
-        if 'lam_motiv' in params:
-            P.LAM_MOTIV = params['lam_motiv']
-        if 'mu_learn' in params:
-            P.MU_LEARN = params['mu_learn']
-        if 'mu_motiv' in params:
-            P.MU_MOTIV = params['mu_motiv']
-        if 'th_e' in params:
-            P.TH_E = params['th_e']
-        if 'th_m' in params:
-            P.TH_M = params['th_m']
-        if 'max_e' in params:
-            P.MAX_E = params['max_e']
-        if 'max_m' in params:
-            P.MAX_M = params['max_m']
-        if 'max_h' in params:
-            P.MAX_H = params['max_h']
-        if 'excite' in params:
-            P.EXCITE = params['excite']
-        if 'inhibit' in params:
-            P.INHIBIT = params['inhibit']
-
-        # Normalise alphas
-        if P.ALPHA_E + P.ALPHA_F + P.ALPHA_M != 1:
-            factor = 1 / (P.ALPHA_E + P.ALPHA_F + P.ALPHA_M)
-            P.ALPHA_E *= factor
-            P.ALPHA_F *= factor
-            P.ALPHA_M *= factor
+        self.params = P.Parameters.from_dict(params, base = self.params)
+
+        for agent in self.agents:
+            agent.params = self.params
 
     # ---------- TASK PROCESSING ----------
 
-    def process_tasks(self):
-        ''' Just a while loop that processes all the tasks in another function'''
+    def process_tasks(self, output_moods=True, until=None, task_metrics=None):
+        ''' Just a while loop that processes all the tasks in another function.
+            With until, it stops (to be continued later) when time reaches until.
+            task_metrics is called with the metrics of every task (see iter_tasks).
+        '''
+        cache_key = self.cache.key(self) if self.cache is not None and until is None else None
+        cached_metrics = self.cache.load(self, cache_key) if cache_key is not None else None
+
+        if cached_metrics is not None:
+            # The tasks of a cached run are reported as when it was done
+            if task_metrics is not None:
+                for metrics in cached_metrics:
+                    task_metrics(metrics)
+        else:
+            if cache_key is not None and self.seed is None:
+                rng_state = global_rng_state()
+
+            all_metrics = []
+            for metrics in self.iter_tasks(until):
+                if cache_key is not None:
+                    all_metrics.append(dict(metrics))
+                if task_metrics is not None:
+                    task_metrics(metrics)
+
+            # Without seed, only runs that drew no random numbers can be repeated
+            if cache_key is not None and (self.seed is not None or same_rng_state(rng_state, global_rng_state())):
+                self.cache.store(self, cache_key, all_metrics)
+
+        if not output_moods or not self.finished():
+            return
+
+        # Output frustration values, for later plot (media/print_frustration_movie.py)
+        write_moods(self, os.path.join(MEDIA_DIR, 'moods.col'))
+
+    def iter_tasks(self, until=None):
+        ''' Processes the tasks (until time reaches until), yielding the metrics
+            of every task when it is completed: task id, start and end time,
+            cycles, actions, and the performance and coordination time it took
+        '''
+        if self.instrumentation is not None:
+            self.instrumentation.start()
+        if self.checkpoints is not None:
+            self.checkpoints.start(self)
+
         # While there is work to do...
-        while len(self.tasks_todo) > 0:
+        while self.current_task is not None or self.has_tasks():
+            if until is not None and self.time >= until:
+                break
+
             # Tasks are handled one at a time
-            self.current_task = self.tasks_todo.pop(0)
+            if self.current_task is None:
+                self.current_task = self.tasks_todo.popleft()
+                self.current_task_metrics = {'task': self.current_task._id,
+                                             'start_time': self.time,
+                                             'actions': len(self.current_task.actions),
+                                             'performance_time': 0.0,
+                                             'coordination_time': 0.0}
+
+            if self.process_cycle():
+                self.current_task_metrics['performance_time'] += float(self.Tperf[self.time - 1])
+                self.current_task_metrics['coordination_time'] += float(self.coordination_times[self.time - 1])
+
+                if self.output is not None:
+                    self.output.cycle(self)
+
+                if self.checkpoints is not None:
+                    self.checkpoints.after_cycle(self)
+
+                if self.steady_state is not None:
+                    if self.instrumentation is not None:
+                        start = time.perf_counter()
+
+                    segment = self.steady_state.skip(self, until)
+
+                    if self.instrumentation is not None:
+                        self.instrumentation.steady_state(time.perf_counter() - start, segment, self.current_task._id)
+
+                    if segment is not None:
+                        self.current_task_metrics['performance_time'] += segment.performance_time
+                        self.current_task_metrics['coordination_time'] += segment.coordination_time
+
+                        if self.checkpoints is not None:
+                            self.checkpoints.after_cycle(self)
+                continue
 
-            self.process_current_task()
-            
             if self.verbose:
                 print('Processed task:\n' + str(self.current_task) + '\n')
 
-            self.completed_tasks.append(self.current_task)
+            if self.keep_completed_tasks:
+                self.completed_tasks.append(self.current_task)
             self.current_task = None
-        
-        # Output frustration values, for later plot
-        media_path = '../media/' if os.path.isdir('../media') \
-                     else '../../media/'
-        with open(media_path + 'moods.data', 'w') as f:
-            for i in range(len(self.agents[0].frustration)):
-                f.write(str(self.agents[0].frustration[i]) + ', ' + \
-                        str(self.agents[0].frustration[i]) + '\n')
 
-    def process_current_task(self):
-        ''' Processes current tasks one by one. Called by process_tasks() '''
+            metrics = self.current_task_metrics
+            metrics['end_time'] = self.time
+            metrics['cycles'] = self.time - metrics['start_time']
+            self.current_task_metrics = None
 
-        # Repeat action assignment until all actions have been completed
-        while True:
-            # Assign agents to each of the actions
-            actions_to_process = [choose_agent(self, action) for action in self.current_task.actions \
-                                  if action.completion < action.duration]
+            yield metrics
 
-            if len(actions_to_process) == 0:
-                break
+        if self.output is not None:
+            if self.finished():
+                self.output.close()
+            else:
+                self.output.flush()
+
+        if self.instrumentation is not None:
+            if self.finished():
+                self.instrumentation.stop()
+            else:
+                self.instrumentation.pause()
+
+    def has_tasks(self):
+        ''' There are tasks to do (reads the next ones from the task source) '''
+        while self.task_source is not None and len(self.tasks_todo) < self.lookahead:
+            try:
+                self.tasks_todo.append(next(self.task_source))
+            except StopIteration:
+                self.task_source = None
 
-            assignments, allocation_times, skill_ids, action_ids = zip(*actions_to_process)
-            self.coordination_times[self.time] = sum(allocation_times)
+        return len(self.tasks_todo) > 0
+
+    def finished(self):
+        return self.current_task is None and not self.has_tasks()
+
+    def process_current_task(self):
+        ''' Processes current tasks one by one. Called by process_tasks() '''
 
+        # Repeat action assignment until all actions have been completed
+        while self.process_cycle():
+            if self.steady_state is not None:
+                self.steady_state.skip(self)
+
+    def process_cycle(self):
+        ''' One cycle of the current task: assigns agents to its pending actions
+            and updates the workplace. Returns False (doing nothing) if all its
+            actions have been completed.
+        '''
+        instrumentation = self.instrumentation
+
+        if instrumentation is not None:
+            instrumentation.begin_cycle()
+        if self.steady_state is not None:
+            self.steady_state.begin_cycle(self)
+
+        # Assign agents to each of the actions
+        pending_actions = [action for action in self.current_task.actions \
+                           if action.completion < action.duration]
+
+        if len(self.agents) != 2:
+            actions_to_process = choose_agents_n(self, pending_actions)
+        elif self.batch_negotiation:
+            actions_to_process = choose_agents(self, pending_actions)
+        else:
+            actions_to_process = [choose_agent(self, action) for action in pending_actions]
+
+        if len(actions_to_process) == 0:
+            return False
+
+        if instrumentation is not None:
+            instrumentation.lap('allocation')
+            instrumentation.count('actions', len(actions_to_process))
+
+        assignments, allocation_times, skill_ids, action_ids = zip(*actions_to_process)
+        self.coordination_times[self.time] = sum(allocation_times)
+
+        if self.array_skills:
+            t_perfs = performance_times(self.agents, skill_ids, assignments, self.time, self.params)
+        else:
             t_perfs = [agent.calculate_performance_time(skill_ids, assignments, self.time)
-                        for agent in self.agents]
-            self.Tperf[self.time] = max(t_perfs) + self.coordination_times[self.time]
+                       for agent in self.agents]
+        self.Tperf[self.time] = max(t_perfs) + self.coordination_times[self.time]
+
+        if instrumentation is not None:
+            instrumentation.lap('performance')
 
-            # ~ HOUSEKEEPING ~
+        # ~ HOUSEKEEPING ~
+        if instrumentation is None:
             for agent in self.agents:
                 agent.flush_prev_act(assignments, skill_ids)            # Clear internal variables related to previous task
                 agent.update_memory()                                   # Update expertise and motivation
+        else:
+            for agent in self.agents:
+                agent.flush_prev_act(assignments, skill_ids)
+                instrumentation.lap('flush_prev_act')
+                agent.update_memory()
+                instrumentation.lap('update_memory')
+
+        # Update current actions for all agents
+        for i, assignment in enumerate(assignments):
+            self.agents[assignment].current_action.append(
+                {
+                    'task': self.current_task._id,
+                    'action': action_ids[i],
+                    'start_time': self.time
+                }
+            )
 
-            # Update current actions for all agents
-            for i, assignment in enumerate(assignments):
-                self.agents[assignment].current_action.append(
-                    {
-                        'task': self.current_task._id,
-                        'action': action_ids[i],
-                        'start_time': self.time
-                    }
-                )
+            self.timeline.add_event(Event(start_time = self.time, \
+                                            duration = 1,                       # Constant, for now
+                                            task_id = self.current_task._id, \
+                                            action_id = action_ids[i], \
+                                            agent_id = assignment, \
+                                            ))
 
-                self.timeline.add_event(Event(start_time = self.time, \
-                                                duration = 1,                       # Constant, for now
-                                                task_id = self.current_task._id, \
-                                                action_id = action_ids[i], \
-                                                agent_id = assignment, \
-                                                ))
+        # ~ END HOUSEKEEPING ~
 
-            # ~ END HOUSEKEEPING ~
+        if instrumentation is not None:
+            instrumentation.count('events', len(assignments))
+            instrumentation.lap('bookkeeping')
+            instrumentation.end_cycle(self.time, self.current_task._id)
 
-            self.time += 1
+        if self.steady_state is not None:
+            self.steady_state.end_cycle(self, assignments, allocation_times, skill_ids, action_ids)
 
-    # ---------- GETTERS ----------
+        self.time += 1
 
-    def get_sum_perf_time(self):
-        return int(np.round(sum(self.Tperf.values())))
+        return True
 
-    # ---------- PRINTING ----------
+    # ---------- CHECKPOINTS ----------
+    # See checkpoint.py
 
-    def plot_skills(self, agent):
-        ''' Plots the expertise of two agents as a function of number of cycles'''
-        y1 = np.round(np.array(agent.skillset[0].expertise))
-        y2 = np.round(np.array(agent.skillset[1].expertise))
-        x = np.round(np.array(list(range(len(y1)))))
-
-        y1 = [y if y > 0 else 0 for y in y1]
-        y2 = [y if y > 0 else 0 for y in y2]
-
-        trace1 = go.Scatter(
-            x = x,
-            y = y1,
-            mode = 'lines+markers',
-            name = 'Skill 1'
-        )
-
-        trace2 = go.Scatter(
-            x = x,
-            y = y2,
-            mode = 'lines+markers',
-            name = 'Skill 2'
-        )
-
-        layout = go.Layout(
-            title='Expertise',
-            xaxis=dict(
-                title='Cycles',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            yaxis=dict(
-                title='Expertise',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            )
-        )
-
-        data = [trace1, trace2]
-
-        fig = go.Figure(data=data, layout=layout)
-
-        iplot(fig)
-
-    def plot_skills_matplotlib(self, agent):
-        ''' Plots the expertise of two agents as a function of number of cycles'''
-        y1 = np.round(np.array(agent.skillset[0].expertise))
-        y2 = np.round(np.array(agent.skillset[1].expertise))
-        x = np.round(np.array(list(range(len(y1)))))
-
-        y1 = [y if y > 0 else 0 for y in y1]
-        y2 = [y if y > 0 else 0 for y in y2]
-
-        fig = plt.figure()
-
-        plt.plot(x, y1, '.-', x, y2, '.-')
-        plt.xlabel('Cycles')
-        plt.ylabel('Expertise')
-        plt.title('Evolution of expertise: Agent ' + str(agent._id))
-        plt.legend(['Skill 1', 'Skill 2'])
-        plt.draw()
-
-        return fig
-
-    def plot_motivation(self, agent):
-        ''' Plots the motivation of two agents as a function of #cycles'''
-        y1 = np.round(np.array(agent.skillset[0].motivation))
-        y2 = np.round(np.array(agent.skillset[1].motivation))
-        x = np.round(np.array(list(range(len(y1)))))
-
-        y1 = [y if y > 0 else 0 for y in y1]
-        y2 = [y if y > 0 else 0 for y in y2]
-
-        trace1 = go.Scatter(
-            x = x,
-            y = y1,
-            mode = 'lines+markers',
-            name = 'Skill 1'
-        )
-
-        trace2 = go.Scatter(
-            x = x,
-            y = y2,
-            mode = 'lines+markers',
-            name = 'Skill 2'
-        )
-
-        layout = go.Layout(
-            title='Motivation',
-            xaxis=dict(
-                title='Cycles',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            yaxis=dict(
-                title='Motivation',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            )
-        )
+    def __getstate__(self):
+        ''' Instrumentation (open files, profilers) is not saved in checkpoints '''
+        state = self.__dict__.copy()
+        state['instrumentation'] = None
+        return state
 
-        data = [trace1, trace2]
+    def save_checkpoint(self, path):
+        ''' Saves the whole state of this workplace, to continue it later (see checkpoint.load) '''
+        from checkpoint import save
+        save(self, path)
 
-        fig = go.Figure(data=data, layout=layout)
+    def fork(self, seed=None):
+        ''' Independent copy of this workplace, to continue it in another way.
+            With seed, the copy draws its own random numbers.
+        '''
+        from checkpoint import fork
+        return fork(self, seed)
 
-        iplot(fig)
+    def process_tasks_concurrent(self, max_open_tasks=None):
+        ''' Processes the tasks in event-driven mode: up to max_open_tasks at a
+            time, in real time (see scheduler.py). Returns throughput, latency
+            and utilisation of the agents.
+        '''
+        from scheduler import EventScheduler
 
-    def plot_frustration(self):
-        ''' Plots frustration of two agents as a function of #cycles'''
-        y0 = np.array(self.agents[0].frustration)
-        y1 = np.array(self.agents[1].frustration)
-        x = np.array(list(range(len(y1))))
-
-        trace1 = go.Scatter(
-            x = x,
-            y = y0,
-            mode = 'lines+markers',
-            name = 'Agent 1'
-        )
-
-        trace2 = go.Scatter(
-            x = x,
-            y = y1,
-            mode = 'lines+markers',
-            name = 'Agent 2'
-        )
-
-        layout = go.Layout(
-            title='Frustration',
-            xaxis=dict(
-                title='Cycles',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            yaxis=dict(
-                title='Frustration',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            showlegend=True
-        )
-
-        data = [trace1, trace2]
-
-        fig = go.Figure(data=data, layout=layout)
-
-        iplot(fig)
-    
-    def plot_frustration_matplotlib(self):
-        ''' Plots frustration of two agents as a function of #cycles'''
-        y0 = np.array(self.agents[0].frustration)
-        y1 = np.array(self.agents[1].frustration)
-        x = np.array(list(range(len(y1))))
+        return EventScheduler(self, max_open_tasks).run()
 
-        fig = plt.figure()
+    def run_ensemble(self, replicates, seed=None, workers=None, confidence=0.95,
+                     target_width=None, batch_size=None):
+        ''' Runs replicates of this workplace's input with independent random
+            streams (see ensemble.run_ensemble). This workplace is not modified.
+        '''
+        from ensemble import run_ensemble
 
-        plt.plot(x, y0, '.-', x, y1, '.-')
-        plt.xlabel('Cycles')
-        plt.ylabel('Frustration')
-        plt.title('Frustration')
-        plt.legend(['Agent 1', 'Agent 2'])
-        plt.draw()
+        data = self.data if self.data is not None else self.scenario.to_data()
 
-        return fig
+        return run_ensemble(data, replicates, seed = seed, workers = workers,
+                            confidence = confidence, target_width = target_width,
+                            batch_size = batch_size, batch_negotiation = self.batch_negotiation)
 
-    def plot_allocations(self):
-        ''' Plots allocation time it took for every cycle'''
-        y0 = np.array(self.agents[0].allocation_times)
-        y1 = np.array(self.agents[1].allocation_times)
-        x = np.array(list(range(len(y1))))
-
-        # y1 = [y if y > 0 else 0 for y in y1]
-        # y2 = [y if y > 0 else 0 for y in y2]
-
-        trace1 = go.Scatter(
-            x = x,
-            y = y0,
-            mode = 'lines+markers',
-            name = 'Agent 1'
-        )
-
-        trace2 = go.Scatter(
-            x = x,
-            y = y1,
-            mode = 'lines+markers',
-            name = 'Agent 2'
-        )
-
-        layout = go.Layout(
-            title='Allocations',
-            xaxis=dict(
-                title='Cycles',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            yaxis=dict(
-                title='Allocation time',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            )
-        )
+    # ---------- GETTERS ----------
+
+    def get_sum_perf_time(self):
+        return int(np.round(history_sum(self.Tperf)))
 
-        data = [trace1, trace2]
+    # ---------- PRINTING ----------
+    # Plots are in plotting.py, which only imports plotly/matplotlib when used
 
-        fig = go.Figure(data=data, layout=layout)
+    def plot_skills(self, agent, skill_ids = (0, 1)):
+        ''' Plots the expertise of an agent (skills in skill_ids) as a function of number of cycles'''
+        from plotting import plot_skills
+        return plot_skills(self, agent, skill_ids)
 
-        iplot(fig)
+    def plot_skills_matplotlib(self, agent, skill_ids = (0, 1)):
+        ''' Plots the expertise of an agent (skills in skill_ids) as a function of number of cycles'''
+        from plotting import plot_skills_matplotlib
+        return plot_skills_matplotlib(self, agent, skill_ids)
 
-    def plot_performance(self):
-        ''' Plots performance times of the agents and of the whole system'''
-        y = []
-        y.append(np.round(np.array(list(self.Tperf.values()))))
-        y.append(np.round(np.array(list(self.coordination_times.values()))))
-        y.append(np.round(np.array(list(self.agents[0].performance_times.values()))))
-        y.append(np.round(np.array(list(self.agents[1].performance_times.values()))))
-
-        for _y in y:
-            _y = [y if y > 0 else 0 for y in _y]
-
-        x = np.array(list(range(len(y[0]))))
-
-        names = [
-            'System',
-            'Coordination Time',
-            'Agent 1',
-            'Agent 2'
-        ]
-
-        data = [
-                go.Scatter(
-                    x = x,
-                    y = _y,
-                    mode = 'lines+markers',
-                    name = names[i]
-                ) for i, _y in enumerate(y)
-               ]
-
-        layout = go.Layout(
-            title='Performance',
-            xaxis=dict(
-                title='Cycles',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            ),
-            yaxis=dict(
-                title='Performance Time',
-                titlefont=dict(
-                    family='Arial, sans-serif',
-                    size=24,
-                    color='black'
-                )
-            )
-        )
+    def plot_motivation(self, agent, skill_ids = (0, 1)):
+        ''' Plots the motivation of an agent (skills in skill_ids) as a function of #cycles'''
+        from plotting import plot_motivation
+        return plot_motivation(self, agent, skill_ids)
 
-        fig = go.Figure(data=data, layout=layout)
-        iplot(fig)
+    def plot_frustration(self):
+        ''' Plots frustration of every agent as a function of #cycles'''
+        from plotting import plot_frustration
+        return plot_frustration(self)
 
-    def plot_performance_matplotlib(self):
-        ''' Plots performance times of the agents and of the whole system'''
+    def plot_frustration_matplotlib(self):
+        ''' Plots frustration of every agent as a function of #cycles'''
+        from plotting import plot_frustration_matplotlib
+        return plot_frustration_matplotlib(self)
+
+    def plot_allocations(self):
+        ''' Plots allocation time it took for every cycle'''
+        from plotting import plot_allocations
+        return plot_allocations(self)
+
+    def get_performance_series(self):
+        ''' Performance times of the whole system, coordination and every
+            agent, with their names (used by the performance plots)
+        '''
         y = []
         y.append(np.round(np.array(list(self.Tperf.values()))))
         y.append(np.round(np.array(list(self.coordination_times.values()))))
-        y.append(np.round(np.array(list(self.agents[0].performance_times.values()))))
-        y.append(np.round(np.array(list(self.agents[1].performance_times.values()))))
-
-        for _y in y:
-            _y = [y if y > 0 else 0 for y in _y]
+        for agent in self.agents:
+            y.append(np.round(np.array(list(agent.performance_times.values()))))
 
-        x = np.array(list(range(len(y[0]))))
+        names = ['System', 'Coordination Time'] + ['Agent ' + str(agent._id + 1) for agent in self.agents]
 
-        fig = plt.figure()
+        return y, names
 
-        plt.plot(x, y[0], '.-', x, y[1], '.-', x, y[2], '.-', x, y[3], '.-')
-        plt.xlabel('Cycles')
-        plt.ylabel('Time')
-        plt.title('Performance')
-        plt.legend(['System', 'Coordination Time', 'Agent 1', 'Agent 2'])
-        plt.draw()
+    def plot_performance(self):
+        ''' Plots performance times of the agents and of the whole system'''
+        from plotting import plot_performance
+        return plot_performance(self)
 
-        return fig        
+    def plot_performance_matplotlib(self):
+        ''' Plots performance times of the agents and of the whole system'''
+        from plotting import plot_performance_matplotlib
+        return plot_performance_matplotlib(self)
 
     def print_parameters(self):
+        P = self.params
+
         print('task_unit_duration: ' + str(P.TASK_UNIT_DURATION))
         print('alpha_e: ' + str(P.ALPHA_E))
         print('alpha_m: ' + str(P.ALPHA_M))
@@ -511,6 +549,7 @@ class Workplace:
         print('\n')
 
         print('Maximum number of steps in coordination:' + str(P.MAX_COORD_STEPS))
+        print('Agents taking part in each negotiation (teams of more than two):' + str(P.N_CANDIDATES))
 
         print('\n')
 
@@ -5,17 +5,20 @@ import matplotlib.pyplot as plt
 from matplotlib import animation
 import numpy as np
 import os
+import sys
 
 
 ##################################################
 #                 AUX. PARAMS                    #
 ##################################################
 __BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-moods_file = os.path.join(__BASE_DIR, 'moods.data')
+moods_file = os.path.join(__BASE_DIR, 'moods.col')	# Written by Workplace.process_tasks()
 mood_data = []
 
-#NAGENTS = 4
-NAGENTS = 2
+sys.path.insert(0, os.path.join(__BASE_DIR, '..', 'code', 'classes'))
+from columnar import ColumnReader
+
+NAGENTS = 2 # Taken from the file
 ymin, ymax = 0, 0 # initial values used to plot
 
 
@@ -23,11 +26,10 @@ ymin, ymax = 0, 0 # initial values used to plot
 #               AUX. FUNCTIONS                   #
 ##################################################
 def read_moods():
-	''' Reads moods from file '''
-	with open(moods_file) as fr:
-		for line in fr:
-			mood_data.append(np.fromstring( line, dtype=np.float, 
-											sep=',' ))
+	''' Reads moods from file: one row per interaction, one column per agent '''
+	global mood_data, NAGENTS
+	mood_data = ColumnReader(moods_file).read('frustration')
+	NAGENTS = mood_data.shape[1]
 			
 def animate(i):
 	'''
@@ -49,7 +51,7 @@ if __name__ == "__main__":
 
 	# STEP 2: prepare the plot
 	fig = plt.figure()
-	plt.ylim([np.min(mood_data),np.max(mood_data)])
+	plt.ylim([np.nanmin(mood_data),np.nanmax(mood_data)])
 	x_coord=range(1,NAGENTS+1)
 	barcollection = plt.bar(x_coord,mood_data[0])
 